@@ -1,12 +1,15 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from functools import wraps
+import secrets
 from models import User, AdminPanel, db
 from datetime import datetime, timedelta
 from forms import AdminUserForm, AdminSettingsForm
-from extensions import mail
-from flask_mail import Message
-from collections import OrderedDict
+from settings_cache import admin_settings_cache
+from identity_cache import user_identity_cache
+from mail_outbox import mail_outbox
+from pagination import decode_cursor, encode_cursor
+from sqlalchemy import and_, func, or_
 
 admin = Blueprint("admin", __name__)
 
@@ -24,40 +27,116 @@ def admin_required(f):
     return decorated_function
 
 
+USER_PAGE_SIZE = 50
+MAX_USER_PAGE_SIZE = 200
+NEVER = datetime(1970, 1, 1)
+# sort name -> (column, newest/largest first)
+USER_SORTS = {
+    "username": (User.username, False),
+    "created": (User.created_at, True),
+    "last_login": (func.coalesce(User.last_login, NEVER), True),
+}
+USER_FILTERS = {
+    "active": User.is_active.is_(True),
+    "inactive": User.is_active.is_(False),
+    "admin": User.is_admin.is_(True),
+}
+
+
+def user_page(search="", status="all", sort="username", cursor=None, limit=None):
+    """One page of users, filtered and sorted in SQL.
+
+    Pages are keyset-paginated on (sort column, id), so each page costs the
+    same however many users there are. Returns ``(users, next_cursor)``.
+    """
+    column, descending = USER_SORTS.get(sort, USER_SORTS["username"])
+    limit = max(1, min(limit or USER_PAGE_SIZE, MAX_USER_PAGE_SIZE))
+    query = User.query
+    if search:
+        query = query.filter(
+            or_(
+                User.username.icontains(search, autoescape=True),
+                User.email.icontains(search, autoescape=True),
+            )
+        )
+    if status in USER_FILTERS:
+        query = query.filter(USER_FILTERS[status])
+    if cursor:
+        last_id, last_value = decode_cursor(cursor)
+        if sort in ("created", "last_login"):
+            try:
+                last_value = datetime.fromisoformat(last_value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid cursor: {e}") from e
+        if descending:
+            after = or_(
+                column < last_value, and_(column == last_value, User.id < last_id)
+            )
+        else:
+            after = or_(
+                column > last_value, and_(column == last_value, User.id > last_id)
+            )
+        query = query.filter(after)
+    if descending:
+        query = query.order_by(column.desc(), User.id.desc())
+    else:
+        query = query.order_by(column.asc(), User.id.asc())
+    rows = query.limit(limit + 1).all()
+
+    users = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and users:
+        last = users[-1]
+        if sort == "created":
+            value = last.created_at.isoformat()
+        elif sort == "last_login":
+            value = (last.last_login or NEVER).isoformat()
+        else:
+            value = last.username
+        next_cursor = encode_cursor(last.id, value)
+    return users, next_cursor
+
+
+def user_growth(days=30):
+    """Sign-ups per day over the last ``days`` days, counted in SQL."""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=days - 1)
+    day = func.date(User.created_at)
+    rows = (
+        db.session.query(day, func.count(User.id))
+        .filter(User.created_at >= start)
+        .group_by(day)
+        .all()
+    )
+    counts = {str(date): count for date, count in rows}
+    labels = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    return {"labels": labels, "counts": [counts.get(label, 0) for label in labels]}
+
+
 @admin.route("/")
 @login_required
 @admin_required
 def admin_panel():
-    users = User.query.all()
     admin_settings = AdminPanel.query.first()
     if not admin_settings:
         admin_settings = AdminPanel()
         db.session.add(admin_settings)
         db.session.commit()
+        admin_settings_cache.invalidate()
 
-    # User growth data for the last 30 days
-    days = 30
-    date_labels = [
-        (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
-        for i in reversed(range(days))
-    ]
-    user_growth = OrderedDict((date, 0) for date in date_labels)
-    for user in users:
-        if user.created_at:
-            date_str = user.created_at.strftime("%Y-%m-%d")
-            if date_str in user_growth:
-                user_growth[date_str] += 1
-    user_growth_data = {
-        "labels": list(user_growth.keys()),
-        "counts": list(user_growth.values()),
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    user_stats = {
+        "total": User.query.count(),
+        "active": User.query.filter(User.is_active.is_(True)).count(),
+        "new_today": User.query.filter(User.created_at >= today).count(),
     }
 
     return render_template(
         "admin/panel.html",
-        users=users,
+        user_stats=user_stats,
         settings=admin_settings,
         now=datetime.utcnow,
-        user_growth_data=user_growth_data,
+        user_growth_data=user_growth(),
     )
 
 
@@ -65,8 +144,30 @@ def admin_panel():
 @login_required
 @admin_required
 def manage_users():
-    users = User.query.all()
-    return render_template("admin/users.html", users=users)
+    search = request.args.get("q", "").strip()
+    status = request.args.get("status", "all")
+    sort = request.args.get("sort", "username")
+    try:
+        users, next_cursor = user_page(
+            search,
+            status,
+            sort,
+            request.args.get("cursor"),
+            request.args.get("limit", type=int),
+        )
+    except ValueError:
+        flash("That page link is no longer valid, showing the first page.", "error")
+        users, next_cursor = user_page(search, status, sort)
+    return render_template(
+        "admin/users.html",
+        users=users,
+        next_cursor=next_cursor,
+        search=search,
+        status=status,
+        sort=sort,
+        limit=request.args.get("limit", type=int),
+        paged=bool(request.args.get("cursor")),
+    )
 
 
 @admin.route("/user/<int:user_id>", methods=["GET", "POST"])
@@ -86,6 +187,7 @@ def edit_user(user_id):
             user.set_password(form.password.data)
 
         db.session.commit()
+        user_identity_cache.invalidate(user.id)
         flash("User updated successfully.", "success")
         return redirect(url_for("admin.manage_users"))
 
@@ -108,6 +210,7 @@ def delete_user(user_id):
         return redirect(url_for("admin.manage_users"))
     db.session.delete(user)
     db.session.commit()
+    user_identity_cache.invalidate(user_id)
     message = "User deleted successfully."
     if request.is_json or request.headers.get("X-Requested-With") == "XMLHttpRequest":
         return jsonify({"success": True, "message": message})
@@ -124,6 +227,7 @@ def admin_settings():
         settings = AdminPanel()
         db.session.add(settings)
         db.session.commit()
+        admin_settings_cache.invalidate()
 
     form = AdminSettingsForm(obj=settings)
 
@@ -136,6 +240,7 @@ def admin_settings():
         settings.updated_at = datetime.utcnow()
 
         db.session.commit()
+        admin_settings_cache.invalidate()
         flash("Settings updated successfully.", "success")
         return redirect(url_for("admin.admin_settings"))
 
@@ -159,6 +264,7 @@ def reset_admin_settings():
     settings.password_reset_timeout = 3600
     settings.updated_at = datetime.utcnow()
     db.session.commit()
+    admin_settings_cache.invalidate()
     flash("Settings reset to defaults.", "success")
     return redirect(url_for("admin.admin_settings"))
 
@@ -168,17 +274,27 @@ def reset_admin_settings():
 @admin_required
 def reset_user_password(user_id):
     user = User.query.get_or_404(user_id)
-    new_password = User.generate_random_password()
-    user.set_password(new_password)
-    db.session.commit()
-    msg = Message(
+    # The old password stops working; the user picks a new one via the link,
+    # so no password ever goes into the mail outbox
+    user.set_password(User.generate_random_password())
+    settings = admin_settings_cache.get()
+    timeout = (settings and settings.password_reset_timeout) or 3600
+    token = secrets.token_urlsafe(32)
+    user.reset_token = token
+    user.reset_token_expiry = datetime.utcnow() + timedelta(seconds=timeout)
+    reset_url = url_for("auth.reset_password", token=token, _external=True)
+    # Committed together with the token; sent in the background
+    mail_outbox.enqueue(
         "Your Password Has Been Reset",
-        sender="noreply@raggie.com",
-        recipients=[user.email],
+        [user.email],
+        f"""Your password has been reset by an administrator.
+To choose a new password, visit the following link:
+{reset_url}
+
+The link expires in {timeout // 60} minutes.
+""",
     )
-    msg.body = f"""Your password has been reset by an administrator.\nYour new password is: {new_password}\n\nPlease change your password after logging in.\n"""
-    mail.send(msg)
-    message = "Password reset email sent to user."
+    message = "Password reset email queued for the user."
     if request.is_json or request.headers.get("X-Requested-With") == "XMLHttpRequest":
         return jsonify({"success": True, "message": message})
     flash(message, "success")
@@ -201,6 +317,7 @@ def toggle_user_status(user_id):
         return redirect(url_for("admin.manage_users"))
     user.is_active = not user.is_active
     db.session.commit()
+    user_identity_cache.invalidate(user.id)
     status = "activated" if user.is_active else "deactivated"
     message = f"User {status} successfully."
     if request.is_json or request.headers.get("X-Requested-With") == "XMLHttpRequest":
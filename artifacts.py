@@ -0,0 +1,315 @@
+"""Content-addressed storage for large block outputs.
+
+Embedding matrices are stored as ``.npy`` files and opened memory-mapped;
+document lists are stored as JSONL next to an offsets index so any slice
+can be read without loading the whole file. Blocks pass around small
+handles instead of the data itself. Storing or reading an artifact again
+refreshes its files' mtime, and ``prune`` drops artifacts nobody used for
+a while.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    Document = None
+
+
+def to_jsonable(value):
+    """Convert a block result into something jsonify can handle."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if _is_document(value):
+        return {
+            "page_content": value.page_content,
+            "metadata": to_jsonable(dict(value.metadata)),
+        }
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_jsonable(v) for v in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return repr(value)
+
+
+def is_handle(value):
+    """Check whether a value is an artifact handle."""
+    return isinstance(value, dict) and "artifact_id" in value and "kind" in value
+
+
+def _is_document(value):
+    return hasattr(value, "page_content") and hasattr(value, "metadata")
+
+
+def is_matrix(value):
+    """Lists of equally sized float vectors are treated as embeddings."""
+    if not isinstance(value, list) or not value:
+        return False
+    first = value[0]
+    if not isinstance(first, (list, tuple)) or not first:
+        return False
+    return all(isinstance(x, float) for x in first) and all(
+        isinstance(row, (list, tuple)) and len(row) == len(first) for row in value
+    )
+
+
+# Metadata first; ".idx.npy" before ".npy" so suffix matching is unambiguous
+_SUFFIXES = (".json", ".idx.npy", ".npy", ".jsonl")
+
+# JSON outputs larger than this are stored as artifacts, not inline
+DEFAULT_INLINE_MAX_BYTES = 64 * 1024
+
+
+class ArtifactStore:
+    """Write-once store of block outputs keyed by their SHA-256."""
+
+    def __init__(self, root, inline_max_bytes=DEFAULT_INLINE_MAX_BYTES):
+        self.root = root
+        self.inline_max_bytes = inline_max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, artifact_id, suffix):
+        return os.path.join(self.root, artifact_id[:2], artifact_id + suffix)
+
+    def _commit(self, tmp_path, artifact_id, suffix):
+        """Move a finished temp file into place unless it already exists."""
+        final_path = self._path(artifact_id, suffix)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            # Stored again, so keep it from being pruned
+            os.utime(final_path)
+        else:
+            os.replace(tmp_path, final_path)
+        return final_path
+
+    def _tmp(self):
+        fd, path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        return path
+
+    def _write_meta(self, meta):
+        path = self._path(meta["artifact_id"], ".json")
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            tmp = self._tmp()
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._commit(tmp, meta["artifact_id"], ".json")
+        return meta
+
+    def put_array(self, array):
+        """Store a NumPy array and return its handle."""
+        array = np.ascontiguousarray(array)
+        digest = hashlib.sha256()
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.data)
+        artifact_id = digest.hexdigest()
+
+        if os.path.exists(self._path(artifact_id, ".npy")):
+            # Stored again, so keep it from being pruned
+            self._touch(artifact_id)
+        else:
+            tmp = self._tmp()
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            self._commit(tmp, artifact_id, ".npy")
+
+        return self._write_meta(
+            {
+                "artifact_id": artifact_id,
+                "kind": "ndarray",
+                "count": int(array.shape[0]) if array.ndim else 1,
+                "shape": list(array.shape),
+                "dtype": array.dtype.name,
+                "nbytes": int(array.nbytes),
+                "created_at": time.time(),
+            }
+        )
+
+    def put_documents(self, documents):
+        """Store documents as JSONL with a byte-offset index."""
+        return self._put_lines(documents, "documents")
+
+    def _put_lines(self, items, kind):
+        """Store items as JSONL with a byte-offset index."""
+        digest = hashlib.sha256()
+        if kind != "documents":
+            # Same lines, different kind: keep their metadata apart
+            digest.update(f"{kind}\n".encode())
+        offsets = [0]
+        tmp = self._tmp()
+        with open(tmp, "wb") as f:
+            for doc in items:
+                line = (
+                    json.dumps(to_jsonable(doc), ensure_ascii=False, sort_keys=True)
+                    + "\n"
+                ).encode("utf-8")
+                digest.update(line)
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        artifact_id = digest.hexdigest()
+        self._commit(tmp, artifact_id, ".jsonl")
+
+        if os.path.exists(self._path(artifact_id, ".idx.npy")):
+            self._touch(artifact_id)
+        else:
+            tmp = self._tmp()
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(offsets, dtype=np.int64))
+            self._commit(tmp, artifact_id, ".idx.npy")
+
+        return self._write_meta(
+            {
+                "artifact_id": artifact_id,
+                "kind": kind,
+                "count": len(offsets) - 1,
+                "nbytes": offsets[-1],
+                "created_at": time.time(),
+            }
+        )
+
+    def externalize(self, value):
+        """Store large values and return a handle; small ones pass through."""
+        if isinstance(value, np.ndarray):
+            return self.put_array(value)
+        if isinstance(value, list) and value and all(map(_is_document, value)):
+            return self.put_documents(value)
+        if is_matrix(value):
+            return self.put_array(np.asarray(value, dtype=np.float32))
+        value = to_jsonable(value)
+        if (
+            self.inline_max_bytes
+            and not isinstance(value, (int, float, bool, type(None)))
+            and len(json.dumps(value).encode("utf-8")) > self.inline_max_bytes
+        ):
+            # Kept out of the stored canvas, which is rewritten on every change
+            if isinstance(value, list):
+                return self._put_lines(value, "list")
+            return self._put_lines([value], "value")
+        return value
+
+    def exists(self, artifact_id):
+        """Whether an artifact is still stored (not pruned)."""
+        return os.path.exists(self._path(artifact_id, ".json"))
+
+    def meta(self, artifact_id):
+        """Return the metadata stored for an artifact."""
+        with open(self._path(artifact_id, ".json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def open_array(self, artifact_id):
+        """Open a stored array memory-mapped and read-only."""
+        return np.load(self._path(artifact_id, ".npy"), mmap_mode="r")
+
+    def read_documents(self, artifact_id, start=0, stop=None):
+        """Read a slice of stored documents as dicts."""
+        offsets = np.load(self._path(artifact_id, ".idx.npy"), mmap_mode="r")
+        count = len(offsets) - 1
+        start = max(0, min(start, count))
+        stop = count if stop is None else max(start, min(stop, count))
+        if start == stop:
+            return []
+
+        with open(self._path(artifact_id, ".jsonl"), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                raw = mm[int(offsets[start]) : int(offsets[stop])]
+        return [json.loads(line) for line in raw.splitlines()]
+
+    def read_slice(self, artifact_id, start=0, stop=None):
+        """Read part of any artifact without loading the rest of it."""
+        meta = self.meta(artifact_id)
+        if meta["kind"] == "ndarray":
+            return self.open_array(artifact_id)[start:stop]
+        return self.read_documents(artifact_id, start, stop)
+
+    def materialize(self, value):
+        """Turn a handle back into the object a downstream block expects."""
+        if not is_handle(value):
+            return value
+        self._touch(value["artifact_id"])
+        if value["kind"] == "ndarray":
+            return self.open_array(value["artifact_id"])
+        docs = self.read_documents(value["artifact_id"])
+        if value["kind"] == "list":
+            return docs
+        if value["kind"] == "value":
+            return docs[0]
+        if Document is None:
+            return docs
+        return [Document(**doc) for doc in docs]
+
+    def _touch(self, artifact_id):
+        for suffix in _SUFFIXES:
+            try:
+                os.utime(self._path(artifact_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            # Another worker pruned it first
+            return 0
+
+    def prune(self, older_than):
+        """Delete artifacts not stored or read for ``older_than`` seconds.
+
+        An artifact's age is that of its ``.json`` metadata, and all of its
+        files are removed together, so a handle never outlives its data.
+        """
+        cutoff = time.time() - older_than
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                suffix = next((s for s in _SUFFIXES if name.endswith(s)), "")
+                artifact_id = name[: len(name) - len(suffix)]
+                if suffix != ".json" and os.path.exists(
+                    os.path.join(dirpath, artifact_id + ".json")
+                ):
+                    # Pruned together with its metadata below
+                    continue
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                if suffix == ".json":
+                    # Metadata last: while it exists the data is still claimed
+                    for data_suffix in _SUFFIXES[1:]:
+                        removed += self._remove(self._path(artifact_id, data_suffix))
+                # Files without metadata (e.g. left by a crashed write) age alone
+                removed += self._remove(path)
+        return removed
+
+
+def start_pruner(store, max_age, interval):
+    """Prune artifacts unused for ``max_age`` seconds every ``interval`` seconds."""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                removed = store.prune(max_age)
+                if removed:
+                    print(f"Pruned {removed} artifact files")
+            except Exception as e:
+                print(f"Artifact pruning failed: {e}")
+
+    thread = threading.Thread(target=loop, name="artifact-pruner", daemon=True)
+    thread.start()
+    return thread
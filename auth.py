@@ -10,8 +10,8 @@ from forms import (
     ResetPasswordRequestForm,
     ResetPasswordForm,
 )
-from flask_mail import Message
-from extensions import mail
+from mail_outbox import mail_outbox
+from login_throttle import login_throttle
 
 auth = Blueprint("auth", __name__)
 
@@ -22,10 +22,27 @@ def login():
         return redirect(url_for("index"))
     form = LoginForm()
     if form.validate_on_submit():
+        # Checked before the password hash is computed
+        retry_after = login_throttle.retry_after(
+            form.username.data, request.remote_addr
+        )
+        if retry_after:
+            flash(
+                "Too many failed login attempts. "
+                f"Please try again in {retry_after} seconds.",
+                "error",
+            )
+            return (
+                render_template("auth/login.html", form=form),
+                429,
+                {"Retry-After": str(retry_after)},
+            )
         user = User.query.filter_by(username=form.username.data).first()
         if user is None or not user.check_password(form.password.data):
+            login_throttle.record_failure(form.username.data, request.remote_addr)
             flash("Invalid username or password", "error")
             return redirect(url_for("auth.login"))
+        login_throttle.reset(form.username.data)
         login_user(user, remember=form.remember_me.data)
         user.last_login = datetime.utcnow()
         user.login_count = (user.login_count or 0) + 1
@@ -87,19 +104,17 @@ def reset_password_request():
             token = secrets.token_urlsafe(32)
             user.reset_token = token
             user.reset_token_expiry = datetime.utcnow() + timedelta(hours=1)
-            db.session.commit()
             reset_url = url_for("auth.reset_password", token=token, _external=True)
-            msg = Message(
+            # Committed together with the token; sent in the background
+            mail_outbox.enqueue(
                 "Password Reset Request",
-                sender="noreply@raggie.com",
-                recipients=[user.email],
-            )
-            msg.body = f"""To reset your password, visit the following link:
+                [user.email],
+                f"""To reset your password, visit the following link:
 {reset_url}
 
 If you did not make this request then simply ignore this email.
-"""
-            mail.send(msg)
+""",
+            )
         flash("Check your email for the instructions to reset your password", "info")
         # Get the next page from the session
         next_page = session.get("next")
@@ -0,0 +1,166 @@
+"""Measure SQLite latency with several processes reading and writing at once.
+
+Mimics the gunicorn workers: each process runs short transactions against
+one database file, mostly primary-key reads with some single-row updates
+(login counters, settings, canvases). The same workload runs with
+SQLite's defaults (rollback journal, synchronous=FULL, 5 s timeout) and
+with the settings from database.py, and reports latency percentiles and
+"database is locked" errors for both.
+Run from the project root:
+
+    python benchmarks/bench_db_contention.py --processes 8 --ops 2000
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import configure_engine, engine_options  # noqa: E402
+
+PROFILES = {
+    "default": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_BUSY_TIMEOUT_MS": 5000,
+    },
+    "tuned": {},
+}
+
+
+def _engine(path, profile):
+    config = {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", **PROFILES[profile]}
+    engine = create_engine(config["SQLALCHEMY_DATABASE_URI"], **engine_options(config))
+    configure_engine(engine, config)
+    return engine
+
+
+def _prepare(path, profile, rows):
+    engine = _engine(path, profile)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE user (id INTEGER PRIMARY KEY, username TEXT, "
+                "failed_logins INTEGER, last_seen REAL)"
+            )
+        )
+        conn.execute(
+            text("INSERT INTO user VALUES (:id, :name, 0, 0)"),
+            [{"id": i, "name": f"user{i}"} for i in range(rows)],
+        )
+    engine.dispose()
+
+
+def _worker(path, profile, ops, rows, write_ratio, seed, start, results):
+    engine = _engine(path, profile)
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    start.wait()
+    for _ in range(ops):
+        user_id = rng.randrange(rows)
+        began = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if rng.random() < write_ratio:
+                    conn.execute(
+                        text(
+                            "UPDATE user SET failed_logins = failed_logins + 1, "
+                            "last_seen = :now WHERE id = :id"
+                        ),
+                        {"now": time.time(), "id": user_id},
+                    )
+                else:
+                    conn.execute(
+                        text("SELECT * FROM user WHERE id = :id"), {"id": user_id}
+                    ).fetchone()
+        except OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - began)
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+def run(profile, args):
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _prepare(path, profile, args.rows)
+        start, results = ctx.Event(), ctx.Queue()
+        procs = [
+            ctx.Process(
+                target=_worker,
+                args=(
+                    path,
+                    profile,
+                    args.ops,
+                    args.rows,
+                    args.write_ratio,
+                    seed,
+                    start,
+                    results,
+                ),
+            )
+            for seed in range(args.processes)
+        ]
+        for p in procs:
+            p.start()
+        # Let every process import and connect before the clock starts
+        time.sleep(2)
+        began = time.perf_counter()
+        start.set()
+        latencies, errors = [], 0
+        for _ in procs:
+            worker_latencies, worker_errors = results.get()
+            latencies.extend(worker_latencies)
+            errors += worker_errors
+        elapsed = time.perf_counter() - began
+        for p in procs:
+            p.join()
+
+    latencies.sort()
+    ms = [x * 1000 for x in latencies]
+    return {
+        "ops/s": len(ms) / elapsed,
+        "p50": statistics.median(ms),
+        "p99": ms[int(len(ms) * 0.99) - 1],
+        "max": ms[-1],
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=1000, help="per process")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    args = parser.parse_args()
+
+    print(
+        f"{args.processes} processes x {args.ops} transactions, "
+        f"{args.write_ratio:.0%} writes"
+    )
+    print(
+        f"{'profile':<10}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'max ms':>10}{'locked':>8}"
+    )
+    for profile in args.profiles:
+        r = run(profile, args)
+        print(
+            f"{profile:<10}{r['ops/s']:>10.0f}{r['p50']:>10.2f}{r['p99']:>10.2f}"
+            f"{r['max']:>10.1f}{r['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
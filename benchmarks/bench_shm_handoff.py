@@ -0,0 +1,94 @@
+"""Compare pickling vs shared memory for handing an array between processes.
+
+Run from the project root:
+
+    python benchmarks/bench_shm_handoff.py --rows 100000 --dim 384
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shm import (
+    SharedArrayRegistry,
+    attach_array,
+    close_quietly,
+    export_array,
+)  # noqa: E402
+
+
+def _producer(conn, rows, dim, mode, repeats):
+    array = np.random.default_rng(0).random((rows, dim), dtype=np.float32)
+    for _ in range(repeats):
+        conn.recv()  # wait for the consumer to be ready
+        started = time.perf_counter()
+        if mode == "pickle":
+            payload = array
+        else:
+            payload = export_array(array)
+        conn.send((started, payload))
+    conn.close()
+
+
+def run(mode, rows, dim, repeats):
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    process = ctx.Process(target=_producer, args=(child_conn, rows, dim, mode, repeats))
+    process.start()
+    registry = SharedArrayRegistry()
+
+    latencies = []
+    wire_bytes = 0
+    for _ in range(repeats):
+        parent_conn.send("ready")
+        started, payload = parent_conn.recv()
+        if mode == "pickle":
+            array = payload
+        else:
+            registry.incref(payload)
+            array, segment = attach_array(payload)
+        # Touch one row so the data is really reachable
+        float(array[-1].sum())
+        latencies.append(time.perf_counter() - started)
+        wire_bytes = len(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        if mode != "pickle":
+            del array
+            close_quietly(segment)
+            registry.decref(payload)
+
+    process.join()
+    return latencies, wire_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    nbytes = args.rows * args.dim * 4
+    print(f"Array: {args.rows} x {args.dim} float32 ({nbytes / 1e6:.1f} MB)")
+    print(f"{'mode':<8} {'median ms':>10} {'min ms':>8} {'bytes over pipe':>16}")
+    for mode in ("pickle", "shm"):
+        latencies, wire_bytes = run(mode, args.rows, args.dim, args.repeats)
+        print(
+            f"{mode:<8} {statistics.median(latencies) * 1000:>10.1f} "
+            f"{min(latencies) * 1000:>8.1f} {wire_bytes:>16,}"
+        )
+    print(
+        "shm copies the array once into the segment on the producer side; "
+        "pickle copies it into the pipe, out of the pipe and into a new array."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare FastTextSplitter with LangChain's RecursiveCharacterTextSplitter.
+
+Splits the page text of the PDFs in files/ with both splitters and checks
+that the chunks are identical. The sample PDFs are short, so the corpus is
+built twice: as many page-sized documents, and as long documents made of
+the pages repeated back to back.
+Run from the project root:
+
+    python benchmarks/bench_text_splitter.py --repeat 2000
+"""
+
+import argparse
+import glob
+import logging
+import os
+import statistics
+import sys
+import time
+
+from PyPDF2 import PdfReader
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: E402
+
+from builtin_blocks import FastTextSplitter  # noqa: E402
+
+
+def load_pages(pattern):
+    pages = []
+    for path in sorted(glob.glob(pattern)):
+        pages.extend(page.extract_text() or "" for page in PdfReader(path).pages)
+    return pages
+
+
+def time_split(splitter, texts, rounds):
+    timings, chunks = [], None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        chunks = [chunk for text in texts for chunk in splitter.split_text(text)]
+        timings.append(time.perf_counter() - started)
+    return timings, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", default=os.path.join(PROJECT_ROOT, "files", "*.pdf"))
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args()
+
+    # LangChain warns about every oversized chunk
+    logging.disable(logging.WARNING)
+
+    pages = load_pages(args.files)
+    corpora = {
+        "pages": pages * args.repeat,
+        "long documents": ["\n\n".join(pages * args.repeat)] * len(pages),
+    }
+    for label, texts in corpora.items():
+        chars = sum(len(text) for text in texts)
+        print(f"\n{label}: {len(texts)} texts, {chars / 1e6:.2f}M characters")
+        compare(texts, chars, args)
+
+
+def compare(texts, chars, args):
+    results = {}
+    for name, splitter in (
+        (
+            "langchain",
+            RecursiveCharacterTextSplitter(
+                chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap
+            ),
+        ),
+        (
+            "fast",
+            FastTextSplitter(
+                chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap
+            ),
+        ),
+    ):
+        results[name] = time_split(splitter, texts, args.rounds)
+
+    print(f"{'splitter':<10} {'median s':>9} {'min s':>7} {'MB/s':>7} {'chunks':>8}")
+    for name, (timings, chunks) in results.items():
+        median = statistics.median(timings)
+        print(
+            f"{name:<10} {median:>9.4f} {min(timings):>7.4f} "
+            f"{chars / 1e6 / median:>7.1f} {len(chunks):>8}"
+        )
+    identical = results["langchain"][1] == results["fast"][1]
+    speedup = statistics.median(results["langchain"][0]) / statistics.median(
+        results["fast"][0]
+    )
+    print(f"Identical chunks: {identical}; speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
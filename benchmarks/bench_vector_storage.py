@@ -0,0 +1,113 @@
+"""Compare index size, recall and latency of the vector storage modes.
+
+Builds the same index with float32, float16, int8 and PQ storage and
+searches it with and without exact re-ranking. Recall@k is measured
+against brute-force float32 search. "disk MB" is everything the index
+keeps on disk in that configuration: the index file, the payload store
+and, when re-ranking, the exact vectors. The reference corpus is synthetic
+(clustered vectors with a fixed seed, like sentence embeddings); pass
+``--vectors file.npy`` to use real embeddings instead. Run from the
+project root:
+
+    python benchmarks/bench_vector_storage.py --count 50000 --dim 384
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from vector_index import IndexManager  # noqa: E402
+
+
+def reference_corpus(count, dim, queries, seed=0):
+    """Unit vectors scattered around a few hundred topic centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((max(1, count // 200), dim))
+    labels = rng.integers(0, len(centroids), count + queries)
+    vectors = centroids[labels] + 0.6 * rng.standard_normal((count + queries, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors.astype(np.float32)
+    return vectors[:count], vectors[count:]
+
+
+def exact_neighbors(vectors, queries, k):
+    # Unit vectors: the smallest L2 distance is the largest dot product
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def measure(manager, name, queries, truth, k, rerank):
+    timings, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, ids = manager.search(name, query, k, rerank=rerank)
+        timings.append((time.perf_counter() - started) * 1000)
+        hits += len(np.intersect1d(ids[0], expected))
+    return hits / truth.size, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", help=".npy file of embeddings to use")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-type", choices=("flat", "hnsw", "ivf"))
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4, 16])
+    args = parser.parse_args()
+
+    if args.vectors:
+        data = np.load(args.vectors).astype(np.float32)
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+        vectors, queries = data[: -args.queries], data[-args.queries :]
+    else:
+        vectors, queries = reference_corpus(args.count, args.dim, args.queries)
+    truth = exact_neighbors(vectors, queries, args.k)
+    print(
+        f"{len(vectors)} vectors of dim {vectors.shape[1]}, "
+        f"{len(queries)} queries, k={args.k}"
+    )
+
+    print(
+        f"{'storage':<9} {'type':<5} {'MB':>8} {'disk MB':>8} {'B/vec':>7} "
+        f"{'build s':>8} "
+        f"{'rerank':>6} {'recall':>7} {'p50 ms':>7}"
+    )
+    with tempfile.TemporaryDirectory() as root:
+        manager = IndexManager(root)
+        for storage in ("float32", "float16", "int8", "pq"):
+            meta = manager.build(
+                storage,
+                vectors,
+                index_type=args.index_type,
+                storage=storage,
+                exact_vectors=any(rerank > 1 for rerank in args.rerank),
+            )
+            for rerank in args.rerank:
+                if rerank > 1 and meta["storage"] == "float32":
+                    continue
+                recall, p50 = measure(manager, storage, queries, truth, args.k, rerank)
+                # Without re-ranking the exact vectors need not be kept
+                disk_bytes = meta["disk_bytes"] - (
+                    0 if rerank > 1 else meta["raw_bytes"]
+                )
+                print(
+                    f"{meta['storage']:<9} {meta['type']:<5} "
+                    f"{meta['file_bytes'] / 1e6:>8.1f} {disk_bytes / 1e6:>8.1f} "
+                    f"{meta['bytes_per_vector']:>7.0f} "
+                    f"{meta['build_seconds']:>8.2f} {rerank:>6} "
+                    f"{recall:>7.3f} {p50:>7.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,34 @@
 from abc import ABC, abstractmethod
 from typing import Dict, List
+import json
 import os
+import uuid
+
+from artifacts import is_handle
+from canvas_sync import empty_document
+from class_policy import check_class
+from shm import is_shared
+
+
+class MissingInput(Exception):
+    """An upstream block has no output for the block to run on."""
+
+
+def _persistable(output) -> bool:
+    """Whether an output can be stored with the canvas and shared by workers.
+
+    Artifact handles and plain JSON values can; shared-memory outputs
+    belong to the worker that ran the block, and other Python objects
+    would not come back as the same type.
+    """
+    if is_handle(output):
+        return True
+    if is_shared(output):
+        return False
+    try:
+        return json.loads(json.dumps(output)) == output
+    except (TypeError, ValueError):
+        return False
 
 
 class Block(ABC):
@@ -15,17 +43,93 @@ class Block(ABC):
         pass
 
 
+class CustomBlock(Block):
+    """A block backed by a class from an importable module."""
+
+    # Attributes that fully describe the block; see to_dict()
+    FIELDS = (
+        "module_path",
+        "class_name",
+        "methods",
+        "parameters",
+        "input_nodes",
+        "output_nodes",
+        "import_string",
+        "function_string",
+    )
+
+    def __init__(
+        self,
+        module_path: str,
+        class_name: str,
+        methods: list = None,
+        parameters: dict = None,
+        input_nodes: list = None,
+        output_nodes: list = None,
+        import_string: str = "",
+        function_string: str = "",
+    ):
+        super().__init__()
+        self.module_path = module_path
+        self.class_name = class_name
+        self.methods = methods or []
+        self.parameters = parameters or {}
+        self.input_nodes = input_nodes or []
+        self.output_nodes = output_nodes or []
+        self.import_string = import_string
+        self.function_string = function_string
+
+    def validate_connections(self) -> bool:
+        # Basic validation - could be enhanced based on specific requirements
+        return True
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CustomBlock":
+        return cls(**{field: data.get(field) for field in cls.FIELDS})
+
+
 class Canvas:
     def __init__(self):
         self.blocks: Dict[str, Block] = {}
         self.connections: Dict[str, List[str]] = {}  # source_id -> [target_id]
+        self.results: Dict[str, object] = {}  # block_id -> last output
+        # block_id -> id of the run that produced the output in results
+        self.result_tokens: Dict[str, str] = {}
+        # block_id -> artifact handle saved in place of a shared-memory output
+        self.saved_results: Dict[str, dict] = {}
+        # Editor state kept in sync by the browser; see canvas_sync.py
+        self.document: dict = empty_document()
 
     def add_block(self, block_id: str, block: Block) -> None:
         """Add a block to the canvas."""
         self.blocks[block_id] = block
 
-    def process_block(self, block_id: str, config: dict) -> dict:
-        """Process a block using its implementation."""
+    def process_block(
+        self, block_id: str, config: dict, pool=None, context: dict = None
+    ) -> dict:
+        """Process a block using its implementation.
+
+        Custom blocks are executed in a sandbox worker when a pool is given;
+        the output is kept so downstream blocks receive it as input.
+        """
+        result = self.run_block(block_id, config, pool, context)
+        if "output_value" in result:
+            pool.release(self.set_result(block_id, result.pop("output_value")))
+        return result
+
+    def run_block(
+        self, block_id: str, config: dict, pool=None, context: dict = None
+    ) -> dict:
+        """Run a block on its current inputs without storing the output.
+
+        When the block ran in the sandbox, the result has an
+        ``output_value`` key with what to pass to ``set_result``: the
+        output, or None after an error. ``context`` (owner, pipeline id)
+        reaches blocks that take a ``run_context`` argument.
+        """
         if block_id not in self.blocks:
             return {
                 "status": "error",
@@ -34,21 +138,21 @@ class Canvas:
             }
 
         block = self.blocks[block_id]
+        block_type = type(block).__name__
+        print(f"Processing block {block_id} of type {block_type}")
 
-        try:
-            # For now, return a simple success response
-            # In a real implementation, this would execute the block's function
-            # with the provided configuration
-            block_type = type(block).__name__
-            print(f"Processing block {block_id} of type {block_type}")
-
-            # Example implementation - in a real system, this would use the
-            # block's function_string or other properties to execute logic
+        if pool is None or not getattr(block, "class_name", None):
             return {
                 "status": "success",
                 "output": f"Processed {block_type}",
                 "block_id": block_id,
             }
+
+        # Raised to the caller: running would pass the inputs shifted
+        spec = self._build_spec(block_id, config)
+        try:
+            spec["context"] = dict(context or {})
+            result = pool.run(spec)
         except Exception as e:
             return {
                 "status": "error",
@@ -56,6 +160,64 @@ class Canvas:
                 "block_id": block_id,
             }
 
+        result["block_id"] = block_id
+        if result["status"] == "success":
+            result["output_value"] = result["output"]
+        else:
+            result["output_value"] = None
+            result["output"] = f"Error processing block: {result['error']['message']}"
+        return result
+
+    def set_result(self, block_id: str, output, saved: dict = None) -> object:
+        """Store a block's output (None drops it); returns the previous one.
+
+        ``saved`` is an artifact handle with the same data as a
+        shared-memory output, stored with the canvas in its place. The
+        caller releases the previous output once nothing uses it.
+        """
+        previous = self.results.pop(block_id, None)
+        self.result_tokens.pop(block_id, None)
+        self.saved_results.pop(block_id, None)
+        if output is not None and block_id in self.blocks:
+            self.results[block_id] = output
+            self.result_tokens[block_id] = uuid.uuid4().hex
+            if saved is not None:
+                self.saved_results[block_id] = saved
+        return previous
+
+    def _build_spec(self, block_id: str, config: dict) -> dict:
+        """Collect everything a sandbox worker needs to run a block."""
+        block = self.blocks[block_id]
+        check_class(block.module_path, block.class_name)
+
+        parameters = dict(getattr(block, "parameters", None) or {})
+        parameters.update(config.get("parameters") or {})
+
+        method = config.get("selected_method")
+        if not method:
+            methods = [m for m in getattr(block, "methods", []) if m != "__init__"]
+            method = methods[0] if methods else None
+
+        sources = [
+            source_id
+            for source_id, targets in self.connections.items()
+            if block_id in targets
+        ]
+        missing = [source_id for source_id in sources if source_id not in self.results]
+        if missing:
+            raise MissingInput(
+                f"Run the upstream blocks first: {', '.join(missing)} have no output"
+            )
+        inputs = [self.results[source_id] for source_id in sources]
+
+        return {
+            "module_path": block.module_path,
+            "class_name": block.class_name,
+            "parameters": parameters,
+            "method": method,
+            "inputs": inputs,
+        }
+
     def connect_blocks(self, source_id: str, target_id: str) -> bool:
         """Connect two blocks and validate the connection."""
         if source_id not in self.blocks or target_id not in self.blocks:
@@ -208,7 +370,59 @@ class Canvas:
 
         return "\n".join(code_lines)
 
-    def clear(self):
+    def to_dict(self) -> dict:
+        """Blocks, connections and the outputs other workers can use."""
+        return {
+            "blocks": {
+                block_id: block.to_dict()
+                for block_id, block in self.blocks.items()
+                if isinstance(block, CustomBlock)
+            },
+            "connections": {
+                source_id: list(targets)
+                for source_id, targets in self.connections.items()
+            },
+            "document": self.document,
+            "results": {
+                block_id: self.saved_results.get(block_id, output)
+                for block_id, output in self.results.items()
+                if _persistable(self.saved_results.get(block_id, output))
+            },
+            # Also for worker-local outputs, so a stale copy is recognised
+            "result_tokens": dict(self.result_tokens),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Canvas":
+        canvas = cls()
+        for block_id, block_data in (data.get("blocks") or {}).items():
+            canvas.add_block(block_id, CustomBlock.from_dict(block_data))
+        for source_id, targets in (data.get("connections") or {}).items():
+            canvas.connections[source_id] = list(targets)
+            for target_id in targets:
+                if source_id in canvas.blocks and target_id in canvas.blocks:
+                    source_block = canvas.blocks[source_id]
+                    target_block = canvas.blocks[target_id]
+                    target_block.inputs[source_id] = source_block
+                    source_block.outputs[target_id] = target_block
+        canvas.document = data.get("document") or empty_document()
+        for block_id, output in (data.get("results") or {}).items():
+            if block_id in canvas.blocks:
+                canvas.results[block_id] = output
+        canvas.result_tokens = {
+            block_id: token
+            for block_id, token in (data.get("result_tokens") or {}).items()
+            if block_id in canvas.blocks
+        }
+        return canvas
+
+    def clear(self, pool=None):
         """Clear all blocks and connections."""
+        if pool is not None:
+            for output in self.results.values():
+                pool.release(output)
         self.blocks.clear()
         self.connections.clear()
+        self.results.clear()
+        self.result_tokens.clear()
+        self.saved_results.clear()
@@ -0,0 +1,545 @@
+"""Blocks that ship with RAGgie and show up in the custom block catalog.
+
+They follow the same interfaces as the LangChain classes they stand in for,
+so generated pipelines can use them as drop-in replacements.
+"""
+
+import copy
+import glob
+import hashlib
+import json
+import os
+import time
+
+from langchain_core.documents import Document
+
+from embedding_cache import EmbeddingCache, embed_with_cache
+from artifacts import to_jsonable
+from class_policy import load_class_path
+from dedup import near_duplicate_groups
+from embedding_service import EmbeddingClient
+from ingest import PDFIngestService
+from query_cache import MISS, QueryCache
+from text_splitter import RecursiveTextSplitter
+from vector_index import IndexManager, owner_root
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_EMBEDDINGS_CLASS = "langchain_community.embeddings.HuggingFaceEmbeddings"
+
+
+def _instance_dir(env_var, name):
+    return os.environ.get(env_var, os.path.join(PROJECT_ROOT, "instance", name))
+
+
+def _expand_paths(file_path):
+    """Accept a path, a comma-separated list, a glob or a list of those."""
+    if isinstance(file_path, str):
+        file_path = [p.strip() for p in file_path.split(",") if p.strip()]
+    paths = []
+    for pattern in file_path:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches if matches else [pattern])
+    return paths
+
+
+class ParallelPDFLoader:
+    """Load PDFs page by page using a process pool and a text cache.
+
+    Produces the same documents as ``PyPDFLoader`` (one per page, with
+    ``source`` and ``page`` metadata). Extracted text is cached under the
+    PDF's content hash, so unchanged files are never parsed twice.
+    """
+
+    def __init__(self, file_path, workers=None, cache_dir=None):
+        self.paths = _expand_paths(file_path)
+        self.service = PDFIngestService(
+            cache_dir or _instance_dir("PDF_CACHE_ROOT", "pdf_cache"),
+            workers=workers,
+        )
+        self.last_stats = None
+
+    def load(self):
+        """Load all pages of all files as documents."""
+        results, self.last_stats = self.service.extract(self.paths)
+        print(
+            f"ParallelPDFLoader: {self.last_stats['pages']} pages from "
+            f"{self.last_stats['files']} files at "
+            f"{self.last_stats['pages_per_second'] or 0:.1f} pages/s "
+            f"({self.last_stats['cached_files']} cached)"
+        )
+        return [
+            Document(
+                page_content=text,
+                metadata={"source": result["source"], "page": number},
+            )
+            for result in results
+            for number, text in enumerate(result["pages"])
+        ]
+
+    def lazy_load(self):
+        yield from self.load()
+
+
+class FastTextSplitter(RecursiveTextSplitter):
+    """Drop-in for ``RecursiveCharacterTextSplitter`` that splits on offsets.
+
+    Gives the same chunks for the same ``chunk_size``, ``chunk_overlap``
+    and separators, but finds separators with precompiled patterns and
+    only copies text for the final chunks.
+    """
+
+    def __init__(
+        self,
+        chunk_size=1000,
+        chunk_overlap=200,
+        separators=None,
+        keep_separator=True,
+        strip_whitespace=True,
+        add_start_index=False,
+    ):
+        super().__init__(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=separators,
+            keep_separator=keep_separator,
+            strip_whitespace=strip_whitespace,
+            add_start_index=add_start_index,
+        )
+
+
+class ChunkDeduplicator:
+    """Drop near-duplicate chunks before they are embedded.
+
+    Repeated headers, footers and duplicate pages are found with MinHash
+    signatures and LSH buckets; chunks whose estimated Jaccard similarity
+    reaches ``threshold`` are grouped and only the first of each group is
+    kept. With ``mode="merge"`` the kept chunk lists the metadata of the
+    chunks it replaced under ``duplicates``. The embedding time saved is
+    estimated from the embedding cache's measured speed for the model.
+    """
+
+    def __init__(
+        self,
+        threshold=0.8,
+        num_perm=128,
+        shingle_size=5,
+        mode="drop",
+        model_name=DEFAULT_EMBEDDING_MODEL,
+        embeddings_class=DEFAULT_EMBEDDINGS_CLASS,
+        cache_dir=None,
+    ):
+        if mode not in ("drop", "merge"):
+            raise ValueError(f"mode must be 'drop' or 'merge', got {mode!r}")
+        self.threshold = float(threshold)
+        self.num_perm = int(num_perm)
+        self.shingle_size = int(shingle_size)
+        self.mode = mode
+        self.cache = EmbeddingCache(
+            cache_dir or _instance_dir("EMBEDDING_CACHE_ROOT", "embedding_cache"),
+            f"{embeddings_class}:{model_name}",
+        )
+        self.last_stats = None
+
+    def deduplicate(self, documents):
+        """Return the documents without near-duplicates, in their order."""
+        documents = list(documents)
+        started = time.perf_counter()
+        groups = near_duplicate_groups(
+            [doc.page_content for doc in documents],
+            self.threshold,
+            self.num_perm,
+            self.shingle_size,
+        )
+        kept = {}
+        for i, group in enumerate(groups):
+            if group == i:
+                doc = documents[i]
+                if self.mode == "merge":
+                    doc = Document(
+                        page_content=doc.page_content,
+                        metadata=copy.deepcopy(doc.metadata),
+                    )
+                kept[i] = doc
+            elif self.mode == "merge":
+                kept[group].metadata.setdefault("duplicates", []).append(
+                    copy.deepcopy(documents[i].metadata)
+                )
+
+        dropped = len(documents) - len(kept)
+        per_text = self.cache.seconds_per_text()
+        self.last_stats = {
+            "chunks": len(documents),
+            "kept": len(kept),
+            "dropped": dropped,
+            "characters_saved": sum(
+                len(documents[i].page_content)
+                for i, group in enumerate(groups)
+                if group != i
+            ),
+            "dedup_seconds": time.perf_counter() - started,
+            "estimated_seconds_saved": dropped * per_text if per_text else None,
+        }
+        stats = self.last_stats
+        saved = stats["estimated_seconds_saved"]
+        print(
+            f"ChunkDeduplicator: kept {stats['kept']}/{stats['chunks']} chunks, "
+            f"dropped {dropped} near-duplicates in {stats['dedup_seconds']:.2f}s; "
+            + (
+                f"saves ~{saved:.2f}s of embedding"
+                if saved is not None
+                else "embedding speed not measured yet"
+            )
+        )
+        return list(kept.values())
+
+    def transform_documents(self, documents, **kwargs):
+        return self.deduplicate(documents)
+
+
+def _query_cache():
+    return QueryCache(
+        os.environ.get(
+            "QUERY_CACHE_PATH",
+            os.path.join(PROJECT_ROOT, "instance", "query_cache.sqlite"),
+        )
+    )
+
+
+def _cache_scope(run_context, kind):
+    # Owner first, so the owner's entries can be listed and cleared by prefix
+    owner = run_context.get("owner", "default")
+    return f"{owner}/{run_context.get('pipeline_id', 'default')}/{kind}"
+
+
+def _index_manager(index_dir, run_context):
+    # Each canvas owner gets their own indexes; names are not shared
+    root = index_dir or _instance_dir("INDEX_ROOT", "indexes")
+    return IndexManager(owner_root(root, run_context.get("owner")))
+
+
+def _import_class(path):
+    # Class paths are block parameters, so they get the same checks as blocks
+    return load_class_path(path)
+
+
+class CachedEmbeddings:
+    """Wrap an embeddings model with a persistent, content-addressed cache.
+
+    Vectors are keyed by the model name and the hash of the normalized
+    chunk text, so re-running a pipeline over mostly unchanged documents
+    only embeds the new chunks. Misses are embedded in batches. The inner
+    model is only loaded when there is something to embed, and misses go
+    through the shared embedding service when one is configured. Loading
+    a sentence-transformers model in the sandbox takes several hundred MB
+    of ``SANDBOX_MEMORY_MB``, and several GB of address space if
+    ``SANDBOX_ADDRESS_SPACE_MB`` is set.
+    """
+
+    def __init__(
+        self,
+        model_name=DEFAULT_EMBEDDING_MODEL,
+        embeddings_class=DEFAULT_EMBEDDINGS_CLASS,
+        batch_size=64,
+        cache_dir=None,
+        service_address=None,
+    ):
+        self.model_name = model_name
+        self.embeddings_class = embeddings_class
+        self.batch_size = batch_size
+        self.service_address = service_address or os.environ.get(
+            "EMBEDDING_SERVICE_ADDRESS"
+        )
+        self.cache = EmbeddingCache(
+            cache_dir or _instance_dir("EMBEDDING_CACHE_ROOT", "embedding_cache"),
+            f"{embeddings_class}:{model_name}",
+        )
+        self._model = None
+        self.last_stats = None
+
+    @property
+    def model(self):
+        if self._model is None and self.service_address:
+            self._model = EmbeddingClient(
+                self.service_address, self.embeddings_class, self.model_name
+            )
+        elif self._model is None:
+            self._model = _import_class(self.embeddings_class)(
+                model_name=self.model_name
+            )
+        return self._model
+
+    def embed_array(self, texts):
+        """Embed texts (or documents) into a float32 matrix."""
+        texts = [t.page_content if isinstance(t, Document) else t for t in texts]
+        matrix, self.last_stats = embed_with_cache(
+            self.cache,
+            texts,
+            lambda batch: self.model.embed_documents(batch),
+            self.batch_size,
+        )
+        stats = self.last_stats
+        if stats["texts"] > 1:
+            print(
+                f"CachedEmbeddings: {stats['hits']}/{stats['texts']} cached "
+                f"({(stats['hit_rate'] or 0) * 100:.0f}%), embedded "
+                f"{stats['embedded']} in {stats['compute_seconds']:.2f}s, "
+                f"saved ~{stats['estimated_seconds_saved']:.2f}s"
+            )
+        return matrix
+
+    def embed_documents(self, texts):
+        """Embed texts (or documents), reusing cached vectors."""
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+
+class BatchedEmbeddings(EmbeddingClient):
+    """Embed through the shared batching service instead of a private model.
+
+    Concurrent runs using the same model are merged into larger batches by
+    the service started with ``python embedding_service.py``.
+    """
+
+    def __init__(
+        self,
+        model_name=DEFAULT_EMBEDDING_MODEL,
+        embeddings_class=DEFAULT_EMBEDDINGS_CLASS,
+        address=None,
+    ):
+        super().__init__(
+            address or os.environ.get("EMBEDDING_SERVICE_ADDRESS", "127.0.0.1:8765"),
+            embeddings_class,
+            model_name,
+        )
+
+
+# Re-ranking factor used with PQ storage unless one is given
+PQ_DEFAULT_RERANK = 16
+
+
+class ManagedFAISS:
+    """Vector store kept as a persistent, memory-mapped FAISS index.
+
+    The index type (Flat, HNSW or IVF) is chosen from the corpus size.
+    Chunks are tracked by source file and content hash, so adding the same
+    documents again only embeds and indexes the files that changed.
+
+    ``storage`` ("float32", "float16", "int8" or "pq") compresses the
+    vectors when the index is created; ``rerank`` (e.g. 4) then fetches
+    that many times more candidates and re-ranks them exactly. Exact
+    copies of the vectors are only kept on disk when ``rerank`` is above
+    1. PQ without re-ranking has low recall, so ``rerank`` defaults to
+    ``PQ_DEFAULT_RERANK`` for PQ and to 0 otherwise.
+    """
+
+    def __init__(
+        self,
+        index_name="default",
+        model_name=DEFAULT_EMBEDDING_MODEL,
+        embeddings_class=DEFAULT_EMBEDDINGS_CLASS,
+        metric="l2",
+        index_type=None,
+        index_dir=None,
+        cache_queries=True,
+        similarity_threshold=None,
+        storage="float32",
+        rerank=None,
+        run_context=None,
+    ):
+        self.index_name = index_name
+        self.run_context = run_context or {}
+        self.metric = metric
+        self.index_type = index_type
+        self.storage = storage
+        if rerank is None:
+            rerank = PQ_DEFAULT_RERANK if storage == "pq" else 0
+        self.rerank = int(rerank or 0)
+        self.similarity_threshold = similarity_threshold
+        self.query_cache = _query_cache() if cache_queries else None
+        self.manager = _index_manager(index_dir, self.run_context)
+        self.embeddings = CachedEmbeddings(model_name, embeddings_class)
+        if self.manager.exists(index_name):
+            meta = self.manager.meta(index_name)
+            existing = meta.get("requested_storage")
+            if existing and existing != storage:
+                print(
+                    f"ManagedFAISS '{index_name}': index uses {existing} storage, "
+                    f"ignoring {storage} until it is rebuilt"
+                )
+            if self.rerank > 1 and not meta.get("exact_vectors", True):
+                print(
+                    f"ManagedFAISS '{index_name}': index keeps no exact vectors, "
+                    "so rerank has no effect until it is rebuilt"
+                )
+
+    def add_documents(self, documents):
+        """Add or update documents, grouped by their ``source`` metadata."""
+        return self._report(self._upsert(documents))
+
+    def _upsert(self, documents):
+        by_source = {}
+        for doc in documents:
+            by_source.setdefault(doc.metadata.get("source", ""), []).append(doc)
+
+        counts = {"added": 0, "updated": 0, "unchanged": 0}
+        for source, docs in by_source.items():
+            payloads = [to_jsonable(doc) for doc in docs]
+            content_hash = hashlib.sha256(
+                json.dumps(payloads, sort_keys=True).encode("utf-8")
+            ).hexdigest()
+            status = self.manager.upsert_source(
+                self.index_name,
+                source,
+                content_hash,
+                lambda docs=docs: self.embeddings.embed_array(docs),
+                payloads,
+                metric=self.metric,
+                index_type=self.index_type,
+                storage=self.storage,
+                exact_vectors=self.rerank > 1,
+            )
+            counts[status] += 1
+        return counts
+
+    def sync_documents(self, documents):
+        """Make the index match ``documents``, removing sources not in it."""
+        sources = {doc.metadata.get("source", "") for doc in documents}
+        removed = 0
+        if self.manager.exists(self.index_name):
+            for source in self.manager.sources(self.index_name):
+                if source not in sources:
+                    self.manager.remove_source(self.index_name, source)
+                    removed += 1
+        counts = self._upsert(documents)
+        counts["removed"] = removed
+        return self._report(counts)
+
+    def delete_source(self, source):
+        """Remove all chunks of one source file from the index."""
+        return self.manager.remove_source(self.index_name, source)
+
+    def _report(self, counts):
+        meta = self.manager.meta(self.index_name)
+        counts.update(
+            index_type=meta["type"],
+            storage=meta.get("storage", "float32"),
+            vectors=meta["live"],
+            deleted=meta["deleted"],
+        )
+        print(
+            f"ManagedFAISS '{self.index_name}': {counts['added']} added, "
+            f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+            + (f", {counts['removed']} removed" if "removed" in counts else "")
+            + f"; {meta['live']} vectors in a {meta['type']} index"
+            + f" ({meta.get('storage', 'float32')})"
+        )
+        return counts
+
+    def similarity_search_with_score(self, query, k=4):
+        """Search the index, answering repeated queries from the query cache.
+
+        Cached results are scoped to the canvas owner, the pipeline and the
+        index version, so they are dropped as soon as the index changes. With a
+        ``similarity_threshold`` (cosine, e.g. 0.95) near-identical
+        queries are matched too.
+        """
+        scope = (
+            _cache_scope(self.run_context, "faiss")
+            + f"/{self.index_name}@{self.manager.meta(self.index_name)['version']}"
+            + f"/k={k}"
+            + (f"/rerank={self.rerank}" if self.rerank > 1 else "")
+        )
+        cached = self.query_cache.get(scope, query) if self.query_cache else MISS
+        vector = None
+        if cached is MISS and self.query_cache and self.similarity_threshold:
+            vector = self.embeddings.embed_array([query])
+            cached, similarity = self.query_cache.get_similar(
+                scope, vector[0], self.similarity_threshold
+            )
+            if cached is not MISS:
+                print(f"ManagedFAISS: similar query in cache ({similarity:.3f})")
+        elif cached is not MISS:
+            print("ManagedFAISS: query answered from cache")
+        if cached is not MISS:
+            return [(Document(**payload), score) for payload, score in cached]
+
+        if vector is None:
+            vector = self.embeddings.embed_array([query])
+        distances, ids = self.manager.search(
+            self.index_name, vector, k, rerank=self.rerank
+        )
+        payloads = self.manager.get_payloads(self.index_name, ids[0])
+        results = [
+            (payload, float(distance))
+            for payload, distance in zip(payloads, distances[0])
+            if payload is not None
+        ]
+        if self.query_cache:
+            self.query_cache.put(scope, query, results, vector[0])
+        return [(Document(**payload), score) for payload, score in results]
+
+    def similarity_search(self, query, k=4):
+        """Return the ``k`` documents closest to the query."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+
+class CachedLLM:
+    """Wrap a LangChain LLM or chat model with the query cache.
+
+    A prompt seen before in the same pipeline of the same canvas owner,
+    with the same model and settings, is answered from the cache. Prompts are only matched exactly
+    (up to case and whitespace): the retrieved context is part of the
+    prompt, and a similar prompt may carry different context. With
+    ``index_name`` the scope also includes that index's version, so
+    answers are recomputed once the index changes.
+    """
+
+    def __init__(
+        self,
+        llm_class="langchain_community.llms.Ollama",
+        llm_kwargs=None,
+        index_name=None,
+        index_dir=None,
+        run_context=None,
+    ):
+        self.llm_class = llm_class
+        self.run_context = run_context or {}
+        self.llm_kwargs = llm_kwargs or {}
+        self.index_name = index_name
+        self.query_cache = _query_cache()
+        self.manager = (
+            _index_manager(index_dir, self.run_context) if index_name else None
+        )
+        self._llm = None
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = _import_class(self.llm_class)(**self.llm_kwargs)
+        return self._llm
+
+    def invoke(self, input, **kwargs):
+        """Answer a prompt, from the cache when possible."""
+        prompt = input if isinstance(input, str) else json.dumps(to_jsonable(input))
+        settings = hashlib.sha256(
+            json.dumps([self.llm_class, self.llm_kwargs], sort_keys=True).encode()
+        ).hexdigest()[:16]
+        scope = f"{_cache_scope(self.run_context, 'llm')}/{settings}"
+        if self.index_name and self.manager.exists(self.index_name):
+            version = self.manager.meta(self.index_name)["version"]
+            scope += f"/{self.index_name}@{version}"
+
+        answer = self.query_cache.get(scope, prompt)
+        if answer is not MISS:
+            print("CachedLLM: answered from cache")
+            return answer
+
+        result = self.llm.invoke(input, **kwargs)
+        # Chat models return a message; keep just its text
+        answer = getattr(result, "content", result)
+        self.query_cache.put(scope, prompt, answer)
+        return answer
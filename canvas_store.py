@@ -0,0 +1,191 @@
+"""Canvases stored per user or session in the database.
+
+Every worker process can serve any request: a canvas is read from the
+``CanvasState`` table and cached in-process together with its version
+number. Each request checks the stored version with one primary-key
+lookup and only reloads the canvas when another worker has changed it.
+Writes go to the database first and then to the cache (write-through),
+and only succeed if the version is still the one the change was based on;
+otherwise the change is re-applied to the fresh canvas.
+
+Block outputs that are artifact handles or plain JSON values are saved
+with the canvas, so a downstream block run by another worker gets them as
+inputs. Outputs in shared memory belong to the worker that ran the block
+and stay in its cache; the canvas saves an artifact handle with the same
+data in their place for the other workers. The stored canvas records
+which run produced each output, so a worker only keeps its local output
+while no newer run has replaced it. Block runs store their output through
+``update`` like any other change.
+"""
+
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import session
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+
+from blocks import Canvas
+from extensions import db
+from models import CanvasState
+
+
+class CanvasConflict(Exception):
+    """The canvas kept changing under a write; the caller may retry."""
+
+
+def canvas_owner():
+    """Owner key of the current request's canvas."""
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    if "canvas_id" not in session:
+        session["canvas_id"] = uuid.uuid4().hex
+    return f"session:{session['canvas_id']}"
+
+
+def owner_key(owner):
+    """Opaque id of a canvas owner, safe to use in paths and cache scopes."""
+    return hashlib.sha256(owner.encode("utf-8")).hexdigest()[:16]
+
+
+def canvas_pipeline_id(owner, template_id=None):
+    """Pipeline id of an owner's canvas, per loaded template if any.
+
+    Derived on the server, so runs of the same template by different
+    users are never mixed up.
+    """
+    pipeline_id = "canvas_" + owner_key(owner)
+    if template_id:
+        digest = hashlib.sha256(str(template_id).encode("utf-8")).hexdigest()
+        pipeline_id += "_" + digest[:16]
+    return pipeline_id
+
+
+class CanvasStore:
+    """Load, cache and save canvases with optimistic versioning."""
+
+    def __init__(self, max_cached=256, retries=5):
+        self.max_cached = max_cached
+        self.retries = retries
+        self._lock = threading.Lock()
+        # owner -> (version, Canvas), least recently used first
+        self._cache = OrderedDict()
+
+    def _cached(self, owner):
+        with self._lock:
+            entry = self._cache.get(owner)
+            if entry:
+                self._cache.move_to_end(owner)
+            return entry
+
+    def _remember(self, owner, version, canvas, pool=None):
+        with self._lock:
+            previous = self._cache.get(owner)
+            if previous and previous[1] is not canvas:
+                old = previous[1]
+                for block_id, output in old.results.items():
+                    if canvas.results.get(block_id) is output:
+                        continue
+                    # Carry over worker-local outputs no newer run replaced;
+                    # the stored canvas has their saved handle, if any
+                    saved = old.saved_results.get(block_id)
+                    if (
+                        block_id in canvas.result_tokens
+                        and canvas.result_tokens[block_id]
+                        == old.result_tokens.get(block_id)
+                        and canvas.results.get(block_id, saved) == saved
+                    ):
+                        canvas.results[block_id] = output
+                        if saved is not None:
+                            canvas.saved_results[block_id] = saved
+                    elif pool is not None:
+                        pool.release(output)
+            self._cache[owner] = (version, canvas)
+            self._cache.move_to_end(owner)
+            evicted = []
+            while len(self._cache) > self.max_cached:
+                evicted.append(self._cache.popitem(last=False)[1][1])
+        if pool is not None:
+            for old in evicted:
+                for output in old.results.values():
+                    pool.release(output)
+
+    def _stored_version(self, owner):
+        row = (
+            db.session.query(CanvasState.version)
+            .filter(CanvasState.owner == owner)
+            .first()
+        )
+        return row[0] if row else 0
+
+    def _load(self, owner):
+        state = CanvasState.query.filter_by(owner=owner).first()
+        if state is None:
+            return 0, Canvas()
+        return state.version, Canvas.from_dict(json.loads(state.data))
+
+    def get_versioned(self, owner, pool=None):
+        """``(version, canvas)``; reloaded only if it changed elsewhere."""
+        cached = self._cached(owner)
+        if cached and cached[0] == self._stored_version(owner):
+            return cached
+        version, canvas = self._load(owner)
+        self._remember(owner, version, canvas, pool)
+        return version, canvas
+
+    def get(self, owner, pool=None):
+        """The owner's current canvas."""
+        return self.get_versioned(owner, pool)[1]
+
+    def _save(self, owner, expected, canvas):
+        """Write the canvas if it is still at ``expected``; the new version or None."""
+        data = json.dumps(canvas.to_dict())
+        now = datetime.utcnow()
+        if expected == 0:
+            user_id = int(owner[5:]) if owner.startswith("user:") else None
+            db.session.add(
+                CanvasState(
+                    owner=owner,
+                    user_id=user_id,
+                    data=data,
+                    version=1,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another worker created it first
+                db.session.rollback()
+                return None
+            return 1
+        updated = CanvasState.query.filter_by(owner=owner, version=expected).update(
+            {"data": data, "version": expected + 1, "updated_at": now},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return expected + 1 if updated else None
+
+    def update(self, owner, change, pool=None):
+        """Apply ``change(canvas)`` and save it; returns what ``change`` returns.
+
+        ``change`` runs on a private copy of the latest canvas, so a failed
+        write leaves the cached canvas untouched and the change is simply
+        run again on the newer version.
+        """
+        for _ in range(self.retries):
+            version, current = self.get_versioned(owner, pool)
+            canvas = Canvas.from_dict(current.to_dict())
+            canvas.results = dict(current.results)
+            canvas.saved_results = dict(current.saved_results)
+            result = change(canvas)
+            new_version = self._save(owner, version, canvas)
+            if new_version is not None:
+                self._remember(owner, new_version, canvas, pool)
+                return result
+        raise CanvasConflict(f"Canvas {owner} changed {self.retries} times mid-write")
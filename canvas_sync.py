@@ -0,0 +1,144 @@
+"""Small ordered edits to the server-side copy of the canvas editor state.
+
+The browser keeps the canvas as ``{"blocks": {id: block}, "connections":
+[connection]}``, the same shape that export and template saving send.
+Instead of resending all of it after every edit, the editor sends a list
+of operations against the version it last saw::
+
+    {"op": "add_block", "id": "b1", "block": {...}}
+    {"op": "remove_block", "id": "b1"}
+    {"op": "set", "id": "b1", "path": "config/parameters/chunk_size", "value": 500}
+    {"op": "unset", "id": "b1", "path": "config/parameters/chunk_size"}
+    {"op": "add_connection", "connection": {"source": "b1", "target": "b2"}}
+    {"op": "remove_connection", "connection": {"source": "b1", "target": "b2"}}
+    {"op": "replace", "blocks": {...}, "connections": [...]}
+
+Operations are applied in order and all-or-nothing; ``path`` uses JSON
+Pointer style segments (``/`` separated, ``~1`` and ``~0`` escapes).
+"""
+
+import copy
+
+
+class VersionConflict(Exception):
+    """The operations were based on an older version of the document."""
+
+    def __init__(self, version):
+        super().__init__(f"Canvas is at version {version}")
+        self.version = version
+
+
+def empty_document():
+    return {"version": 0, "blocks": {}, "connections": []}
+
+
+def _segments(path):
+    if isinstance(path, list):
+        return [str(s) for s in path]
+    parts = str(path).strip("/").split("/")
+    return [p.replace("~1", "/").replace("~0", "~") for p in parts if p != ""]
+
+
+def _container(block, segments, create):
+    """The dict holding the last segment of ``segments`` inside a block."""
+    node = block
+    for segment in segments[:-1]:
+        child = node.get(segment) if isinstance(node, dict) else None
+        if child is None and create:
+            child = node[segment] = {}
+        if not isinstance(child, dict):
+            raise ValueError(f"Path segment {segment!r} is not an object")
+        node = child
+    return node
+
+
+def _matches(connection, pattern):
+    return isinstance(connection, dict) and all(
+        connection.get(key) == value for key, value in pattern.items()
+    )
+
+
+def _touches(connection, block_id):
+    return isinstance(connection, dict) and block_id in (
+        connection.get("source"),
+        connection.get("target"),
+    )
+
+
+def _block(document, op):
+    block_id = op.get("id")
+    if block_id not in document["blocks"]:
+        raise ValueError(f"Unknown block: {block_id}")
+    return document["blocks"][block_id]
+
+
+def apply_operation(document, op):
+    kind = op.get("op")
+    if kind == "add_block":
+        block = op.get("block")
+        if not op.get("id") or not isinstance(block, dict):
+            raise ValueError("add_block needs an id and a block object")
+        document["blocks"][op["id"]] = block
+    elif kind == "remove_block":
+        _block(document, op)
+        del document["blocks"][op["id"]]
+        # Connections can't outlive their blocks
+        document["connections"] = [
+            c for c in document["connections"] if not _touches(c, op["id"])
+        ]
+    elif kind in ("set", "unset"):
+        segments = _segments(op.get("path", ""))
+        if not segments:
+            raise ValueError(f"{kind} needs a non-empty path")
+        block = _block(document, op)
+        container = _container(block, segments, create=kind == "set")
+        if kind == "set":
+            if "value" not in op:
+                raise ValueError("set needs a value")
+            container[segments[-1]] = op["value"]
+        else:
+            container.pop(segments[-1], None)
+    elif kind == "add_connection":
+        connection = op.get("connection")
+        if not isinstance(connection, dict) or not connection.get("source"):
+            raise ValueError("add_connection needs a connection with a source")
+        if connection not in document["connections"]:
+            document["connections"].append(connection)
+    elif kind == "remove_connection":
+        pattern = op.get("connection")
+        if not isinstance(pattern, dict) or not pattern:
+            raise ValueError("remove_connection needs a connection to match")
+        document["connections"] = [
+            c for c in document["connections"] if not _matches(c, pattern)
+        ]
+    elif kind == "replace":
+        blocks, connections = op.get("blocks", {}), op.get("connections", [])
+        if not isinstance(blocks, dict) or not isinstance(connections, list):
+            raise ValueError("replace needs a blocks object and a connections list")
+        if not all(isinstance(block, dict) for block in blocks.values()):
+            raise ValueError("replace needs every block to be an object")
+        if not all(isinstance(c, dict) and c.get("source") for c in connections):
+            raise ValueError("replace needs every connection to have a source")
+        document["blocks"], document["connections"] = blocks, connections
+    else:
+        raise ValueError(f"Unknown operation: {kind!r}")
+
+
+def apply_operations(document, ops):
+    """Return a new document with ``ops`` applied and its version bumped.
+
+    Raises ValueError, naming the failing operation, without changing
+    ``document`` if any operation is invalid.
+    """
+    if not isinstance(ops, list):
+        raise ValueError("ops must be a list")
+    updated = copy.deepcopy(document)
+    for position, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise ValueError(f"Operation {position} is not an object")
+        try:
+            apply_operation(updated, op)
+        except ValueError as e:
+            raise ValueError(f"Operation {position} ({op.get('op')}): {e}") from e
+    updated["version"] = document.get("version", 0) + 1
+    return updated
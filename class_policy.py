@@ -0,0 +1,67 @@
+"""Which classes blocks may import and instantiate.
+
+A block names a module and a class that a sandbox worker imports and
+calls with parameters from the browser, and some built-in blocks take
+further class paths as parameters. Only the libraries shown in the block
+catalog are allowed, minus their modules that run code or commands they
+are given (tools, agents, utilities such as a Python REPL).
+"""
+
+import importlib
+import inspect
+
+# The libraries offered in the custom block catalog
+ALLOWED_LIBRARIES = (
+    "langchain_community",
+    "langchain_core",
+    "langchain_openai",
+    "langchain_anthropic",
+    "langchain_google_genai",
+    "langchain_pinecone",
+    "langchain_chroma",
+    "langchain_text_splitters",
+    "langchain_huggingface",
+    "builtin_blocks",
+)
+
+# Module path segments that are never allowed, even in those libraries
+BLOCKED_SEGMENTS = ("tools", "agents", "agent_toolkits", "utilities")
+
+
+def check_module(module_path):
+    """Raise ValueError unless blocks may import ``module_path``."""
+    if not isinstance(module_path, str):
+        raise ValueError("Module path must be a string")
+    segments = module_path.split(".")
+    if segments[0] not in ALLOWED_LIBRARIES:
+        raise ValueError(f"Module {module_path!r} is not in an allowed library")
+    if not all(s.isidentifier() and not s.startswith("_") for s in segments):
+        raise ValueError(f"Invalid module path: {module_path!r}")
+    if any(s in BLOCKED_SEGMENTS for s in segments):
+        raise ValueError(f"Classes from {module_path!r} are not allowed in blocks")
+
+
+def check_class(module_path, class_name):
+    """Raise ValueError unless ``module_path.class_name`` may be used."""
+    check_module(module_path)
+    if not isinstance(class_name, str):
+        raise ValueError("Class name must be a string")
+    if not class_name.isidentifier() or class_name.startswith("_"):
+        raise ValueError(f"Invalid class name: {class_name!r}")
+
+
+def load_class(module_path, class_name):
+    """Import an allowed class; raises ValueError for anything else."""
+    check_class(module_path, class_name)
+    cls = getattr(importlib.import_module(module_path), class_name, None)
+    if not inspect.isclass(cls):
+        raise ValueError(f"{module_path}.{class_name} is not a class")
+    return cls
+
+
+def load_class_path(path):
+    """Like ``load_class`` for a dotted ``module.Class`` string."""
+    if not isinstance(path, str):
+        raise ValueError("Class path must be a string")
+    module_path, _, class_name = path.rpartition(".")
+    return load_class(module_path, class_name)
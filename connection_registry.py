@@ -0,0 +1,96 @@
+"""Block connections from ``/api/connect``, kept per session with limits.
+
+Each session (or canvas owner) has its own bounded set of connections;
+the oldest connection is dropped when a session reaches its limit, the
+least recently used session when there are too many sessions, and a
+background sweeper removes sessions that have been idle for too long.
+Memory use and response size therefore stay flat however long the
+server runs.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ConnectionRegistry:
+    """Bounded, session-scoped map of connection id to connection."""
+
+    def __init__(self, max_sessions=1000, max_per_session=500, idle_seconds=6 * 3600):
+        self.max_sessions = max_sessions
+        self.max_per_session = max_per_session
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # owner -> [last_used, OrderedDict(connection_id -> connection)]
+        self._sessions = OrderedDict()
+        self._evicted_connections = 0
+        self._evicted_sessions = 0
+
+    def _session(self, owner):
+        entry = self._sessions.get(owner)
+        if entry is None:
+            entry = self._sessions[owner] = [0.0, OrderedDict()]
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted_sessions += 1
+        entry[0] = time.monotonic()
+        self._sessions.move_to_end(owner)
+        return entry[1]
+
+    def add(self, owner, connection_id, connection):
+        with self._lock:
+            connections = self._session(owner)
+            connections[connection_id] = connection
+            connections.move_to_end(connection_id)
+            while len(connections) > self.max_per_session:
+                connections.popitem(last=False)
+                self._evicted_connections += 1
+
+    def get(self, owner):
+        """A copy of one session's connections."""
+        with self._lock:
+            if owner not in self._sessions:
+                return {}
+            return dict(self._session(owner))
+
+    def sweep(self):
+        """Drop sessions idle for longer than ``idle_seconds``; returns how many."""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [
+                owner for owner, (used, _) in self._sessions.items() if used < cutoff
+            ]
+            for owner in idle:
+                del self._sessions[owner]
+            self._evicted_sessions += len(idle)
+        return len(idle)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "connections": sum(len(c) for _, c in self._sessions.values()),
+                "evicted_sessions": self._evicted_sessions,
+                "evicted_connections": self._evicted_connections,
+                "max_sessions": self.max_sessions,
+                "max_per_session": self.max_per_session,
+                "idle_seconds": self.idle_seconds,
+            }
+
+
+def start_sweeper(registry, interval):
+    """Sweep idle sessions from ``registry`` every ``interval`` seconds."""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                swept = registry.sweep()
+                if swept:
+                    print(f"Dropped connections of {swept} idle sessions")
+            except Exception as e:
+                print(f"Connection sweep failed: {e}")
+
+    thread = threading.Thread(target=loop, name="connection-sweeper", daemon=True)
+    thread.start()
+    return thread
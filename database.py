@@ -0,0 +1,86 @@
+"""Engine settings for the app database.
+
+The default database is ``instance/app.db`` written by several gunicorn
+workers at once. SQLite connections get WAL journaling, so readers don't
+block the writer and vice versa, ``synchronous=NORMAL``, which only
+syncs at checkpoints instead of on every commit (safe in WAL mode), and
+a busy timeout, so a writer waits for the lock instead of failing with
+"database is locked". Server databases set through ``DATABASE_URL`` get
+a checked, recycled connection pool instead.
+"""
+
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+SQLITE_DEFAULTS = {
+    "SQLITE_JOURNAL_MODE": "WAL",
+    "SQLITE_SYNCHRONOUS": "NORMAL",
+    "SQLITE_BUSY_TIMEOUT_MS": 10000,
+}
+POOL_DEFAULTS = {
+    "DB_POOL_SIZE": 5,
+    "DB_MAX_OVERFLOW": 10,
+    "DB_POOL_RECYCLE": 1800,
+}
+
+
+def normalize_uri(uri):
+    """Accept the ``postgres://`` scheme some hosts hand out."""
+    if uri.startswith("postgres://"):
+        return "postgresql://" + uri[len("postgres://") :]
+    return uri
+
+
+def _setting(config, key):
+    defaults = {**SQLITE_DEFAULTS, **POOL_DEFAULTS}
+    return config.get(key, defaults[key])
+
+
+def engine_options(config):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for the configured database URI."""
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return {}
+        # The busy timeout is set with a pragma on connect, see set_pragmas
+        return {"pool_size": int(_setting(config, "DB_POOL_SIZE"))}
+    return {
+        "pool_pre_ping": True,
+        "pool_size": int(_setting(config, "DB_POOL_SIZE")),
+        "max_overflow": int(_setting(config, "DB_MAX_OVERFLOW")),
+        "pool_recycle": int(_setting(config, "DB_POOL_RECYCLE")),
+    }
+
+
+def sqlite_pragmas(config):
+    return {
+        "journal_mode": str(_setting(config, "SQLITE_JOURNAL_MODE")).upper(),
+        "synchronous": str(_setting(config, "SQLITE_SYNCHRONOUS")).upper(),
+        "busy_timeout": int(_setting(config, "SQLITE_BUSY_TIMEOUT_MS")),
+    }
+
+
+def set_pragmas(dbapi_connection, pragmas):
+    """Apply ``pragmas`` to a new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout first so switching the journal mode can wait too
+        for name in ("busy_timeout", "journal_mode", "synchronous"):
+            if name in pragmas:
+                cursor.execute(f"PRAGMA {name}={pragmas[name]}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine, config):
+    """Set the SQLite pragmas on every connection ``engine`` opens."""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            set_pragmas(dbapi_connection, pragmas)
@@ -0,0 +1,111 @@
+"""Near-duplicate detection for text chunks with MinHash and LSH.
+
+Each chunk is reduced to a MinHash signature of its character shingles,
+whose agreement between two chunks estimates their Jaccard similarity.
+Signatures are cut into bands and hashed into buckets (locality-sensitive
+hashing), so only chunks sharing a bucket are compared instead of every
+pair. Candidates whose estimated similarity reaches the threshold are
+grouped, and each group keeps its first chunk.
+"""
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+# Multiplier of the rolling hash over a shingle's code points
+SHINGLE_BASE = np.uint64(0x100000001B3)
+
+
+def shingle_hashes(text, size=5):
+    """Distinct 64-bit hashes of the character ``size``-grams of the text.
+
+    The text is normalized and lowercased first. Hashes are computed for
+    all windows at once from the code points, with wrapping uint64
+    arithmetic, instead of building a string per shingle.
+    """
+    text = normalize_text(text).casefold()
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if not len(codes):
+        return codes
+    size = min(size, len(codes))
+    windows = len(codes) - size + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * SHINGLE_BASE + codes[offset : offset + windows]
+    return np.unique(hashes)
+
+
+def lsh_bands(num_perm, threshold):
+    """``(bands, rows)`` whose S-curve ``(1/b) ** (1/r)`` is closest to threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures from ``num_perm`` seeded hash functions.
+
+    Each function is a multiply-shift hash, ``(a * h + b) >> 32`` with
+    odd ``a`` in wrapping 64-bit arithmetic, applied to the shingle hashes.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * 2 + 1
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not len(hashes):
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+        permuted = (np.multiply.outer(hashes, self._a) + self._b) >> np.uint64(32)
+        return permuted.min(axis=0)
+
+
+def near_duplicate_groups(texts, threshold=0.8, num_perm=128, shingle_size=5):
+    """Map each text's index to the index of the first text it duplicates.
+
+    Texts that aren't a near-duplicate of an earlier text map to themselves.
+    """
+    hasher = MinHasher(num_perm, shingle_size)
+    signatures = np.stack([hasher.signature(text) for text in texts]) if texts else []
+    bands, rows = lsh_bands(num_perm, threshold)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    compared = set()
+    for band in range(bands):
+        buckets = {}
+        for i in range(len(texts)):
+            key = signatures[i, band * rows : (band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for position, other in enumerate(members[1:], 1):
+                # Compare against earlier chunks until one matches; repeated
+                # boilerplate matches the first one right away
+                for earlier in members[:position]:
+                    if find(earlier) == find(other):
+                        break
+                    if (earlier, other) in compared:
+                        continue
+                    compared.add((earlier, other))
+                    if np.mean(signatures[earlier] == signatures[other]) >= threshold:
+                        # The earlier group's first chunk stays the representative
+                        a, b = find(earlier), find(other)
+                        parent[max(a, b)] = min(a, b)
+                        break
+    return [find(i) for i in range(len(texts))]
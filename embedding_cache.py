@@ -0,0 +1,230 @@
+"""Persistent embedding cache keyed by model and normalized chunk text.
+
+Every model gets its own directory holding two append-only files:
+``vectors.f32`` (a float32 matrix, read memory-mapped) and ``keys.bin``
+(the 32-byte SHA-256 of each row's normalized text, in row order). Rows
+are never rewritten, so readers in other processes only ever have to
+pick up new rows at the end; the one exception is a torn tail left by an
+interrupted append, which the next append cuts off before writing.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends are only serialized within one process
+    fcntl = None
+
+KEY_SIZE = 32
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Normalize chunk text so trivially different copies share a key."""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+
+def model_dir_name(model_id):
+    """A filesystem-safe, collision-free directory name for a model id."""
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_id)[:60]
+    return f"{slug}-{hashlib.sha256(model_id.encode()).hexdigest()[:12]}"
+
+
+class EmbeddingCache:
+    """Append-only vector store for one embedding model."""
+
+    def __init__(self, root, model_id):
+        self.model_id = model_id
+        self.path = os.path.join(root, model_dir_name(model_id))
+        os.makedirs(self.path, exist_ok=True)
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._keys_path = os.path.join(self.path, "keys.bin")
+        self._meta_path = os.path.join(self.path, "meta.json")
+        self._lock = threading.Lock()
+        self._index = {}
+        self._keys_read = 0
+        self.dim = self._read_meta().get("dim")
+
+    def _read_meta(self):
+        if not os.path.exists(self._meta_path):
+            return {}
+        with open(self._meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, **updates):
+        meta = {**self._read_meta(), "model_id": self.model_id, **updates}
+        # A private temp file per writer, so concurrent writers can't mix bytes
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix="meta.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp, self._meta_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _refresh(self):
+        """Index rows appended since the last look, by us or another process."""
+        if not os.path.exists(self._keys_path):
+            return
+        size = os.path.getsize(self._keys_path)
+        complete = size - size % KEY_SIZE
+        if complete < self._keys_read:
+            # Cut back after an interrupted append; index from scratch
+            self._index, self._keys_read = {}, 0
+        if complete <= self._keys_read:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_read)
+            data = f.read(complete - self._keys_read)
+        row = self._keys_read // KEY_SIZE
+        for start in range(0, len(data), KEY_SIZE):
+            self._index.setdefault(data[start : start + KEY_SIZE], row)
+            row += 1
+        self._keys_read = complete
+        if self.dim is None:
+            self.dim = self._read_meta().get("dim")
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def lookup(self, keys):
+        """Return ``(rows, missing)``: row numbers for hits, indexes of misses."""
+        with self._lock:
+            self._refresh()
+            rows = [self._index.get(key) for key in keys]
+        return rows, [i for i, row in enumerate(rows) if row is None]
+
+    def vectors(self, rows):
+        """Read the given rows from the memory-mapped matrix."""
+        if not rows:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r").reshape(
+            -1, self.dim
+        )
+        return np.asarray(matrix[rows])
+
+    def append(self, keys, vectors):
+        """Add new rows; keys another process added first are skipped."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        with self._lock, open(self._keys_path, "ab") as keys_file:
+            if fcntl is not None:
+                fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    self._write_meta(dim=self.dim)
+                self._repair()
+                fresh = [i for i, key in enumerate(keys) if key not in self._index]
+                if not fresh:
+                    return
+                # Vectors go first so every key on disk has its row
+                with open(self._vectors_path, "ab") as vectors_file:
+                    vectors_file.write(vectors[fresh].tobytes())
+                keys_file.write(b"".join(keys[i] for i in fresh))
+                keys_file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+    def _repair(self):
+        """Cut both files back to the rows they both hold completely.
+
+        A key's row is its position in ``keys.bin``, so a vector written by
+        an append that died before writing its key would shift every later
+        row. Called with the append lock held.
+        """
+        row_bytes = self.dim * 4
+        key_bytes = os.path.getsize(self._keys_path)
+        vector_bytes = (
+            os.path.getsize(self._vectors_path)
+            if os.path.exists(self._vectors_path)
+            else 0
+        )
+        rows = min(key_bytes // KEY_SIZE, vector_bytes // row_bytes)
+        if vector_bytes != rows * row_bytes:
+            os.truncate(self._vectors_path, rows * row_bytes)
+        if key_bytes != rows * KEY_SIZE:
+            os.truncate(self._keys_path, rows * KEY_SIZE)
+            self._refresh()
+
+    def record_speed(self, seconds_per_text):
+        """Keep a running average of how long one text takes to embed."""
+        previous = self._read_meta().get("seconds_per_text")
+        if previous is not None:
+            seconds_per_text = 0.8 * previous + 0.2 * seconds_per_text
+        self._write_meta(seconds_per_text=seconds_per_text)
+
+    def seconds_per_text(self):
+        return self._read_meta().get("seconds_per_text")
+
+
+def embed_with_cache(cache, texts, embed_batch, batch_size=64):
+    """Embed ``texts`` using the cache and ``embed_batch`` for the misses.
+
+    Returns ``(matrix, stats)`` with one float32 row per input text.
+    """
+    started = time.perf_counter()
+    keys = [text_key(text) for text in texts]
+    rows, missing = cache.lookup(keys)
+
+    # Identical texts in one call are only embedded once
+    unique = {}
+    for i in missing:
+        unique.setdefault(keys[i], i)
+    to_embed = list(unique.values())
+
+    compute_seconds = 0.0
+    new_vectors = {}
+    for start in range(0, len(to_embed), batch_size):
+        batch = to_embed[start : start + batch_size]
+        t0 = time.perf_counter()
+        vectors = np.asarray(embed_batch([texts[i] for i in batch]), dtype=np.float32)
+        compute_seconds += time.perf_counter() - t0
+        cache.append([keys[i] for i in batch], vectors)
+        for i, vector in zip(batch, vectors):
+            new_vectors[keys[i]] = vector
+
+    if to_embed:
+        cache.record_speed(compute_seconds / len(to_embed))
+
+    hit_rows = [row for row in rows if row is not None]
+    hit_vectors = iter(cache.vectors(hit_rows))
+    result = np.empty((len(texts), cache.dim or 0), dtype=np.float32)
+    for i, row in enumerate(rows):
+        result[i] = next(hit_vectors) if row is not None else new_vectors[keys[i]]
+
+    hits = len(texts) - len(missing)
+    per_text = cache.seconds_per_text() or 0.0
+    stats = {
+        "texts": len(texts),
+        "hits": hits,
+        "misses": len(missing),
+        "embedded": len(to_embed),
+        "hit_rate": hits / len(texts) if texts else None,
+        "compute_seconds": compute_seconds,
+        "estimated_seconds_saved": (len(texts) - len(to_embed)) * per_text,
+        "total_seconds": time.perf_counter() - started,
+    }
+    return result, stats
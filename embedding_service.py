@@ -0,0 +1,345 @@
+"""Embedding sidecar that batches concurrent requests across pipeline runs.
+
+Each pipeline run executes in its own sandbox worker, so runs can't share
+a model in memory. Instead they send texts to this service, which queues
+requests per model and runs the model once for each dynamically sized
+batch: a batch is closed when it reaches ``max_batch_size`` texts or when
+its oldest request has waited ``max_wait_ms``.
+
+Run it next to the web app with::
+
+    EMBEDDING_SERVICE_AUTHKEY=<secret> EMBEDDING_SERVICE_ADDRESS=127.0.0.1:8765 \
+        python embedding_service.py
+
+Requests are pickled, so the service refuses to start without a private
+``EMBEDDING_SERVICE_AUTHKEY``, and it only loads the embeddings classes
+and models in ``EMBEDDING_SERVICE_CLASSES`` / ``EMBEDDING_SERVICE_MODELS``
+(comma-separated; ``*`` allows any model of an allowed class).
+"""
+
+import importlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+# Models the service may load unless EMBEDDING_SERVICE_CLASSES/_MODELS say otherwise
+DEFAULT_ALLOWED_CLASSES = (
+    "langchain_community.embeddings.HuggingFaceEmbeddings",
+    "langchain_huggingface.HuggingFaceEmbeddings",
+)
+DEFAULT_ALLOWED_MODELS = ("sentence-transformers/all-MiniLM-L6-v2",)
+
+
+def parse_address(address):
+    """``host:port`` becomes a TCP address; anything else a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def _authkey():
+    # Connections exchange pickles, so the key is what keeps strangers out
+    key = os.environ.get("EMBEDDING_SERVICE_AUTHKEY")
+    if not key:
+        raise RuntimeError(
+            "EMBEDDING_SERVICE_AUTHKEY must be set to a private value on both "
+            "the embedding service and the web app"
+        )
+    return key.encode()
+
+
+def _allowlist(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return frozenset(default)
+    return frozenset(item.strip() for item in value.split(",") if item.strip())
+
+
+def _load_model(embeddings_class, model_name):
+    module_path, _, class_name = embeddings_class.rpartition(".")
+    cls = getattr(importlib.import_module(module_path), class_name)
+    return cls(model_name=model_name)
+
+
+class DynamicBatcher:
+    """Merge concurrent embedding requests into batches for one model."""
+
+    def __init__(self, embed_batch, max_batch_size=64, max_wait_ms=10):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._histogram = {}
+        self._batches = 0
+        self._texts = 0
+        self._compute_seconds = 0.0
+        self._max_queue_depth = 0
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """Queue ``texts``; the future resolves to a float32 matrix."""
+        future = Future()
+        if not texts:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+            return future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Embedding batcher is closed")
+            self._queue.append((list(texts), future, time.monotonic()))
+            self._max_queue_depth = max(self._max_queue_depth, self._queued_texts())
+            self._cond.notify()
+        return future
+
+    def _queued_texts(self):
+        return sum(len(texts) for texts, _, _ in self._queue)
+
+    def _next_batch(self):
+        """Block until a batch is due, then pop its requests."""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            deadline = self._queue[0][2] + self.max_wait
+            while (
+                self._queued_texts() < self.max_batch_size
+                and not self._closed
+                and time.monotonic() < deadline
+            ):
+                self._cond.wait(deadline - time.monotonic())
+
+            batch, size = [], 0
+            while self._queue:
+                texts = self._queue[0][0]
+                # A request is never split, but an oversized one runs alone
+                if batch and size + len(texts) > self.max_batch_size:
+                    break
+                batch.append(self._queue.popleft())
+                size += len(texts)
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            texts = [text for request_texts, _, _ in batch for text in request_texts]
+            started = time.perf_counter()
+            try:
+                vectors = np.asarray(self.embed_batch(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            start = 0
+            for request_texts, future, _ in batch:
+                future.set_result(vectors[start : start + len(request_texts)])
+                start += len(request_texts)
+
+            with self._cond:
+                bucket = 1 << (len(texts) - 1).bit_length()
+                self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+                self._batches += 1
+                self._texts += len(texts)
+                self._compute_seconds += elapsed
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": self._queued_texts(),
+                "queued_requests": len(self._queue),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "texts": self._texts,
+                "mean_batch_size": self._texts / self._batches if self._batches else 0,
+                "batch_size_histogram": {
+                    f"<={bucket}": count
+                    for bucket, count in sorted(self._histogram.items())
+                },
+                "compute_seconds": self._compute_seconds,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class EmbeddingServer:
+    """Serve embedding requests for any number of models over one socket."""
+
+    def __init__(
+        self,
+        address,
+        max_batch_size=64,
+        max_wait_ms=10,
+        authkey=None,
+        allowed_classes=None,
+        allowed_models=None,
+    ):
+        self.address = parse_address(address)
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.authkey = authkey or _authkey()
+        self.allowed_classes = frozenset(allowed_classes or DEFAULT_ALLOWED_CLASSES)
+        self.allowed_models = frozenset(allowed_models or DEFAULT_ALLOWED_MODELS)
+        # (class, model) -> Future resolving to its DynamicBatcher
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def _check_allowed(self, embeddings_class, model_name):
+        if embeddings_class not in self.allowed_classes:
+            raise ValueError(f"Embeddings class not allowed: {embeddings_class}")
+        if "*" not in self.allowed_models and model_name not in self.allowed_models:
+            raise ValueError(f"Model not allowed: {model_name}")
+
+    def batcher(self, embeddings_class, model_name):
+        self._check_allowed(embeddings_class, model_name)
+        key = (embeddings_class, model_name)
+        with self._lock:
+            future = self._batchers.get(key)
+            loading = future is None
+            if loading:
+                future = self._batchers[key] = Future()
+        if loading:
+            # Loaded outside the lock so other models and stats() aren't blocked
+            try:
+                model = _load_model(embeddings_class, model_name)
+                future.set_result(
+                    DynamicBatcher(
+                        model.embed_documents, self.max_batch_size, self.max_wait_ms
+                    )
+                )
+            except Exception as e:
+                with self._lock:
+                    del self._batchers[key]
+                future.set_exception(e)
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            futures = dict(self._batchers)
+        return {
+            f"{cls}:{model}": future.result().stats()
+            for (cls, model), future in futures.items()
+            if future.done() and future.exception() is None
+        }
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if not isinstance(message, dict):
+                        raise ValueError("Malformed request")
+                    if message["op"] == "embed":
+                        batcher = self.batcher(message["class"], message["model"])
+                        reply = {"vectors": batcher.submit(message["texts"]).result()}
+                    elif message["op"] == "stats":
+                        reply = {"stats": self.stats()}
+                    else:
+                        reply = {"error": f"Unknown operation: {message['op']}"}
+                except Exception as e:
+                    reply = {"error": str(e)}
+                conn.send(reply)
+
+    def serve_forever(self):
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"Embedding service listening on {listener.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Failed handshakes shouldn't take the service down
+                    print(f"Rejected embedding client: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+class EmbeddingClient:
+    """LangChain-style embeddings backed by the batching service."""
+
+    def __init__(self, address, embeddings_class, model_name, authkey=None):
+        self.address = parse_address(address)
+        self.embeddings_class = embeddings_class
+        self.model_name = model_name
+        self.authkey = authkey or _authkey()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _request(self, message):
+        with self._lock:
+            for attempt in range(2):
+                if self._conn is None:
+                    self._conn = Client(self.address, authkey=self.authkey)
+                try:
+                    self._conn.send(message)
+                    reply = self._conn.recv()
+                    break
+                except (EOFError, OSError):
+                    # The service restarted; reconnect once
+                    self._conn = None
+                    if attempt:
+                        raise
+        if "error" in reply:
+            raise RuntimeError(f"Embedding service error: {reply['error']}")
+        return reply
+
+    def embed_array(self, texts):
+        return self._request(
+            {
+                "op": "embed",
+                "class": self.embeddings_class,
+                "model": self.model_name,
+                "texts": list(texts),
+            }
+        )["vectors"]
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+    def stats(self):
+        return self._request({"op": "stats"})["stats"]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def main():
+    server = EmbeddingServer(
+        os.environ.get("EMBEDDING_SERVICE_ADDRESS", "127.0.0.1:8765"),
+        max_batch_size=int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", 64)),
+        max_wait_ms=float(os.environ.get("EMBEDDING_MAX_WAIT_MS", 10)),
+        allowed_classes=_allowlist(
+            "EMBEDDING_SERVICE_CLASSES", DEFAULT_ALLOWED_CLASSES
+        ),
+        allowed_models=_allowlist("EMBEDDING_SERVICE_MODELS", DEFAULT_ALLOWED_MODELS),
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
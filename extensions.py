@@ -2,13 +2,21 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
 
+from database import configure_engine, engine_options, normalize_uri
+
 db = SQLAlchemy()
 login_manager = LoginManager()
 mail = Mail()
 
 
 def init_app(app):
+    app.config["SQLALCHEMY_DATABASE_URI"] = normalize_uri(
+        app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
     db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
     login_manager.init_app(app)
     mail.init_app(app)
 
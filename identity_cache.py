@@ -0,0 +1,125 @@
+"""Short-lived cache of the logged-in user for flask_login's user_loader.
+
+Every authenticated request, including each ``/api/langchain/*`` call of
+the custom block modal, loads ``current_user``. The request path only
+needs the id and the active and admin flags, so workers keep those in a
+small in-process cache for ``ttl`` seconds instead of querying the user
+table each time. Admin edits, toggles and deletes call ``invalidate``,
+which drops the entry here and bumps a version file under instance/;
+other workers check that file at most every ``check_interval`` seconds
+and clear their cache when it changed.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from models import User, db
+from settings_cache import bump_version, version_signature
+
+
+class CachedIdentity:
+    """The parts of a User that ``current_user`` is used for."""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, is_active, is_admin):
+        self.id = id
+        self.is_active = is_active
+        self.is_admin = is_admin
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if hasattr(other, "get_id"):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __hash__(self):
+        # Equal identities have equal ids, as __eq__ compares them
+        return hash(self.get_id())
+
+    def __repr__(self):
+        return f"<CachedIdentity {self.id}>"
+
+
+class IdentityCache:
+    """Per-worker map of user id to CachedIdentity with a TTL."""
+
+    def __init__(self, ttl=30.0, max_size=10000, version_path=None, check_interval=1.0):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.version_path = version_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # user id -> (loaded_at, CachedIdentity), least recently used first
+        self._entries = OrderedDict()
+        self._signature = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.ttl = app.config["IDENTITY_CACHE_TTL"]
+        self.max_size = app.config["IDENTITY_CACHE_SIZE"]
+        self.version_path = app.config["IDENTITY_VERSION_PATH"]
+        self.check_interval = app.config["IDENTITY_CHECK_INTERVAL"]
+        self._signature = version_signature(self.version_path)
+
+    def _check_version(self, now):
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        signature = version_signature(self.version_path)
+        with self._lock:
+            if signature != self._signature:
+                self._signature = signature
+                self._entries.clear()
+
+    def _load(self, user_id):
+        row = (
+            db.session.query(User.id, User.is_active, User.is_admin)
+            .filter(User.id == user_id)
+            .first()
+        )
+        if row is None:
+            return None
+        return CachedIdentity(row.id, bool(row.is_active), bool(row.is_admin))
+
+    def get(self, user_id):
+        """The identity of ``user_id``, or None if there is no such user."""
+        if self.ttl <= 0:
+            return self._load(user_id)
+        now = time.monotonic()
+        self._check_version(now)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        identity = self._load(user_id)
+        if identity is not None:
+            with self._lock:
+                self._entries[user_id] = (now, identity)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id=None):
+        """Forget ``user_id`` (or everyone) here and in the other workers."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+        if self.version_path:
+            bump_version(self.version_path)
+
+
+user_identity_cache = IdentityCache()
@@ -0,0 +1,205 @@
+"""Parallel PDF text extraction with a per-file content-hash cache.
+
+Page ranges of every uncached file in a batch go to one process pool, so
+a batch of small PDFs is parsed in parallel just like one large PDF. The
+pool is shared by all batches in a process and started on first use.
+"""
+
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyPDF2 import PdfReader
+
+# Batches with fewer uncached pages than this are parsed in the calling
+# process, where starting workers would cost more than it saves
+MIN_PAGES_FOR_POOL = 4
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _extract_range(path, start, stop):
+    """Extract the text of pages ``start`` to ``stop`` of one PDF."""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _pool_context():
+    # Never fork: the web process runs threads whose locks a forked child
+    # could inherit while held. A fork server starts clean and keeps
+    # PyPDF2 imported, so workers after the first start quickly.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["PyPDF2"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+# Process pools by worker count, kept for the life of the process
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(workers, replace=False):
+    """The shared pool with ``workers`` processes; a new one if ``replace``."""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None or replace:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=_pool_context()
+            )
+        return pool
+
+
+def _map_ranges(workers, tasks):
+    """Run ``_extract_range`` over ``tasks`` in the shared pool, in order."""
+    for attempt in range(2):
+        executor = _pool(workers, replace=attempt > 0)
+        try:
+            futures = [executor.submit(_extract_range, *task) for task in tasks]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool once
+            if attempt:
+                raise
+
+
+class PDFIngestService:
+    """Extract PDF pages across a process pool and cache them by content hash.
+
+    An unchanged PDF is never parsed twice: the cache file is named after
+    the SHA-256 of the PDF, so renaming or copying a file still hits it.
+    """
+
+    def __init__(self, cache_root, workers=None, pages_per_task=8):
+        self.cache_root = cache_root
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        os.makedirs(cache_root, exist_ok=True)
+
+    def _cache_path(self, content_hash):
+        return os.path.join(self.cache_root, content_hash[:2], content_hash + ".jsonl")
+
+    def _read_cache(self, content_hash):
+        path = self._cache_path(content_hash)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line)["text"] for line in f]
+
+    def _write_cache(self, content_hash, pages):
+        path = self._cache_path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for number, text in enumerate(pages):
+                f.write(json.dumps({"page": number, "text": text}) + "\n")
+        os.replace(tmp, path)
+
+    def _ranges(self, page_counts):
+        """Split the pages of every file into ``(index, start, stop)`` tasks.
+
+        Tasks are at most ``pages_per_task`` pages, and smaller when that
+        is needed to give every worker something to do.
+        """
+        total = sum(page_counts.values())
+        size = max(1, min(self.pages_per_task, math.ceil(total / self.workers)))
+        return [
+            (index, start, min(start + size, count))
+            for index, count in page_counts.items()
+            for start in range(0, count, size)
+        ]
+
+    def extract(self, paths):
+        """Return ``(results, stats)`` for a list of PDF paths.
+
+        Each result is ``{"source", "hash", "pages", "cached"}`` where
+        ``pages`` is the list of page texts in order. A path given more than
+        once is only returned once, and files with the same content are
+        only parsed once.
+        """
+        started = time.perf_counter()
+        unique = {}
+        for path in paths:
+            unique.setdefault(os.path.realpath(path), path)
+
+        results = []
+        page_counts = {}  # index in results -> pages to parse
+        first_by_hash = {}  # content hash -> index of the result parsing it
+        copies = {}  # index in results -> index of the result with its pages
+        for path in unique.values():
+            content_hash = file_hash(path)
+            pages = self._read_cache(content_hash)
+            if pages is None:
+                if content_hash in first_by_hash:
+                    copies[len(results)] = first_by_hash[content_hash]
+                else:
+                    first_by_hash[content_hash] = len(results)
+                    page_counts[len(results)] = len(PdfReader(path).pages)
+            results.append(
+                {
+                    "source": path,
+                    "hash": content_hash,
+                    "pages": pages,
+                    "cached": pages is not None,
+                }
+            )
+
+        parsed_pages = sum(page_counts.values())
+        ranges = self._ranges(page_counts)
+        if self.workers > 1 and len(ranges) > 1 and parsed_pages >= MIN_PAGES_FOR_POOL:
+            texts = _map_ranges(
+                self.workers,
+                [
+                    (results[index]["source"], start, stop)
+                    for index, start, stop in ranges
+                ],
+            )
+        else:
+            texts = [
+                _extract_range(results[index]["source"], start, stop)
+                for index, start, stop in ranges
+            ]
+
+        for index in page_counts:
+            results[index]["pages"] = []
+        # Ranges are in page order within each file
+        for (index, _, _), pages in zip(ranges, texts):
+            results[index]["pages"].extend(pages)
+        for index in page_counts:
+            self._write_cache(results[index]["hash"], results[index]["pages"])
+        for index, source in copies.items():
+            results[index]["pages"] = list(results[source]["pages"])
+
+        seconds = time.perf_counter() - started
+        parse_seconds = seconds if parsed_pages else 0
+        total_pages = sum(len(r["pages"]) for r in results)
+        stats = {
+            "files": len(results),
+            "cached_files": sum(1 for r in results if r["cached"]),
+            "pages": total_pages,
+            "parsed_pages": parsed_pages,
+            "seconds": seconds,
+            "pages_per_second": total_pages / seconds if seconds else None,
+            "parsed_pages_per_second": (
+                parsed_pages / parse_seconds if parse_seconds else None
+            ),
+            "workers": self.workers,
+        }
+        return results, stats
@@ -15,7 +15,12 @@ def init_database():
     is_docker_env = os.environ.get("IS_DOCKER") == "true"
     project_root = os.path.dirname(os.path.abspath(__file__))
 
-    if is_docker_env:
+    if os.environ.get("DATABASE_URL"):
+        # Same override as server.py, e.g. a PostgreSQL server
+        app.config["SQLALCHEMY_DATABASE_URI"] = os.environ["DATABASE_URL"]
+        instance_folder_path = os.path.join(project_root, "instance")
+        print("USING DATABASE_URL from the environment")
+    elif is_docker_env:
         # Docker environment: Use absolute path from container root
         app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:////app/instance/app.db"
         instance_folder_path = "/app/instance"
@@ -53,7 +58,9 @@ def init_database():
         )
 
         # Verification for local execution
-        if not is_docker_env:
+        if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite:///"):
+            print("Not an SQLite file database, skipping the file check.")
+        elif not is_docker_env:
             local_db_file_path = app.config["SQLALCHEMY_DATABASE_URI"].split(
                 "sqlite:///"
             )[-1]
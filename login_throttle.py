@@ -0,0 +1,98 @@
+"""Failed-login limits per username and per client address.
+
+Failed attempts are stored in the ``LoginAttempt`` table, so every worker
+sees the same counts. Within a sliding window of ``window`` seconds a
+username may fail ``AdminPanel.max_login_attempts`` times and an address
+``ip_factor`` times as often (several users can share one address). After
+that the key is locked for ``lockout`` seconds, doubling with each further
+failure up to the window length. The check runs before the password hash
+is computed, so hammering ``/login`` stops costing PBKDF2 time.
+"""
+
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from models import LoginAttempt, db
+from settings_cache import admin_settings_cache
+
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+class LoginThrottle:
+    def __init__(self, window=900, lockout=30, ip_factor=5):
+        self.window = window
+        self.lockout = lockout
+        self.ip_factor = ip_factor
+
+    def init_app(self, app):
+        self.window = app.config["LOGIN_WINDOW_SECONDS"]
+        self.lockout = app.config["LOGIN_LOCKOUT_SECONDS"]
+        self.ip_factor = app.config["LOGIN_IP_ATTEMPT_FACTOR"]
+
+    def max_attempts(self):
+        settings = admin_settings_cache.get()
+        if settings is None or settings.max_login_attempts is None:
+            return DEFAULT_MAX_ATTEMPTS
+        return settings.max_login_attempts
+
+    @staticmethod
+    def _user_key(username):
+        return f"user:{(username or '').strip().lower()[:150]}"
+
+    def _limits(self, username, address, max_attempts):
+        """Failed attempts allowed per key within the window."""
+        limits = {self._user_key(username): max_attempts}
+        if address:
+            limits[f"ip:{address}"] = max_attempts * self.ip_factor
+        return limits
+
+    def retry_after(self, username, address):
+        """Seconds until ``username`` may try again from ``address``; 0 if now."""
+        max_attempts = self.max_attempts()
+        if max_attempts <= 0:
+            return 0
+        limits = self._limits(username, address, max_attempts)
+        now = datetime.utcnow()
+        rows = (
+            db.session.query(
+                LoginAttempt.key,
+                func.count(LoginAttempt.id),
+                func.max(LoginAttempt.created_at),
+            )
+            .filter(
+                LoginAttempt.key.in_(list(limits)),
+                LoginAttempt.created_at >= now - timedelta(seconds=self.window),
+            )
+            .group_by(LoginAttempt.key)
+            .all()
+        )
+        wait = 0
+        for key, failures, last in rows:
+            excess = failures - limits[key]
+            if excess < 0:
+                continue
+            lock = min(self.lockout * 2**excess, self.window)
+            wait = max(wait, (last - now).total_seconds() + lock)
+        return math.ceil(wait) if wait > 0 else 0
+
+    def record_failure(self, username, address):
+        now = datetime.utcnow()
+        for key in self._limits(username, address, 0):
+            db.session.add(LoginAttempt(key=key, created_at=now))
+        # Attempts older than the window no longer count
+        LoginAttempt.query.filter(
+            LoginAttempt.created_at < now - timedelta(seconds=self.window)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def reset(self, username):
+        """Forget a username's failures after it logs in successfully."""
+        LoginAttempt.query.filter_by(key=self._user_key(username)).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+
+
+login_throttle = LoginThrottle()
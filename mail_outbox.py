@@ -0,0 +1,207 @@
+"""Outgoing mail queued in the database and sent in the background.
+
+Requests only add an ``OutboxMessage`` row and return; a sender thread in
+each worker claims due messages, sends them over one SMTP connection with
+a timeout and records the result. A failed message is retried with
+exponential backoff until ``max_attempts``. Claiming a message moves its
+``next_attempt_at`` forward by a lease, so workers never send the same
+message at once, and a message claimed by a worker that died is picked up
+again once the lease has run out. Delivery is at least once: a server
+that accepts a message after the client timed out gets it again on retry.
+
+Bodies can hold reset links, so they are cleared once a message is sent
+or given up on, and finished rows are deleted after ``retention`` seconds.
+"""
+
+import json
+import smtplib
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+
+from extensions import db, mail
+from models import OutboxMessage
+
+DEFAULT_SENDER = "noreply@raggie.com"
+MAX_RETRY_DELAY = 3600
+
+
+class MailOutbox:
+    def __init__(
+        self,
+        batch_size=20,
+        max_attempts=6,
+        retry_seconds=30,
+        lease_seconds=300,
+        timeout=30,
+        retention=7 * 24 * 3600,
+    ):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self.retention = retention
+        self._wake = threading.Event()
+
+    def init_app(self, app):
+        self.max_attempts = app.config["MAIL_MAX_ATTEMPTS"]
+        self.retry_seconds = app.config["MAIL_RETRY_SECONDS"]
+        self.timeout = app.config["MAIL_TIMEOUT"]
+        self.retention = app.config["MAIL_OUTBOX_RETENTION"]
+
+    def enqueue(self, subject, recipients, body, sender=DEFAULT_SENDER):
+        """Queue a message and commit the session; returns the row."""
+        message = OutboxMessage(
+            subject=subject,
+            sender=sender,
+            recipients=json.dumps(list(recipients)),
+            body=body,
+            status="pending",
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+        )
+        db.session.add(message)
+        db.session.commit()
+        self._wake.set()
+        return message
+
+    def _claim(self, now):
+        due = (
+            OutboxMessage.query.filter(
+                OutboxMessage.status.in_(("pending", "sending")),
+                OutboxMessage.next_attempt_at <= now,
+            )
+            .order_by(OutboxMessage.next_attempt_at)
+            .limit(self.batch_size)
+            .all()
+        )
+        lease = now + timedelta(seconds=self.lease_seconds)
+        claimed = []
+        for message in due:
+            # Only one worker's update matches the row as it was read
+            updated = OutboxMessage.query.filter_by(
+                id=message.id,
+                status=message.status,
+                next_attempt_at=message.next_attempt_at,
+            ).update(
+                {"status": "sending", "next_attempt_at": lease},
+                synchronize_session=False,
+            )
+            db.session.commit()
+            if updated:
+                claimed.append(message.id)
+        return [OutboxMessage.query.get(message_id) for message_id in claimed]
+
+    def _connect(self, config):
+        """Like flask_mail's connection, but with a timeout."""
+        if config.use_ssl:
+            host = smtplib.SMTP_SSL(config.server, config.port, timeout=self.timeout)
+        else:
+            host = smtplib.SMTP(config.server, config.port, timeout=self.timeout)
+        if config.use_tls:
+            host.starttls()
+        if config.username and config.password:
+            host.login(config.username, config.password)
+        return host
+
+    def _record(self, message, error=None):
+        now = datetime.utcnow()
+        message.attempts = (message.attempts or 0) + 1
+        if error is None:
+            message.status = "sent"
+            message.sent_at = now
+            message.last_error = None
+            message.body = ""
+        elif message.attempts >= self.max_attempts:
+            message.status = "failed"
+            message.last_error = error
+            message.body = ""
+            print(f"Giving up on mail {message.id} to {message.recipients}: {error}")
+        else:
+            delay = min(
+                self.retry_seconds * 2 ** (message.attempts - 1), MAX_RETRY_DELAY
+            )
+            message.status = "pending"
+            message.next_attempt_at = now + timedelta(seconds=delay)
+            message.last_error = error
+        db.session.commit()
+
+    def send_due(self):
+        """Send the messages that are due; returns ``(sent, failed)`` counts."""
+        messages = self._claim(datetime.utcnow())
+        if not messages:
+            return 0, 0
+        config = current_app.extensions["mail"]
+        sent = failed = 0
+        try:
+            host = None if config.suppress else self._connect(config)
+        except (OSError, smtplib.SMTPException) as e:
+            for message in messages:
+                self._record(message, f"Connecting to SMTP server failed: {e}")
+            return 0, len(messages)
+        try:
+            for message in messages:
+                msg = Message(
+                    message.subject,
+                    sender=message.sender,
+                    recipients=json.loads(message.recipients),
+                    body=message.body,
+                )
+                try:
+                    if host is None:
+                        mail.send(msg)  # Suppressed, e.g. under TESTING
+                    else:
+                        host.sendmail(msg.sender, msg.send_to, msg.as_bytes())
+                except Exception as e:
+                    self._record(message, str(e))
+                    failed += 1
+                else:
+                    self._record(message)
+                    sent += 1
+        finally:
+            if host is not None:
+                try:
+                    host.quit()
+                except (OSError, smtplib.SMTPException):
+                    pass
+        return sent, failed
+
+    def purge(self):
+        """Delete sent and failed messages older than ``retention``; returns how many."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        deleted = OutboxMessage.query.filter(
+            OutboxMessage.status.in_(("sent", "failed")),
+            OutboxMessage.created_at < cutoff,
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def start(self, app, interval):
+        """Send due mail from a background thread, polling every ``interval`` s."""
+
+        def loop():
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                try:
+                    with app.app_context():
+                        # Keep going while batches come back full
+                        while True:
+                            sent, failed = self.send_due()
+                            if failed:
+                                print(f"Mail outbox: {sent} sent, {failed} failed")
+                            if sent + failed < self.batch_size:
+                                break
+                        self.purge()
+                except Exception as e:
+                    print(f"Mail outbox run failed: {e}")
+
+        thread = threading.Thread(target=loop, name="mail-outbox", daemon=True)
+        thread.start()
+        return thread
+
+
+mail_outbox = MailOutbox()
@@ -1,6 +1,7 @@
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import secrets
 from extensions import db
 
 
@@ -9,7 +10,7 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     is_active = db.Column(db.Boolean, default=True)
     is_admin = db.Column(db.Boolean, default=False)
     reset_token = db.Column(db.String(100), unique=True)
@@ -23,6 +24,10 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    @staticmethod
+    def generate_random_password(length=16):
+        return secrets.token_urlsafe(length)[:length]
+
     def __repr__(self):
         return f"<User {self.username}>"
 
@@ -41,3 +46,135 @@ class AdminPanel(db.Model):
 
     def __repr__(self):
         return f"<AdminPanel {self.id}>"
+
+
+class BlockRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pipeline_id = db.Column(db.String(100), nullable=False)
+    block_id = db.Column(db.String(100), nullable=False)
+    class_name = db.Column(db.String(200))
+    stage = db.Column(db.String(50))
+    status = db.Column(db.String(20))
+    wall_seconds = db.Column(db.Float)
+    cpu_seconds = db.Column(db.Float)
+    # Change in the worker's current RSS over the run: memory it kept
+    rss_delta_kb = db.Column(db.Integer)
+    # Peak resident memory during the run above what the worker held before
+    peak_delta_kb = db.Column(db.Integer)
+    output_bytes = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index("ix_block_run_pipeline_block", "pipeline_id", "block_id"),
+    )
+
+    def __repr__(self):
+        return f"<BlockRun {self.pipeline_id}/{self.block_id}>"
+
+
+class Upload(db.Model):
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
+    # canvas_owner() key, so anonymous sessions each get their own quota
+    owner = db.Column(db.String(100), index=True)
+    # Who the quota is charged to: the user, or the client IP if anonymous
+    quota_key = db.Column(db.String(100), index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    stored_name = db.Column(db.String(255))
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, default=0)
+    sha256 = db.Column(db.String(64), index=True)
+    status = db.Column(db.String(20), default="pending")  # pending/complete
+    deduplicated = db.Column(db.Boolean, default=False)
+    # Set while one request writes a chunk; others wait for it or the lease
+    claim = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    completed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<Upload {self.filename} {self.status}>"
+
+
+class CanvasState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # "user:<id>" for logged-in users, "session:<id>" otherwise
+    owner = db.Column(db.String(100), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
+    data = db.Column(db.Text, nullable=False, default="{}")
+    # Bumped on every write; writers check it to detect lost updates
+    version = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    def __repr__(self):
+        return f"<CanvasState {self.owner} v{self.version}>"
+
+
+class TemplateBlob(db.Model):
+    # SHA-256 of the canonical template JSON; identical templates share a blob
+    sha256 = db.Column(db.String(64), primary_key=True)
+    codec = db.Column(db.String(10), nullable=False)  # zstd/gzip
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    compressed_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TemplateBlob {self.sha256[:12]} {self.codec}>"
+
+
+class Template(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
+    # Canvas owner key ("user:<id>" or "session:<id>") of whoever saved it
+    owner = db.Column(db.String(100), index=True)
+    # Private unless saved with public=true
+    public = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    name = db.Column(db.String(200), nullable=False)
+    sha256 = db.Column(
+        db.String(64), db.ForeignKey("template_blob.sha256"), nullable=False, index=True
+    )
+    # Summary kept next to the blob so listings never decompress it
+    block_count = db.Column(db.Integer, default=0)
+    connection_count = db.Column(db.Integer, default=0)
+    classes = db.Column(db.Text, default="[]")  # JSON list of class paths
+    size = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Template {self.name}>"
+
+
+class LoginAttempt(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # "user:<username>" or "ip:<address>"; one row per failed attempt and key
+    key = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (db.Index("ix_login_attempt_key_created", "key", "created_at"),)
+
+    def __repr__(self):
+        return f"<LoginAttempt {self.key}>"
+
+
+class OutboxMessage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default="pending")  # pending/sending/sent/failed
+    attempts = db.Column(db.Integer, default=0)
+    # When a pending message is due, or when a claimed one's lease runs out
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<OutboxMessage {self.id} {self.status}>"
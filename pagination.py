@@ -0,0 +1,20 @@
+"""Opaque cursors for keyset and offset pagination."""
+
+import base64
+import json
+
+
+def encode_cursor(offset, artifact_id=None):
+    """Pack a page position into an opaque URL-safe string."""
+    raw = json.dumps({"o": offset, "a": artifact_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Unpack a cursor; raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(data["o"]), data.get("a")
+    except (TypeError, KeyError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
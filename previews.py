@@ -0,0 +1,145 @@
+"""Bounded previews of block outputs with cursor-based paging."""
+
+import json
+
+from artifacts import is_handle, to_jsonable
+from pagination import encode_cursor
+from shm import attach_array, close_quietly, is_shared
+
+DEFAULT_MAX_ITEMS = 20
+DEFAULT_MAX_BYTES = 64 * 1024
+
+
+def output_id(value):
+    """Identify the stored output a cursor belongs to."""
+    if is_handle(value):
+        return value["artifact_id"]
+    if is_shared(value):
+        return value["shm_name"]
+    return None
+
+
+def _read_shared(descriptor, start, stop):
+    array, segment = attach_array(descriptor)
+    try:
+        return array[start:stop].tolist()
+    finally:
+        del array
+        close_quietly(segment)
+
+
+def _size(value):
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def _clip_text(text, max_bytes):
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text, False
+    return encoded[:max_bytes].decode("utf-8", errors="ignore"), True
+
+
+def _clip_item(item, max_bytes):
+    """Shorten the text of a single oversized item so it fits the cap."""
+    if isinstance(item, str):
+        return _clip_text(item, max_bytes)[0]
+    if isinstance(item, dict) and isinstance(item.get("page_content"), str):
+        item = dict(item)
+        item["page_content"] = _clip_text(item["page_content"], max_bytes)[0]
+    return item
+
+
+def build_preview(
+    value,
+    store,
+    offset=0,
+    max_items=DEFAULT_MAX_ITEMS,
+    max_bytes=DEFAULT_MAX_BYTES,
+    version=None,
+):
+    """Return at most ``max_items`` items and ``max_bytes`` bytes of an output.
+
+    ``value`` is whatever the canvas kept for a block: an artifact handle,
+    a shared-memory array, an inline list, or a scalar. Everything but
+    scalars is paged from ``offset``; the response carries a cursor for
+    the next page. Inline lists have no id of their own, so their cursors
+    carry ``version`` (the canvas's token for the run that produced them)
+    to notice when the output was replaced.
+    """
+    artifact_id = output_id(value) or version
+    if is_handle(value) and value["kind"] == "value":
+        # One large JSON value; previewed like an inline one
+        value = store.materialize(value)
+    if is_handle(value):
+        count = value["count"]
+        nbytes = value["nbytes"]
+        items = to_jsonable(store.read_slice(artifact_id, offset, offset + max_items))
+        kind = value["kind"]
+    elif is_shared(value):
+        count = value["count"]
+        nbytes = value["nbytes"]
+        items = _read_shared(value, offset, offset + max_items)
+        kind = "ndarray"
+    elif isinstance(value, list):
+        count = len(value)
+        nbytes = _size(value)
+        items = value[offset : offset + max_items]
+        kind = "list"
+    else:
+        if isinstance(value, str):
+            text, truncated = _clip_text(value, max_bytes)
+            nbytes = len(value.encode("utf-8"))
+        else:
+            text, truncated, nbytes = value, False, _size(value)
+        return {
+            "kind": "value",
+            "value": text,
+            "count": 1,
+            "nbytes": nbytes,
+            "truncated": truncated,
+            "next_cursor": None,
+        }
+
+    page = []
+    used = 0
+    for item in items:
+        size = _size(item)
+        if used + size > max_bytes:
+            if page:
+                break
+            # Always return at least one (clipped) item so paging advances
+            item = _clip_item(item, max_bytes)
+            size = _size(item)
+        page.append(item)
+        used += size
+
+    next_offset = offset + len(page)
+    return {
+        "kind": kind,
+        "items": page,
+        "offset": offset,
+        "count": count,
+        "nbytes": nbytes,
+        "page_bytes": used,
+        "truncated": next_offset < count,
+        "next_cursor": (
+            encode_cursor(next_offset, artifact_id) if next_offset < count else None
+        ),
+    }
+
+
+def summarize(preview):
+    """One-line description of an output for the block status text."""
+    if preview["kind"] == "value":
+        value = preview["value"]
+        return value if isinstance(value, str) else json.dumps(value)[:200]
+    label = "documents" if preview["kind"] == "documents" else "items"
+    return f"{preview['count']} {label} ({_format_bytes(preview['nbytes'])})"
+
+
+def _format_bytes(nbytes):
+    for unit in ("B", "KB", "MB"):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GB"
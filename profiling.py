@@ -0,0 +1,175 @@
+"""Per-block execution history and pipeline profiles."""
+
+import json
+import math
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from artifacts import is_handle
+from models import BlockRun, db
+from shm import is_shared
+
+# How many past runs per block are used for percentiles
+HISTORY_LIMIT = 500
+
+
+def stage_for(module_path, class_name):
+    """Guess which pipeline stage a LangChain or built-in class belongs to.
+
+    Also used as the block's component type in the editor.
+    """
+    module_path = module_path or ""
+    class_name = (class_name or "").lower()
+    if "document_loaders" in module_path or "loader" in class_name:
+        return "document_loaders"
+    # Deduplication works on the split chunks before they are embedded
+    if "text_splitters" in module_path or any(
+        word in class_name for word in ("splitter", "dedup")
+    ):
+        return "text_splitters"
+    if "embedding" in module_path or "embed" in class_name:
+        return "embeddings"
+    if (
+        "vectorstore" in module_path
+        or "retriever" in module_path
+        or any(
+            word in class_name
+            for word in ("faiss", "vectorstore", "retriever", "chroma")
+        )
+    ):
+        return "retrieval"
+    if "llm" in module_path or "llm" in class_name:
+        return "llms"
+    if "chat" in module_path:
+        return "chat_models"
+    if "chain" in module_path:
+        return "chains"
+    return "other"
+
+
+def output_size(output):
+    """Size in bytes of a block output, without loading artifacts."""
+    if is_handle(output) or is_shared(output):
+        return output["nbytes"]
+    try:
+        return len(json.dumps(output).encode("utf-8"))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_run(pipeline_id, block_id, block, result, user_id=None):
+    """Persist the timings of one block run; never fails the request."""
+    usage = result.get("usage") or {}
+    before = usage.get("rss_before_kb")
+    after = usage.get("rss_after_kb")
+
+    run = BlockRun(
+        pipeline_id=pipeline_id,
+        block_id=block_id,
+        class_name=getattr(block, "class_name", None) or type(block).__name__,
+        stage=stage_for(
+            getattr(block, "module_path", ""), getattr(block, "class_name", "")
+        ),
+        status=result.get("status"),
+        wall_seconds=usage.get("wall_seconds"),
+        cpu_seconds=usage.get("cpu_seconds"),
+        rss_delta_kb=(after - before) if after and before else None,
+        peak_delta_kb=usage.get("peak_delta_kb"),
+        output_bytes=(
+            output_size(result.get("output"))
+            if result.get("status") == "success"
+            else None
+        ),
+        user_id=user_id,
+    )
+    try:
+        db.session.add(run)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Could not record block run: {str(e)}")
+        return None
+    return run
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = math.ceil(pct / 100 * len(values)) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def _run_dict(run):
+    return {
+        "block_id": run.block_id,
+        "class_name": run.class_name,
+        "stage": run.stage,
+        "status": run.status,
+        "wall_seconds": run.wall_seconds,
+        "cpu_seconds": run.cpu_seconds,
+        "rss_delta_kb": run.rss_delta_kb,
+        "peak_delta_kb": run.peak_delta_kb,
+        "output_bytes": run.output_bytes,
+        "created_at": run.created_at.isoformat() if run.created_at else None,
+    }
+
+
+def pipeline_profile(pipeline_id):
+    """Build a flame-style breakdown and per-block history for a pipeline.
+
+    The breakdown nests the latest run of every block under its stage, so
+    the widest stage is the one worth optimizing first.
+    """
+    block_ids = [
+        row[0]
+        for row in db.session.query(BlockRun.block_id)
+        .filter_by(pipeline_id=pipeline_id)
+        .distinct()
+    ]
+
+    stages = {}
+    history = {}
+    for block_id in block_ids:
+        runs = (
+            BlockRun.query.filter_by(pipeline_id=pipeline_id, block_id=block_id)
+            .order_by(BlockRun.created_at.desc(), BlockRun.id.desc())
+            .limit(HISTORY_LIMIT)
+            .all()
+        )
+        latest = runs[0]
+        walls = sorted(r.wall_seconds for r in runs if r.wall_seconds is not None)
+        cpus = sorted(r.cpu_seconds for r in runs if r.cpu_seconds is not None)
+        history[block_id] = {
+            "class_name": latest.class_name,
+            "stage": latest.stage,
+            "runs": len(runs),
+            "errors": sum(1 for r in runs if r.status != "success"),
+            "wall_p50": _percentile(walls, 50),
+            "wall_p95": _percentile(walls, 95),
+            "cpu_p50": _percentile(cpus, 50),
+            "cpu_p95": _percentile(cpus, 95),
+        }
+
+        stage = stages.setdefault(
+            latest.stage, {"name": latest.stage, "value": 0.0, "children": []}
+        )
+        stage["value"] += latest.wall_seconds or 0.0
+        stage["children"].append(
+            {
+                "name": f"{latest.class_name} ({block_id})",
+                "value": latest.wall_seconds or 0.0,
+                "run": _run_dict(latest),
+            }
+        )
+
+    children = sorted(stages.values(), key=lambda s: s["value"], reverse=True)
+    return {
+        "pipeline_id": pipeline_id,
+        "flame": {
+            "name": pipeline_id,
+            "value": sum(s["value"] for s in children),
+            "children": children,
+        },
+        "blocks": history,
+    }
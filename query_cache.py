@@ -0,0 +1,208 @@
+"""Cache of query results, matched exactly or by embedding similarity.
+
+Entries live in one SQLite file shared by all workers. Each entry belongs
+to a scope string that starts with the canvas owner and pipeline and names
+the version of the data it was computed from (e.g. an index version), so
+rebuilding an index starts a fresh scope instead of serving stale results.
+Old scopes age out.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+# Entries kept per scope; the least recently used go first
+MAX_ENTRIES_PER_SCOPE = 1000
+
+# Scopes whose query vectors are kept in memory; the least recently used go
+MAX_VECTOR_SCOPES = 64
+
+# Returned on a miss, so a cached empty or None result is still a hit
+MISS = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entry (
+    scope TEXT NOT NULL,
+    query TEXT NOT NULL,
+    vector BLOB,
+    result TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (scope, query)
+);
+CREATE INDEX IF NOT EXISTS ix_entry_used_at ON entry (used_at);
+"""
+
+
+def cache_key(text):
+    """Case- and whitespace-insensitive form of a query."""
+    return normalize_text(text).casefold()
+
+
+class QueryCache:
+    """Query results keyed by scope and normalized query text."""
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # scope -> (signature, queries, unit vectors) for similarity lookups
+        self._vectors = OrderedDict()
+        db = self._connect()
+        try:
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _touch(self, db, scope, query):
+        db.execute(
+            "UPDATE entry SET hits = hits + 1, used_at = ? WHERE scope = ? AND query = ?",
+            (time.time(), scope, query),
+        )
+
+    def get(self, scope, text):
+        """Return the result stored for exactly this (normalized) query, or MISS."""
+        query = cache_key(text)
+        db = self._connect()
+        try:
+            with db:
+                row = db.execute(
+                    "SELECT result FROM entry WHERE scope = ? AND query = ?",
+                    (scope, query),
+                ).fetchone()
+                if row:
+                    self._touch(db, scope, query)
+        finally:
+            db.close()
+        return json.loads(row[0]) if row else MISS
+
+    def _scope_vectors(self, db, scope):
+        # Replacing an entry gives it a new rowid, so this changes on any write
+        signature = db.execute(
+            "SELECT COUNT(*), MAX(rowid) FROM entry "
+            "WHERE scope = ? AND vector IS NOT NULL",
+            (scope,),
+        ).fetchone()
+        with self._lock:
+            cached = self._vectors.get(scope)
+            if cached:
+                self._vectors.move_to_end(scope)
+        if cached and cached[0] == signature:
+            return cached
+        rows = db.execute(
+            "SELECT query, vector FROM entry WHERE scope = ? AND vector IS NOT NULL",
+            (scope,),
+        ).fetchall()
+        queries = [row[0] for row in rows]
+        vectors = (
+            np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+            if rows
+            else np.empty((0, 0), dtype=np.float32)
+        )
+        cached = (signature, queries, vectors)
+        with self._lock:
+            self._vectors[scope] = cached
+            self._vectors.move_to_end(scope)
+            while len(self._vectors) > MAX_VECTOR_SCOPES:
+                self._vectors.popitem(last=False)
+        return cached
+
+    def get_similar(self, scope, vector, threshold):
+        """Return ``(result, similarity)`` of the closest query above ``threshold``.
+
+        ``result`` is MISS when no query is close enough.
+        """
+        unit = _unit(vector)
+        db = self._connect()
+        try:
+            _, queries, vectors = self._scope_vectors(db, scope)
+            if not queries or vectors.shape[1] != len(unit):
+                return MISS, None
+            similarities = vectors @ unit
+            best = int(np.argmax(similarities))
+            if similarities[best] < threshold:
+                return MISS, float(similarities[best])
+            with db:
+                row = db.execute(
+                    "SELECT result FROM entry WHERE scope = ? AND query = ?",
+                    (scope, queries[best]),
+                ).fetchone()
+                if row:
+                    self._touch(db, scope, queries[best])
+        finally:
+            db.close()
+        return (json.loads(row[0]) if row else MISS), float(similarities[best])
+
+    def put(self, scope, text, result, vector=None):
+        now = time.time()
+        blob = _unit(vector).tobytes() if vector is not None else None
+        db = self._connect()
+        try:
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO entry "
+                    "(scope, query, vector, result, hits, created_at, used_at) "
+                    "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                    (scope, cache_key(text), blob, json.dumps(result), now, now),
+                )
+                db.execute(
+                    "DELETE FROM entry WHERE scope = ? AND query NOT IN ("
+                    "SELECT query FROM entry WHERE scope = ? "
+                    "ORDER BY used_at DESC LIMIT ?)",
+                    (scope, scope, MAX_ENTRIES_PER_SCOPE),
+                )
+                db.execute(
+                    "DELETE FROM entry WHERE used_at < ?", (now - self.ttl_seconds,)
+                )
+        finally:
+            db.close()
+
+    def clear(self, scope_prefix=""):
+        """Remove entries whose scope starts with ``scope_prefix``."""
+        db = self._connect()
+        try:
+            with db:
+                removed = db.execute(
+                    "DELETE FROM entry WHERE substr(scope, 1, ?) = ?",
+                    (len(scope_prefix), scope_prefix),
+                ).rowcount
+        finally:
+            db.close()
+        with self._lock:
+            self._vectors.clear()
+        return removed
+
+    def stats(self, scope_prefix=""):
+        """Entries and hits per scope, for scopes starting with ``scope_prefix``."""
+        db = self._connect()
+        try:
+            rows = db.execute(
+                "SELECT scope, COUNT(*), SUM(hits), MAX(used_at) FROM entry "
+                "WHERE substr(scope, 1, ?) = ? "
+                "GROUP BY scope ORDER BY MAX(used_at) DESC",
+                (len(scope_prefix), scope_prefix),
+            ).fetchall()
+        finally:
+            db.close()
+        return [
+            {"scope": scope, "entries": entries, "hits": hits or 0, "used_at": used}
+            for scope, entries, hits, used in rows
+        ]
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
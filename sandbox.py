@@ -0,0 +1,548 @@
+"""Subprocess workers that execute blocks under per-run resource limits."""
+
+import ast
+import inspect
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from artifacts import (
+    DEFAULT_INLINE_MAX_BYTES,
+    ArtifactStore,
+    is_matrix,
+    to_jsonable,
+)
+from class_policy import load_class
+from shm import (
+    SharedArrayRegistry,
+    attach_array,
+    close_quietly,
+    export_array,
+    is_shared,
+)
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module; runs still get wall-clock timeouts
+    resource = None
+
+# How often the parent checks on a running worker (seconds)
+POLL_INTERVAL = 0.05
+
+# Keyword through which blocks that declare it receive the run context
+RUN_CONTEXT_PARAM = "run_context"
+
+
+class CpuLimitExceeded(Exception):
+    """Raised inside a worker when the per-run CPU budget is used up."""
+
+
+def _raise_cpu_limit(signum, frame):
+    raise CpuLimitExceeded("CPU time limit exceeded")
+
+
+def _cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _current_rss_kb():
+    """Resident set size of this process right now, from /proc (Linux)."""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Reset this process's VmHWM to its current RSS (Linux); True if done."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _read_proc_peak_kb(pid):
+    """Read the peak resident set size of a process (or "self") from /proc."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def coerce_param(value):
+    """Turn a parameter string from the block UI into a Python value."""
+    if not isinstance(value, str):
+        return value
+    stripped = value.strip()
+    if stripped.startswith(("'", '"', "[", "{", "(")) or stripped in (
+        "True",
+        "False",
+        "None",
+    ):
+        try:
+            return ast.literal_eval(stripped)
+        except (ValueError, SyntaxError):
+            return value
+    try:
+        return int(stripped)
+    except ValueError:
+        pass
+    try:
+        return float(stripped)
+    except ValueError:
+        return value
+
+
+def _open_input(value, store, segments):
+    """Resolve a handle or shared-memory descriptor passed as input."""
+    if is_shared(value):
+        array, segment = attach_array(value)
+        segments.append(segment)
+        return array
+    if store is not None:
+        return store.materialize(value)
+    return value
+
+
+def _package_output(output, store, shared):
+    """Decide how a result travels back to the parent process."""
+    if shared and is_matrix(output):
+        output = np.asarray(output, dtype=np.float32)
+    if shared and isinstance(output, np.ndarray) and not output.dtype.hasobject:
+        # Only a descriptor goes over the pipe; the data stays in place
+        return export_array(output)
+    if store is not None:
+        return store.externalize(output)
+    return to_jsonable(output)
+
+
+def _accepts_context(cls):
+    try:
+        return RUN_CONTEXT_PARAM in inspect.signature(cls).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def execute_block(spec, store=None):
+    """Instantiate a block's class and call its selected method.
+
+    Handles and shared-memory descriptors among the inputs are opened
+    before the call. Large results are written to shared memory or the
+    artifact store and returned as a descriptor or handle. Classes with a
+    ``run_context`` parameter get the spec's context (owner, pipeline id)
+    so they can scope caches and state to it.
+    """
+    # Checked again here: the spec may come from a stored canvas
+    cls = load_class(spec["module_path"], spec["class_name"])
+
+    params = {k: coerce_param(v) for k, v in (spec.get("parameters") or {}).items()}
+    params = {k: v for k, v in params.items() if v != ""}
+    # Set by the server, never by block parameters
+    params.pop(RUN_CONTEXT_PARAM, None)
+    if _accepts_context(cls):
+        params[RUN_CONTEXT_PARAM] = dict(spec.get("context") or {})
+    instance = cls(**params)
+
+    method = spec.get("method")
+    if not method or method == "__init__":
+        return to_jsonable(instance)
+
+    segments = []
+    try:
+        inputs = [_open_input(v, store, segments) for v in spec.get("inputs") or []]
+        output = getattr(instance, method)(*inputs)
+        return _package_output(output, store, spec.get("shared_memory"))
+    finally:
+        inputs = output = instance = None
+        for segment in segments:
+            close_quietly(segment)
+
+
+def _apply_limits(limits, cpu_before):
+    """Lower the soft limits for one run and return the previous ones."""
+    if resource is None:
+        return None
+    previous = {
+        resource.RLIMIT_AS: resource.getrlimit(resource.RLIMIT_AS),
+        resource.RLIMIT_CPU: resource.getrlimit(resource.RLIMIT_CPU),
+    }
+    address_space_mb = limits.get("address_space_mb")
+    if address_space_mb:
+        hard = previous[resource.RLIMIT_AS][1]
+        resource.setrlimit(
+            resource.RLIMIT_AS, (int(address_space_mb) * 1024 * 1024, hard)
+        )
+    cpu_seconds = limits.get("cpu_seconds")
+    if cpu_seconds:
+        # RLIMIT_CPU counts the whole process lifetime, so offset it
+        hard = previous[resource.RLIMIT_CPU][1]
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (int(cpu_before + cpu_seconds) + 1, hard)
+        )
+    return previous
+
+
+def _restore_limits(previous):
+    if previous is None:
+        return
+    for which, value in previous.items():
+        resource.setrlimit(which, value)
+
+
+def _run_task(spec, limits):
+    """Run one task inside the worker with the requested limits applied."""
+    # So the high-water mark (and the parent's memory check) covers this run
+    peak_reset = _reset_peak_rss()
+    rss_before = _current_rss_kb()
+    cpu_before = _cpu_seconds()
+    started = time.monotonic()
+
+    error = None
+    output = None
+    previous = None
+    try:
+        previous = _apply_limits(limits, cpu_before)
+        root = spec.get("artifact_root")
+        store = (
+            ArtifactStore(root, inline_max_bytes=spec.get("inline_max_bytes"))
+            if root
+            else None
+        )
+        output = execute_block(spec, store)
+    except MemoryError:
+        error = {"type": "memory_limit", "message": "Memory limit exceeded"}
+    except CpuLimitExceeded as e:
+        error = {"type": "cpu_limit", "message": str(e)}
+    except Exception as e:
+        error = {
+            "type": "exception",
+            "message": f"{type(e).__name__}: {e}",
+            "traceback": traceback.format_exc(),
+        }
+    finally:
+        _restore_limits(previous)
+
+    peak = _read_proc_peak_kb("self") if peak_reset else None
+    usage = {
+        "wall_seconds": time.monotonic() - started,
+        "cpu_seconds": _cpu_seconds() - cpu_before,
+        "peak_rss_kb": peak or _peak_rss_kb(),
+        "peak_delta_kb": (
+            peak - rss_before if peak is not None and rss_before is not None else None
+        ),
+        "rss_before_kb": rss_before,
+        "rss_after_kb": _current_rss_kb(),
+    }
+    if error:
+        return {"status": "error", "error": error, "usage": usage}
+    return {"status": "success", "output": output, "usage": usage}
+
+
+def _worker_main(conn):
+    """Entry point of a sandbox worker process."""
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        spec, limits = message
+        conn.send(_run_task(spec, limits))
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        # Not a daemon, so blocks may start their own process pools
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,))
+        self.process.start()
+        child_conn.close()
+        self.tasks_run = 0
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=1)
+
+
+class SandboxPool:
+    """A fixed number of worker processes that run blocks one at a time.
+
+    Each run gets a resident memory budget and a wall-clock timeout, both
+    enforced by the parent, and an RLIMIT_CPU budget. The parent kills a
+    worker whose peak RSS goes over ``memory_mb``; RSS is what actually
+    uses RAM, unlike address space, which torch inflates by several GB.
+    ``address_space_mb`` adds an optional RLIMIT_AS cap on top. Workers
+    are replaced after ``max_tasks_per_worker`` runs or after any limit
+    violation, so memory leaked by a loader does not pile up.
+    """
+
+    def __init__(
+        self,
+        workers=2,
+        max_tasks_per_worker=50,
+        memory_mb=2048,
+        address_space_mb=0,
+        cpu_seconds=60,
+        wall_seconds=120,
+        start_method="spawn",
+        artifact_root=None,
+        shared_memory=True,
+        inline_max_bytes=DEFAULT_INLINE_MAX_BYTES,
+    ):
+        self.artifact_root = artifact_root
+        self.inline_max_bytes = inline_max_bytes
+        # Reference counts for arrays handed between workers
+        self.shared = SharedArrayRegistry() if shared_memory else None
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.default_limits = {
+            "memory_mb": memory_mb,
+            "address_space_mb": address_space_mb,
+            "cpu_seconds": cpu_seconds,
+            "wall_seconds": wall_seconds,
+        }
+        self._ctx = multiprocessing.get_context(start_method)
+        self._lock = threading.Lock()
+        self._workers = set()
+        # Slots are started lazily so importing the server doesn't fork
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(None)
+        self._closed = False
+
+    def run(self, spec, **limits):
+        """Execute a block spec in a worker and return a result dict."""
+        if self._closed:
+            raise RuntimeError("Sandbox pool has been shut down")
+        limits = {**self.default_limits, **limits}
+        if self.artifact_root:
+            spec = {
+                **spec,
+                "artifact_root": self.artifact_root,
+                "inline_max_bytes": self.inline_max_bytes,
+            }
+        inputs = spec.get("inputs") or []
+        if self.shared is not None:
+            spec = {**spec, "shared_memory": True}
+            # Keep input segments alive while the task is using them
+            for value in inputs:
+                self.shared.incref(value)
+
+        worker = self._idle.get()
+        try:
+            if worker is None or not worker.is_alive():
+                worker = self._spawn()
+            result, worker = self._dispatch(worker, spec, limits)
+        except Exception:
+            if worker is not None:
+                self._retire(worker, kill=True)
+            worker = None
+            raise
+        finally:
+            self._idle.put(worker)
+            if self.shared is not None:
+                for value in inputs:
+                    self.shared.decref(value)
+
+        if self.shared is not None and result["status"] == "success":
+            # The caller owns one reference to a shared output
+            self.shared.incref(result["output"])
+        return result
+
+    def release(self, output):
+        """Give up the caller's reference to an output from ``run``."""
+        if self.shared is not None:
+            self.shared.decref(output)
+
+    def _spawn(self):
+        worker = _Worker(self._ctx)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker, kill=False):
+        with self._lock:
+            self._workers.discard(worker)
+        if kill:
+            worker.kill()
+            worker.conn.close()
+        else:
+            worker.stop()
+
+    def _dispatch(self, worker, spec, limits):
+        """Send a task to a worker and wait for it under the wall-clock limit."""
+        worker.conn.send((spec, limits))
+        started = time.monotonic()
+        wall_seconds = limits.get("wall_seconds")
+        memory_kb = (limits.get("memory_mb") or 0) * 1024
+        peak_seen = None
+
+        while True:
+            try:
+                ready = worker.conn.poll(POLL_INTERVAL)
+            except (EOFError, OSError):
+                ready = True
+            if ready:
+                try:
+                    result = worker.conn.recv()
+                    break
+                except (EOFError, OSError):
+                    worker.process.join(timeout=1)
+                    self._retire(worker, kill=True)
+                    return (
+                        self._crash_error(worker, peak_seen, started, limits),
+                        None,
+                    )
+
+            peak_seen = _read_proc_peak_kb(worker.process.pid) or peak_seen
+            if memory_kb and peak_seen and peak_seen > memory_kb:
+                self._retire(worker, kill=True)
+                return (
+                    self._limit_error(
+                        "memory_limit",
+                        f"Memory limit of {limits['memory_mb']} MB exceeded",
+                        peak_seen,
+                        started,
+                        limits,
+                    ),
+                    None,
+                )
+            if wall_seconds and time.monotonic() - started > wall_seconds:
+                self._retire(worker, kill=True)
+                return (
+                    self._limit_error(
+                        "timeout",
+                        f"Wall-clock limit of {wall_seconds}s exceeded",
+                        peak_seen,
+                        started,
+                        limits,
+                    ),
+                    None,
+                )
+
+        worker.tasks_run += 1
+        if result["status"] == "error":
+            result["error"]["limits"] = limits
+            if result["error"]["type"] != "exception":
+                # The worker hit a limit; don't trust it with another run
+                self._retire(worker, kill=True)
+                return result, None
+        if worker.tasks_run >= self.max_tasks_per_worker:
+            self._retire(worker)
+            return result, None
+        return result, worker
+
+    def _crash_error(self, worker, peak_seen, started, limits):
+        exitcode = worker.process.exitcode
+        if hasattr(signal, "SIGXCPU") and exitcode == -signal.SIGXCPU:
+            return self._limit_error(
+                "cpu_limit", "CPU time limit exceeded", peak_seen, started, limits
+            )
+        if hasattr(signal, "SIGKILL") and exitcode == -signal.SIGKILL:
+            return self._limit_error(
+                "memory_limit",
+                "Worker was killed, most likely for running out of memory",
+                peak_seen,
+                started,
+                limits,
+            )
+        return self._limit_error(
+            "worker_crashed",
+            f"Worker exited unexpectedly (exit code {exitcode})",
+            peak_seen,
+            started,
+            limits,
+        )
+
+    @staticmethod
+    def _limit_error(error_type, message, peak_seen, started, limits):
+        return {
+            "status": "error",
+            "error": {"type": error_type, "message": message, "limits": limits},
+            "usage": {
+                "wall_seconds": time.monotonic() - started,
+                "peak_rss_kb": peak_seen,
+            },
+        }
+
+    def stats(self):
+        """Return a snapshot of the pool for status endpoints."""
+        with self._lock:
+            workers = list(self._workers)
+        return {
+            "workers": len(workers),
+            "tasks_run": [w.tasks_run for w in workers],
+            "max_tasks_per_worker": self.max_tasks_per_worker,
+            "limits": dict(self.default_limits),
+            "shared_memory": self.shared.stats() if self.shared else None,
+        }
+
+    def shutdown(self):
+        """Stop all worker processes and free shared segments."""
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+        if self.shared is not None:
+            self.shared.unlink_all()
+
+
+def pool_from_config(config):
+    """Build a SandboxPool from Flask app config values."""
+    return SandboxPool(
+        workers=config.get("SANDBOX_WORKERS", 2),
+        max_tasks_per_worker=config.get("SANDBOX_MAX_TASKS_PER_WORKER", 50),
+        memory_mb=config.get("SANDBOX_MEMORY_MB", 2048),
+        address_space_mb=config.get("SANDBOX_ADDRESS_SPACE_MB", 0),
+        cpu_seconds=config.get("SANDBOX_CPU_SECONDS", 60),
+        wall_seconds=config.get("SANDBOX_WALL_SECONDS", 120),
+        artifact_root=config.get("ARTIFACT_ROOT"),
+        shared_memory=config.get("SANDBOX_SHARED_MEMORY", True),
+        inline_max_bytes=config.get(
+            "ARTIFACT_INLINE_MAX_BYTES", DEFAULT_INLINE_MAX_BYTES
+        ),
+    )
@@ -1,15 +1,41 @@
 from flask import Flask, request, jsonify, render_template, redirect, url_for, session
 from flask_cors import CORS
 from flask_login import current_user
+import atexit
 import importlib
 import inspect
 import pkgutil
 import traceback
-from blocks import Canvas, Block
+from blocks import Canvas, Block, CustomBlock, MissingInput
+from class_policy import ALLOWED_LIBRARIES, check_class, check_module
+from canvas_store import (
+    CanvasConflict,
+    CanvasStore,
+    canvas_owner,
+    canvas_pipeline_id,
+    owner_key,
+)
+from canvas_sync import VersionConflict, apply_operations
+from connection_registry import ConnectionRegistry, start_sweeper
+from sandbox import RUN_CONTEXT_PARAM, pool_from_config
+from shm import copy_to_store, is_shared
+from artifacts import ArtifactStore, is_handle, start_pruner, to_jsonable
+from pagination import decode_cursor
+from previews import build_preview, output_id, summarize
+from profiling import pipeline_profile, record_run, stage_for
+from ingest import PDFIngestService
+from embedding_service import EmbeddingClient
+from vector_index import IndexManager, owner_root, start_compactor
+from query_cache import QueryCache
 from extensions import login_manager, init_app
-from models import AdminPanel, User
+from identity_cache import user_identity_cache
+from login_throttle import login_throttle
+from mail_outbox import mail_outbox
+from settings_cache import admin_settings_cache
 from auth import auth as auth_blueprint
 from admin import admin as admin_blueprint
+from uploads import uploads as uploads_blueprint
+from templates_library import templates as templates_blueprint
 
 import os
 import logging
@@ -46,30 +72,193 @@ else:
 
 app.config["SQLALCHEMY_DATABASE_URI"] = default_db_uri
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# SQLite connection pragmas and connection pool sizes, see database.py
+app.config["SQLITE_JOURNAL_MODE"] = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+app.config["SQLITE_SYNCHRONOUS"] = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(
+    os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 10000)
+)
+app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 5))
+app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+app.config["DB_POOL_RECYCLE"] = int(os.environ.get("DB_POOL_RECYCLE", 1800))
 app.config["MAIL_SERVER"] = os.environ.get("MAIL_SERVER", "smtp.gmail.com")
 app.config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", 587))
-app.config["MAIL_USE_TLS"] = os.environ.get("MAIL_USE_TLS", True)
+app.config["MAIL_USE_TLS"] = os.environ.get("MAIL_USE_TLS", "true").lower() == "true"
 app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME")
 app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD")
+# Background sending of queued mail, see mail_outbox.py
+app.config["MAIL_OUTBOX_INTERVAL"] = float(os.environ.get("MAIL_OUTBOX_INTERVAL", 5))
+app.config["MAIL_MAX_ATTEMPTS"] = int(os.environ.get("MAIL_MAX_ATTEMPTS", 6))
+app.config["MAIL_RETRY_SECONDS"] = int(os.environ.get("MAIL_RETRY_SECONDS", 30))
+app.config["MAIL_TIMEOUT"] = float(os.environ.get("MAIL_TIMEOUT", 30))
+app.config["MAIL_OUTBOX_RETENTION"] = (
+    int(os.environ.get("MAIL_OUTBOX_RETENTION_DAYS", 7)) * 24 * 3600
+)
+
+# Block execution sandbox limits
+app.config["SANDBOX_WORKERS"] = int(os.environ.get("SANDBOX_WORKERS", 2))
+app.config["SANDBOX_MAX_TASKS_PER_WORKER"] = int(
+    os.environ.get("SANDBOX_MAX_TASKS_PER_WORKER", 50)
+)
+# Peak RSS per run; the address space cap is off unless set
+app.config["SANDBOX_MEMORY_MB"] = int(os.environ.get("SANDBOX_MEMORY_MB", 2048))
+app.config["SANDBOX_ADDRESS_SPACE_MB"] = int(
+    os.environ.get("SANDBOX_ADDRESS_SPACE_MB", 0)
+)
+app.config["SANDBOX_CPU_SECONDS"] = int(os.environ.get("SANDBOX_CPU_SECONDS", 60))
+app.config["SANDBOX_WALL_SECONDS"] = int(os.environ.get("SANDBOX_WALL_SECONDS", 120))
+app.config["ARTIFACT_ROOT"] = os.environ.get(
+    "ARTIFACT_ROOT", os.path.join(app.instance_path, "artifacts")
+)
+app.config["ARTIFACT_INLINE_MAX_BYTES"] = (
+    int(os.environ.get("ARTIFACT_INLINE_MAX_KB", 64)) * 1024
+)
+app.config["ARTIFACT_MAX_AGE"] = (
+    int(os.environ.get("ARTIFACT_MAX_AGE_HOURS", 168)) * 3600
+)
+app.config["ARTIFACT_PRUNE_INTERVAL"] = int(
+    os.environ.get("ARTIFACT_PRUNE_INTERVAL", 3600)
+)
+app.config["SANDBOX_SHARED_MEMORY"] = (
+    os.environ.get("SANDBOX_SHARED_MEMORY", "true").lower() == "true"
+)
+app.config["FILES_DIR"] = os.environ.get(
+    "FILES_DIR", os.path.join(app.root_path, "files")
+)
+app.config["UPLOAD_TMP_DIR"] = os.environ.get(
+    "UPLOAD_TMP_DIR", os.path.join(app.instance_path, "uploads")
+)
+app.config["UPLOAD_QUOTA_BYTES"] = (
+    int(os.environ.get("UPLOAD_QUOTA_MB", 1024)) * 1024 * 1024
+)
+app.config["UPLOAD_CHUNK_BYTES"] = (
+    int(os.environ.get("UPLOAD_CHUNK_MB", 8)) * 1024 * 1024
+)
+# Pending uploads untouched this long are deleted and stop counting
+app.config["UPLOAD_STALE_SECONDS"] = (
+    int(os.environ.get("UPLOAD_STALE_HOURS", 24)) * 3600
+)
+app.config["PDF_CACHE_ROOT"] = os.environ.get(
+    "PDF_CACHE_ROOT", os.path.join(app.instance_path, "pdf_cache")
+)
+app.config["PDF_INGEST_WORKERS"] = int(
+    os.environ.get("PDF_INGEST_WORKERS", os.cpu_count() or 1)
+)
+app.config["INDEX_ROOT"] = os.environ.get(
+    "INDEX_ROOT", os.path.join(app.instance_path, "indexes")
+)
+app.config["INDEX_COMPACT_INTERVAL"] = int(
+    os.environ.get("INDEX_COMPACT_INTERVAL", 600)
+)
+app.config["QUERY_CACHE_PATH"] = os.environ.get(
+    "QUERY_CACHE_PATH", os.path.join(app.instance_path, "query_cache.sqlite")
+)
+app.config["EMBEDDING_SERVICE_ADDRESS"] = os.environ.get("EMBEDDING_SERVICE_ADDRESS")
+app.config["CONNECTION_MAX_SESSIONS"] = int(
+    os.environ.get("CONNECTION_MAX_SESSIONS", 1000)
+)
+app.config["CONNECTION_MAX_PER_SESSION"] = int(
+    os.environ.get("CONNECTION_MAX_PER_SESSION", 500)
+)
+app.config["CONNECTION_IDLE_SECONDS"] = int(
+    os.environ.get("CONNECTION_IDLE_SECONDS", 6 * 3600)
+)
+app.config["CONNECTION_SWEEP_INTERVAL"] = int(
+    os.environ.get("CONNECTION_SWEEP_INTERVAL", 300)
+)
+app.config["SETTINGS_VERSION_PATH"] = os.environ.get(
+    "SETTINGS_VERSION_PATH", os.path.join(app.instance_path, "settings.version")
+)
+app.config["SETTINGS_CHECK_INTERVAL"] = float(
+    os.environ.get("SETTINGS_CHECK_INTERVAL", 1)
+)
+app.config["SETTINGS_MAX_AGE"] = float(os.environ.get("SETTINGS_MAX_AGE", 30))
+app.config["IDENTITY_CACHE_TTL"] = float(os.environ.get("IDENTITY_CACHE_TTL", 30))
+app.config["IDENTITY_CACHE_SIZE"] = int(os.environ.get("IDENTITY_CACHE_SIZE", 10000))
+app.config["IDENTITY_VERSION_PATH"] = os.environ.get(
+    "IDENTITY_VERSION_PATH", os.path.join(app.instance_path, "users.version")
+)
+app.config["IDENTITY_CHECK_INTERVAL"] = float(
+    os.environ.get("IDENTITY_CHECK_INTERVAL", 1)
+)
+app.config["LOGIN_WINDOW_SECONDS"] = int(os.environ.get("LOGIN_WINDOW_SECONDS", 900))
+app.config["LOGIN_LOCKOUT_SECONDS"] = int(os.environ.get("LOGIN_LOCKOUT_SECONDS", 30))
+app.config["LOGIN_IP_ATTEMPT_FACTOR"] = int(
+    os.environ.get("LOGIN_IP_ATTEMPT_FACTOR", 5)
+)
+app.config["CANVAS_CACHE_SIZE"] = int(os.environ.get("CANVAS_CACHE_SIZE", 256))
+app.config["PREVIEW_MAX_ITEMS"] = int(os.environ.get("PREVIEW_MAX_ITEMS", 20))
+app.config["PREVIEW_MAX_BYTES"] = int(os.environ.get("PREVIEW_MAX_BYTES", 64 * 1024))
 
 # Initialize extensions
 init_app(app)
+admin_settings_cache.init_app(app)
+user_identity_cache.init_app(app)
+login_throttle.init_app(app)
+mail_outbox.init_app(app)
 
 
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    try:
+        return user_identity_cache.get(int(id))
+    except ValueError:
+        return None
 
 
 # Register blueprints
 app.register_blueprint(auth_blueprint)
 app.register_blueprint(admin_blueprint, url_prefix="/admin")
+app.register_blueprint(uploads_blueprint, url_prefix="/api/uploads")
+app.register_blueprint(templates_blueprint, url_prefix="/api/templates")
+
+# Canvases per user or session, kept in the database
+canvas_store = CanvasStore(max_cached=app.config["CANVAS_CACHE_SIZE"])
+app.extensions["canvas_store"] = canvas_store
+
+# Worker processes that run blocks under resource limits
+sandbox_pool = pool_from_config(app.config)
+atexit.register(sandbox_pool.shutdown)
+
+# Large block outputs are kept on disk and passed around as handles
+artifact_store = ArtifactStore(
+    app.config["ARTIFACT_ROOT"],
+    inline_max_bytes=app.config["ARTIFACT_INLINE_MAX_BYTES"],
+)
+if app.config["ARTIFACT_PRUNE_INTERVAL"] > 0:
+    start_pruner(
+        artifact_store,
+        app.config["ARTIFACT_MAX_AGE"],
+        app.config["ARTIFACT_PRUNE_INTERVAL"],
+    )
+
+# Page text of PDFs under files/, cached by content hash
+pdf_ingest = PDFIngestService(
+    app.config["PDF_CACHE_ROOT"], workers=app.config["PDF_INGEST_WORKERS"]
+)
+
+# Persistent vector indexes built by the ManagedFAISS block, per owner
+if app.config["INDEX_COMPACT_INTERVAL"] > 0:
+    start_compactor(app.config["INDEX_ROOT"], app.config["INDEX_COMPACT_INTERVAL"])
 
-# Global canvas instance
-canvas = Canvas()
+# Results of retrieval and answer blocks, shared with the sandbox workers
+query_cache = QueryCache(app.config["QUERY_CACHE_PATH"])
 
-# Dictionary to store block connections and their associated functions
-block_connections = {}
+# Libraries whose classes live at the package root instead of in submodules
+ROOT_LEVEL_LIBRARIES = ("langchain_text_splitters", "builtin_blocks")
+
+# Block connections and their associated functions, per session
+block_connections = ConnectionRegistry(
+    max_sessions=app.config["CONNECTION_MAX_SESSIONS"],
+    max_per_session=app.config["CONNECTION_MAX_PER_SESSION"],
+    idle_seconds=app.config["CONNECTION_IDLE_SECONDS"],
+)
+if app.config["CONNECTION_SWEEP_INTERVAL"] > 0:
+    start_sweeper(block_connections, app.config["CONNECTION_SWEEP_INTERVAL"])
+
+# Password reset mail is queued by the request and sent from here
+if app.config["MAIL_OUTBOX_INTERVAL"] > 0:
+    mail_outbox.start(app, app.config["MAIL_OUTBOX_INTERVAL"])
 
 
 # Set up cache for expensive operations
@@ -110,19 +299,34 @@ def connect_blocks():
     print("\n\nTHIS IS BEING USED")
     # Store the connectio
     connection_id = f"{source_id}-{target_id}-{input_id}"
-    block_connections[connection_id] = {
-        "source": source_id,
-        "target": target_id,
-        "inputId": input_id,
-        "function": None,
-    }
+    block_connections.add(
+        canvas_owner(),
+        connection_id,
+        {
+            "source": source_id,
+            "target": target_id,
+            "inputId": input_id,
+            "function": None,
+        },
+    )
 
     return jsonify({"status": "success", "connection_id": connection_id})
 
 
 @app.route("/api/connections", methods=["GET"])
 def get_connections():
-    return jsonify(block_connections)
+    return jsonify(block_connections.get(canvas_owner()))
+
+
+@app.route("/api/connections/stats", methods=["GET"])
+def get_connection_stats():
+    """Registry-wide connection counts; they cover every session."""
+    is_admin = current_user.is_authenticated and getattr(
+        current_user, "is_admin", False
+    )
+    if not is_admin:
+        return jsonify({"error": "Admin access required"}), 403
+    return jsonify(block_connections.stats())
 
 
 @app.route("/api/blocks/create", methods=["POST"])
@@ -150,13 +354,19 @@ def connect_block_nodes():
         return jsonify({"error": "Missing source or target ID"}), 400
 
     try:
-        success = canvas.connect_blocks(source_id, target_id)
+        success = canvas_store.update(
+            canvas_owner(),
+            lambda canvas: canvas.connect_blocks(source_id, target_id),
+            pool=sandbox_pool,
+        )
         if success:
             return jsonify(
                 {"status": "success", "message": "Blocks connected successfully"}
             )
         else:
             return jsonify({"error": "Invalid connection"}), 400
+    except CanvasConflict as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -167,6 +377,10 @@ def export_blocks():
     output_file = data.get("output_file", "generated_pipeline.py")
     blocks_data = data.get("blocks", {})
     connections_data = data.get("connections", [])  # Array of connection objects
+    if data.get("from_canvas"):
+        # Use the copy kept up to date through /api/canvas/sync
+        document = canvas_store.get(canvas_owner(), sandbox_pool).document
+        blocks_data, connections_data = document["blocks"], document["connections"]
     print("\nconnections:", connections_data, "\n")
     try:
         # Create a temporary Canvas with the blocks from the request
@@ -214,31 +428,7 @@ def export_blocks():
                             self.import_string = f"# Import for {self.class_name}"
 
                     # Determine component type based on module path and class name
-                    if (
-                        "document_loaders" in self.module_path
-                        or "loader" in self.class_name.lower()
-                    ):
-                        self.component_type = "document_loaders"
-                    elif "text_splitters" in self.module_path:
-                        self.component_type = "text_splitters"
-                    elif (
-                        "embedding" in self.module_path
-                        or "embed" in self.class_name.lower()
-                    ):
-                        self.component_type = "embeddings"
-                    elif "vectorstore" in self.module_path:
-                        self.component_type = "vectorstores"
-                    elif "retriever" in self.module_path:
-                        self.component_type = "retrievers"
-                    elif "llm" in self.module_path:
-                        self.component_type = "llms"
-                    elif "chat" in self.module_path:
-                        self.component_type = "chat_models"
-                    elif "chain" in self.module_path:
-                        self.component_type = "chains"
-                    else:
-                        # Default to a generic type
-                        self.component_type = "error"
+                    self.component_type = stage_for(self.module_path, self.class_name)
 
                     self.function_string = (
                         f"# Placeholder for {self.class_name} function"
@@ -892,14 +1082,83 @@ def determine_execution_order(blocks, connections):
 @app.route("/api/blocks/list", methods=["GET"])
 def list_blocks():
     try:
+        version, canvas = canvas_store.get_versioned(canvas_owner(), sandbox_pool)
         blocks = {
             block_id: type(block).__name__ for block_id, block in canvas.blocks.items()
         }
-        return jsonify({"blocks": blocks, "connections": canvas.connections})
+        return jsonify(
+            {"blocks": blocks, "connections": canvas.connections, "version": version}
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/canvas", methods=["GET"])
+def get_canvas_document():
+    """The server-side copy of the editor's blocks and connections."""
+    canvas = canvas_store.get(canvas_owner(), sandbox_pool)
+    return jsonify(canvas.document)
+
+
+@app.route("/api/canvas/sync", methods=["POST"])
+def sync_canvas():
+    """Apply ordered edit operations to the server-side canvas copy.
+
+    ``base_version`` is the document version the operations were made
+    against; if the document has moved on since, nothing is applied and
+    the response is 409 with the current version.
+    """
+    data = request.json or {}
+    base_version = data.get("base_version")
+    ops = data.get("ops") or []
+
+    def change(canvas):
+        version = canvas.document.get("version", 0)
+        if base_version is not None and base_version != version:
+            raise VersionConflict(version)
+        canvas.document = apply_operations(canvas.document, ops)
+        return canvas.document["version"]
+
+    try:
+        if not ops:
+            canvas = canvas_store.get(canvas_owner(), sandbox_pool)
+            version = canvas.document.get("version", 0)
+            if base_version is not None and base_version != version:
+                raise VersionConflict(version)
+        else:
+            version = canvas_store.update(canvas_owner(), change, pool=sandbox_pool)
+        return jsonify({"status": "success", "version": version, "applied": len(ops)})
+    except VersionConflict as e:
+        return jsonify({"error": str(e), "version": e.version}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except CanvasConflict as e:
+        return jsonify({"error": str(e)}), 409
+
+
+def _drop_pruned_outputs(owner, canvas, block_ids):
+    """Forget outputs of ``block_ids`` whose artifacts were pruned.
+
+    Returns the ids of the blocks whose output was dropped.
+    """
+    stale = {
+        block_id: canvas.results[block_id]
+        for block_id in block_ids
+        if is_handle(canvas.results.get(block_id))
+        and not artifact_store.exists(canvas.results[block_id]["artifact_id"])
+    }
+    if stale:
+
+        def drop(canvas):
+            for block_id, handle in stale.items():
+                # Unless the block was run again meanwhile
+                if canvas.results.get(block_id) == handle:
+                    canvas.set_result(block_id, None)
+
+        canvas_store.update(owner, drop, pool=sandbox_pool)
+    return list(stale)
+
+
 @app.route("/api/blocks/process", methods=["POST"])
 def process_block():
     try:
@@ -914,12 +1173,72 @@ def process_block():
         )
 
         # Check if the block exists in the canvas
+        owner = canvas_owner()
+        canvas = canvas_store.get(owner, sandbox_pool)
         block = canvas.blocks.get(block_id)
 
         if block:
+            sources = [
+                source_id
+                for source_id, targets in canvas.connections.items()
+                if block_id in targets
+            ]
+            pruned = _drop_pruned_outputs(owner, canvas, sources)
+            if pruned:
+                raise MissingInput(
+                    f"Run the upstream blocks again: {', '.join(pruned)} "
+                    "lost their output to artifact pruning"
+                )
             # Use the canvas block implementation
-            result = canvas.process_block(block_id, config)
-            print(f"[COMPLETED] Block: {block_type} completed")
+            pipeline_id = canvas_pipeline_id(owner, data.get("template_id"))
+            result = canvas.run_block(
+                block_id,
+                config,
+                pool=sandbox_pool,
+                context={"owner": owner_key(owner), "pipeline_id": pipeline_id},
+            )
+            # Token of the stored output; None if nothing was stored
+            version = None
+            if "output_value" in result:
+                output = result.pop("output_value")
+                # Other workers can't attach to this worker's segments
+                saved = (
+                    copy_to_store(output, artifact_store) if is_shared(output) else None
+                )
+
+                def store(canvas):
+                    canvas.set_result(block_id, output, saved=saved)
+                    return canvas.result_tokens.get(block_id)
+
+                # Saved like any other change, so every worker sees it
+                try:
+                    version = canvas_store.update(owner, store, pool=sandbox_pool)
+                finally:
+                    if not version:
+                        sandbox_pool.release(output)
+            print(f"[COMPLETED] Block: {block_type} {result['status']}")
+            result["pipeline_id"] = pipeline_id
+            if "usage" in result:
+                record_run(
+                    pipeline_id,
+                    block_id,
+                    block,
+                    result,
+                    user_id=(
+                        current_user.id if current_user.is_authenticated else None
+                    ),
+                )
+            if result["status"] == "success" and version:
+                # Only send a bounded preview; the rest is paged on demand
+                preview = build_preview(
+                    output,
+                    artifact_store,
+                    max_items=app.config["PREVIEW_MAX_ITEMS"],
+                    max_bytes=app.config["PREVIEW_MAX_BYTES"],
+                    version=version,
+                )
+                result["preview"] = preview
+                result["output"] = summarize(preview)
             return jsonify(result)
         else:
             # Handle custom block processing through the custom block API
@@ -930,29 +1249,259 @@ def process_block():
                     "block_id": block_id,
                 }
             )
+    except (CanvasConflict, MissingInput) as e:
+        return jsonify({"error": str(e), "status": "error"}), 409
     except Exception as e:
         print(f"[ERROR] Block processing error: {str(e)}")
         return jsonify({"error": str(e), "status": "error"}), 500
 
 
+@app.route("/api/blocks/<block_id>/output", methods=["GET"])
+def get_block_output_page(block_id):
+    """Return the next page of a block's last output."""
+    owner = canvas_owner()
+    canvas = canvas_store.get(owner, sandbox_pool)
+    if block_id not in canvas.results:
+        return jsonify({"error": f"No output for block: {block_id}"}), 404
+    if _drop_pruned_outputs(owner, canvas, [block_id]):
+        return jsonify({"error": f"Output of {block_id} was pruned; run it again"}), 410
+    value = canvas.results[block_id]
+    version = canvas.result_tokens.get(block_id)
+
+    offset = 0
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            offset, artifact_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if artifact_id != (output_id(value) or version):
+            return jsonify({"error": "Block output changed; restart paging"}), 409
+
+    limit = request.args.get("limit", app.config["PREVIEW_MAX_ITEMS"], type=int)
+    try:
+        preview = build_preview(
+            value,
+            artifact_store,
+            offset=max(0, offset),
+            max_items=max(1, min(limit, 1000)),
+            max_bytes=app.config["PREVIEW_MAX_BYTES"],
+            version=version,
+        )
+    except FileNotFoundError:
+        # Pruned between the check above and the read
+        _drop_pruned_outputs(owner, canvas, [block_id])
+        return jsonify({"error": f"Output of {block_id} was pruned; run it again"}), 410
+    return jsonify({"block_id": block_id, **preview})
+
+
+@app.route("/api/pipelines/<pipeline_id>/profile", methods=["GET"])
+def get_pipeline_profile(pipeline_id):
+    """Return per-stage timings and p50/p95 history for a pipeline.
+
+    Only the caller's own pipelines are visible, except to admins.
+    """
+    own = canvas_pipeline_id(canvas_owner())
+    is_admin = current_user.is_authenticated and getattr(
+        current_user, "is_admin", False
+    )
+    if pipeline_id != own and not pipeline_id.startswith(own + "_") and not is_admin:
+        return jsonify({"error": f"No runs recorded for {pipeline_id}"}), 404
+    profile = pipeline_profile(pipeline_id)
+    if not profile["blocks"]:
+        return jsonify({"error": f"No runs recorded for {pipeline_id}"}), 404
+    return jsonify(profile)
+
+
+@app.route("/api/embeddings/service/stats", methods=["GET"])
+def embedding_service_stats():
+    """Queue depth and batch-size histograms of the embedding service."""
+    address = app.config["EMBEDDING_SERVICE_ADDRESS"]
+    if not address:
+        return jsonify({"error": "No embedding service configured"}), 404
+    try:
+        client = EmbeddingClient(address, None, None)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 500
+    try:
+        return jsonify({"address": address, "models": client.stats()})
+    except (OSError, EOFError) as e:
+        return jsonify({"error": f"Embedding service unreachable: {e}"}), 503
+    finally:
+        client.close()
+
+
+def owner_indexes():
+    """Index manager for the indexes of the current canvas owner."""
+    root = owner_root(app.config["INDEX_ROOT"], owner_key(canvas_owner()))
+    return IndexManager(root)
+
+
+@app.route("/api/indexes", methods=["GET"])
+def list_indexes():
+    """Build time, footprint and query latency of the caller's indexes."""
+    return jsonify({"indexes": owner_indexes().list()})
+
+
+@app.route("/api/indexes/<name>", methods=["GET"])
+def get_index(name):
+    index_manager = owner_indexes()
+    try:
+        if not index_manager.exists(name):
+            return jsonify({"error": f"Index {name} not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(index_manager.stats(name))
+
+
+@app.route("/api/indexes/<name>/compact", methods=["POST"])
+def compact_index(name):
+    """Drop deleted vectors from an index now instead of waiting."""
+    index_manager = owner_indexes()
+    try:
+        if not index_manager.exists(name):
+            return jsonify({"error": f"Index {name} not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(index_manager.compact(name))
+
+
+def _query_cache_prefix():
+    """Scope prefix of the caller's entries; "" (all) for ``?scope=all``.
+
+    Returns None if a non-admin asks for every owner's entries.
+    """
+    if request.args.get("scope") != "all":
+        return owner_key(canvas_owner()) + "/"
+    if current_user.is_authenticated and getattr(current_user, "is_admin", False):
+        return ""
+    return None
+
+
+@app.route("/api/query-cache", methods=["GET"])
+def query_cache_stats():
+    """Entries and hits of the caller's query cache, per data version."""
+    prefix = _query_cache_prefix()
+    if prefix is None:
+        return jsonify({"error": "Admin access required"}), 403
+    return jsonify({"scopes": query_cache.stats(prefix)})
+
+
+@app.route("/api/query-cache", methods=["DELETE"])
+def clear_query_cache():
+    """Forget the caller's cached query results (admins: ``?scope=all``)."""
+    prefix = _query_cache_prefix()
+    if prefix is None:
+        return jsonify({"error": "Admin access required"}), 403
+    removed = query_cache.clear(prefix)
+    return jsonify({"status": "success", "removed": removed})
+
+
+@app.route("/api/files/ingest", methods=["POST"])
+def ingest_files():
+    """Extract and cache the text of PDFs under files/."""
+    data = request.json or {}
+    files_dir = os.path.realpath(app.config["FILES_DIR"])
+    names = data.get("files")
+    if names is not None and (
+        not isinstance(names, list) or not all(isinstance(n, str) for n in names)
+    ):
+        return jsonify({"error": "files must be a list of file names"}), 400
+    names = names or sorted(
+        name for name in os.listdir(files_dir) if name.lower().endswith(".pdf")
+    )
+
+    paths = []
+    for name in names:
+        path = os.path.realpath(os.path.join(files_dir, name))
+        if os.path.dirname(path) != files_dir or not os.path.isfile(path):
+            return jsonify({"error": f"Not a file in files/: {name}"}), 400
+        paths.append(path)
+
+    try:
+        results, stats = pdf_ingest.extract(paths)
+    except Exception as e:
+        print(f"Ingest error: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify(
+        {
+            "status": "success",
+            "files": [
+                {
+                    "file": os.path.basename(r["source"]),
+                    "hash": r["hash"],
+                    "pages": len(r["pages"]),
+                    "cached": r["cached"],
+                }
+                for r in results
+            ],
+            "stats": stats,
+        }
+    )
+
+
+def _check_artifact_access(artifact_id):
+    """Error response unless the caller's canvas holds this artifact.
+
+    Artifacts are shared between owners by content, so access follows the
+    block outputs that point at them; admins can read any artifact.
+    """
+    if len(artifact_id) != 64 or not all(c in "0123456789abcdef" for c in artifact_id):
+        return jsonify({"error": "Invalid artifact ID"}), 400
+    if current_user.is_authenticated and getattr(current_user, "is_admin", False):
+        return None
+    canvas = canvas_store.get(canvas_owner(), sandbox_pool)
+    outputs = [*canvas.results.values(), *canvas.saved_results.values()]
+    if not any(is_handle(o) and o["artifact_id"] == artifact_id for o in outputs):
+        return jsonify({"error": f"Artifact not found: {artifact_id}"}), 404
+    return None
+
+
+@app.route("/api/artifacts/<artifact_id>", methods=["GET"])
+def get_artifact(artifact_id):
+    """Return the metadata of a stored block output."""
+    error = _check_artifact_access(artifact_id)
+    if error:
+        return error
+    try:
+        return jsonify(artifact_store.meta(artifact_id))
+    except FileNotFoundError:
+        return jsonify({"error": f"Artifact not found: {artifact_id}"}), 404
+
+
+@app.route("/api/artifacts/<artifact_id>/slice", methods=["GET"])
+def get_artifact_slice(artifact_id):
+    """Return rows ``start`` to ``stop`` of a stored block output."""
+    error = _check_artifact_access(artifact_id)
+    if error:
+        return error
+    start = max(0, request.args.get("start", 0, type=int))
+    stop = request.args.get("stop", start + 100, type=int)
+    # Never send more than a thousand rows in one response
+    stop = max(start, min(stop, start + 1000))
+    try:
+        items = artifact_store.read_slice(artifact_id, start, stop)
+    except FileNotFoundError:
+        return jsonify({"error": f"Artifact not found: {artifact_id}"}), 404
+    return jsonify(
+        {
+            "artifact_id": artifact_id,
+            "start": start,
+            "stop": start + len(items),
+            "items": to_jsonable(items),
+        }
+    )
+
+
 # New API endpoints for custom blocks
 @app.route("/api/langchain/libraries", methods=["GET"])
 def list_langchain_libraries():
     """List available LangChain libraries that can be imported."""
-    libraries = [
-        "langchain_community",
-        "langchain_core",
-        "langchain_openai",
-        "langchain_anthropic",
-        "langchain_google_genai",
-        "langchain_pinecone",
-        "langchain_chroma",
-        "langchain_text_splitters",
-    ]
-
     # Try to import each library to check if it's installed
     available_libraries = []
-    for lib in libraries:
+    for lib in ALLOWED_LIBRARIES:
         try:
             importlib.import_module(lib)
             available_libraries.append(lib)
@@ -969,8 +1518,13 @@ def list_langchain_modules():
     library = request.args.get("library", "langchain_community")
 
     try:
-        # Special case for langchain_text_splitters which has classes at root level
-        if library == "langchain_text_splitters":
+        check_module(library)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Special case for libraries which have classes at root level
+        if library in ROOT_LEVEL_LIBRARIES:
             # Return the library itself as the only "module"
             return jsonify({"modules": [library]})
 
@@ -995,6 +1549,10 @@ def list_langchain_modules():
 def list_langchain_classes():
     """List available classes within a LangChain module."""
     module_path = request.args.get("module", "langchain_community.document_loaders")
+    try:
+        check_module(module_path)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Check cache first
     cached_result = module_classes_cache.get(module_path)
@@ -1002,8 +1560,8 @@ def list_langchain_classes():
         return jsonify({"classes": cached_result})
 
     try:
-        # Special case for langchain_text_splitters
-        if module_path == "langchain_text_splitters":
+        # Special case for libraries with classes at root level
+        if module_path in ROOT_LEVEL_LIBRARIES:
             # Import the module
             module = importlib.import_module(module_path)
             classes = []
@@ -1014,7 +1572,7 @@ def list_langchain_classes():
                 if name.startswith("_"):
                     continue
 
-                # Make sure it's from the langchain_text_splitters module
+                # Make sure it's defined in the library itself
                 if hasattr(attr, "__module__") and attr.__module__.startswith(
                     module_path
                 ):
@@ -1132,6 +1690,10 @@ def get_langchain_class_details():
 
     if not module_path or not class_name:
         return jsonify({"error": "Module and class name are required"}), 400
+    try:
+        check_class(module_path, class_name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
         # Import the module
@@ -1186,8 +1748,8 @@ def get_langchain_class_details():
                 parameters = []
 
                 for param_name, param in sig.parameters.items():
-                    # Skip self parameter
-                    if param_name == "self":
+                    # Skip self and the context the sandbox passes in
+                    if param_name in ("self", RUN_CONTEXT_PARAM):
                         continue
 
                     param_info = {
@@ -1256,23 +1818,7 @@ def get_langchain_class_details():
             print(f"Error getting class inheritance: {str(e)}")
 
         # Add component type based on module path
-        component_type = ""
-        if "document_loaders" in module_path:
-            component_type = "document_loaders"
-        elif "text_splitters" in module_path:
-            component_type = "text_splitters"
-        elif "embedding" in module_path or "embed" in class_name.lower():
-            component_type = "embeddings"
-        elif "vectorstore" in module_path:
-            component_type = "vectorstores"
-        elif "retriever" in module_path:
-            component_type = "retrievers"
-        elif "llm" in module_path:
-            component_type = "llms"
-        elif "chat" in module_path:
-            component_type = "chat_models"
-        elif "chain" in module_path:
-            component_type = "chains"
+        component_type = stage_for(module_path, class_name)
 
         result = {
             "doc": docstring,
@@ -1309,6 +1855,11 @@ def create_custom_block():
 
     if not module_path or not class_name or not block_id:
         return jsonify({"error": "Missing required parameters"}), 400
+    try:
+        # The class is imported and called with these parameters in the sandbox
+        check_class(module_path, class_name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Create a custom block class dynamically
     try:
@@ -1335,25 +1886,23 @@ def create_custom_block():
 
         function_string = "\n".join(function_parts)
 
-        # Create a Block subclass dynamically
-        class CustomBlock(Block):
-            def __init__(self):
-                super().__init__()
-                self.import_string = import_string
-                self.function_string = function_string
-                self.input_nodes = input_nodes
-                self.output_nodes = output_nodes
-                self.parameters = parameters
-                self.methods = methods
-                self.class_name = class_name
-                self.module_path = module_path
-
-            def validate_connections(self) -> bool:
-                # Basic validation - could be enhanced based on specific requirements
-                return True
-
-        # Add the custom block to the canvas
-        canvas.add_block(block_id, CustomBlock())
+        block = CustomBlock(
+            module_path,
+            class_name,
+            methods=methods,
+            parameters=parameters,
+            input_nodes=input_nodes,
+            output_nodes=output_nodes,
+            import_string=import_string,
+            function_string=function_string,
+        )
+
+        # Add the custom block to this user's canvas
+        canvas_store.update(
+            canvas_owner(),
+            lambda canvas: canvas.add_block(block_id, block),
+            pool=sandbox_pool,
+        )
 
         return jsonify(
             {
@@ -1364,70 +1913,19 @@ def create_custom_block():
                 "output_nodes": output_nodes,
             }
         )
+    except CanvasConflict as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/templates/save", methods=["POST"])
-def save_template():
-    """Save the current pipeline state as a template."""
-    try:
-        data = request.json
-        template_name = data.get("template_name", "My Template")
-        blocks_data = data.get("blocks", {})
-        connections_data = data.get("connections", [])
-
-        # Create a template object with all necessary data
-        template = {
-            "name": template_name,
-            "created_at": __import__("datetime").datetime.now().isoformat(),
-            "blocks": blocks_data,
-            "connections": connections_data,
-        }
-
-        # Just return the template JSON for the client to download
-        return jsonify(
-            {
-                "status": "success",
-                "message": "Template ready for download",
-                "template": template,
-            }
-        )
-    except Exception as e:
-        print(f"Template save error: {str(e)}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route("/api/templates/load", methods=["POST"])
-def load_template():
-    """Process an uploaded template file to restore a pipeline."""
-    try:
-        data = request.json
-        template_data = data.get("template")
-
-        if not template_data:
-            return jsonify({"error": "No template data provided"}), 400
-
-        # Basic validation of the template structure
-        if "blocks" not in template_data or "connections" not in template_data:
-            return jsonify({"error": "Invalid template format"}), 400
-
-        # Return success - client will handle the actual restoration
-        return jsonify({"status": "success", "message": "Template loaded successfully"})
-    except Exception as e:
-        print(f"Template load error: {str(e)}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
-
-
 @app.before_request
 def check_maintenance_mode():
     # Skip for static files and auth routes
     if request.path.startswith("/static") or request.path.startswith("/auth"):
         return
 
-    settings = AdminPanel.query.first()
+    settings = admin_settings_cache.get()
     if settings and settings.maintenance_mode:
         # Allow admins to access everything
         if current_user.is_authenticated and getattr(current_user, "is_admin", False):
@@ -1455,7 +1953,7 @@ def enforce_public_mode():
     ]:
         return
 
-    settings = AdminPanel.query.first()
+    settings = admin_settings_cache.get()
     if settings and not settings.public_mode:
         if not current_user.is_authenticated:
             # Store the current URL in the session
@@ -0,0 +1,102 @@
+"""In-process cache of the AdminPanel settings row.
+
+Every request checks maintenance and public mode, so reading the row from
+the database each time doubles the queries of cheap API calls. Workers
+keep a snapshot of the row in memory instead. Saving the settings bumps a
+small version file under instance/; each worker looks at that file's
+stat at most every ``check_interval`` seconds and reloads the row when it
+changed. ``max_age`` bounds how stale a snapshot can get when the file
+isn't shared, e.g. between nodes that only share the database.
+"""
+
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from models import AdminPanel
+
+SETTINGS_FIELDS = (
+    "maintenance_mode",
+    "maintenance_message",
+    "max_login_attempts",
+    "password_reset_timeout",
+    "public_mode",
+    "updated_at",
+)
+
+
+def version_signature(path):
+    """Identity of a version file's current contents, or None if it's missing."""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def bump_version(path):
+    """Replace the version file at ``path`` so every worker sees a change."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Replacing the file gives it a new inode even when mtime is coarse
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w") as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp, path)
+
+
+class SettingsCache:
+    """Snapshot of the AdminPanel row, shared by the requests of a worker."""
+
+    def __init__(self, version_path=None, check_interval=1.0, max_age=30.0):
+        self.version_path = version_path
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._settings = None
+        self._signature = None
+        self._loaded_at = None
+        self._checked_at = 0.0
+
+    def init_app(self, app):
+        self.version_path = app.config["SETTINGS_VERSION_PATH"]
+        self.check_interval = app.config["SETTINGS_CHECK_INTERVAL"]
+        self.max_age = app.config["SETTINGS_MAX_AGE"]
+
+    def _load(self):
+        row = AdminPanel.query.first()
+        if row is None:
+            return None
+        return SimpleNamespace(
+            **{field: getattr(row, field) for field in SETTINGS_FIELDS}
+        )
+
+    def get(self):
+        """The current settings (attribute access like the model), or None."""
+        now = time.monotonic()
+        with self._lock:
+            fresh = self._loaded_at is not None and now - self._loaded_at < self.max_age
+            if fresh and now - self._checked_at < self.check_interval:
+                return self._settings
+        signature = version_signature(self.version_path)
+        with self._lock:
+            self._checked_at = now
+            if fresh and signature == self._signature:
+                return self._settings
+        settings = self._load()
+        with self._lock:
+            self._settings = settings
+            self._signature = signature
+            self._loaded_at = now
+        return settings
+
+    def invalidate(self):
+        """Make every worker reload the settings; call after saving them."""
+        with self._lock:
+            self._loaded_at = None
+        if self.version_path:
+            bump_version(self.version_path)
+
+
+admin_settings_cache = SettingsCache()
@@ -0,0 +1,121 @@
+"""Hand NumPy arrays between worker processes through shared memory.
+
+A producing worker copies its output once into a ``SharedMemory`` segment
+and returns only a small descriptor. Consumers attach to the segment and
+get a zero-copy view. The parent process keeps a reference count per
+segment and unlinks it once nothing refers to it any more.
+"""
+
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def is_shared(value):
+    """Check whether a value is a shared-memory array descriptor."""
+    return isinstance(value, dict) and "shm_name" in value
+
+
+def export_array(array):
+    """Copy an array into a new segment and return its descriptor."""
+    array = np.ascontiguousarray(array)
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+    view[...] = array
+    del view
+    segment.close()
+    return {
+        "shm_name": segment.name,
+        "kind": "shared_ndarray",
+        "shape": list(array.shape),
+        "dtype": array.dtype.str,
+        "count": int(array.shape[0]) if array.ndim else 1,
+        "nbytes": int(array.nbytes),
+    }
+
+
+def attach_array(descriptor):
+    """Map a segment and return ``(array, segment)``.
+
+    The array is a view on the segment's buffer, so the segment must stay
+    open for as long as the array is used.
+    """
+    segment = shared_memory.SharedMemory(name=descriptor["shm_name"])
+    array = np.ndarray(
+        tuple(descriptor["shape"]),
+        dtype=np.dtype(descriptor["dtype"]),
+        buffer=segment.buf,
+    )
+    array.flags.writeable = False
+    return array, segment
+
+
+def close_quietly(segment):
+    """Close a mapping unless a view on it is still alive."""
+    try:
+        segment.close()
+    except BufferError:
+        # Something still holds a view; the mapping goes away with the worker
+        pass
+
+
+def copy_to_store(descriptor, store):
+    """Write a shared array to an ``ArtifactStore`` and return its handle."""
+    array, segment = attach_array(descriptor)
+    try:
+        return store.put_array(array)
+    finally:
+        del array
+        close_quietly(segment)
+
+
+class SharedArrayRegistry:
+    """Reference counts for segments created by sandbox workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refs = {}
+
+    def incref(self, value):
+        if not is_shared(value):
+            return
+        with self._lock:
+            self._refs[value["shm_name"]] = self._refs.get(value["shm_name"], 0) + 1
+
+    def decref(self, value):
+        """Drop one reference and unlink the segment when none are left."""
+        if not is_shared(value):
+            return
+        name = value["shm_name"]
+        with self._lock:
+            count = self._refs.get(name, 0) - 1
+            if count > 0:
+                self._refs[name] = count
+                return
+            self._refs.pop(name, None)
+        _unlink(name)
+
+    def refcount(self, value):
+        with self._lock:
+            return self._refs.get(value["shm_name"], 0)
+
+    def stats(self):
+        with self._lock:
+            return {"segments": len(self._refs), "references": sum(self._refs.values())}
+
+    def unlink_all(self):
+        with self._lock:
+            names = list(self._refs)
+            self._refs.clear()
+        for name in names:
+            _unlink(name)
+
+
+def _unlink(name):
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    segment.unlink()
@@ -0,0 +1,146 @@
+"""Local SMTP server that accepts mail and keeps it, for testing mail flows.
+
+Point the app at it instead of a real mail server::
+
+    python smtp_sink.py --port 1025
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=1025 MAIL_USE_TLS=false python server.py
+
+Received messages are printed and, with ``--maildir``, written there as
+``.eml`` files. ``--delay`` and ``--fail-first`` simulate a slow or
+flaky server, to exercise the outbox's timeouts and retries. From Python,
+``SMTPSink(port=0).start()`` runs it in a thread and collects messages in
+``sink.messages``.
+"""
+
+import argparse
+import os
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        sink = self.server.sink
+        self._reply("220 smtp-sink ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._reply("250-smtp-sink")
+                self._reply("250 8BITMIME")
+            elif verb == "HELO":
+                self._reply("250 smtp-sink")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[-1].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[-1].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    # Undo dot-stuffing
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                self._reply(sink.receive(sender, recipients, b"".join(lines)))
+                sender, recipients = None, []
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SMTPSink:
+    """Accepts every message, optionally after a delay or a few failures."""
+
+    def __init__(
+        self, host="127.0.0.1", port=1025, maildir=None, delay=0.0, fail_first=0
+    ):
+        self.maildir = maildir
+        self.delay = delay
+        self.fail_first = fail_first
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.sink = self
+        self.address = self._server.server_address
+
+    def receive(self, sender, recipients, data):
+        """Store one message; returns the SMTP reply for it."""
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return "451 Temporary failure, try again later"
+            message = message_from_bytes(data)
+            self.messages.append(
+                {"sender": sender, "recipients": recipients, "message": message}
+            )
+            count = len(self.messages)
+        print(
+            f"Mail {count} from {sender} to {', '.join(recipients)}: {message['Subject']}"
+        )
+        if self.maildir:
+            os.makedirs(self.maildir, exist_ok=True)
+            path = os.path.join(self.maildir, f"{time.time_ns()}-{count}.eml")
+            with open(path, "wb") as f:
+                f.write(data)
+        return "250 OK"
+
+    def start(self):
+        thread = threading.Thread(
+            target=self._server.serve_forever, name="smtp-sink", daemon=True
+        )
+        thread.start()
+        return self
+
+    def serve_forever(self):
+        print(f"SMTP sink listening on {self.address[0]}:{self.address[1]}")
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--maildir", help="also write messages here as .eml files")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per message")
+    parser.add_argument(
+        "--fail-first", type=int, default=0, help="reject this many messages first"
+    )
+    args = parser.parse_args()
+    SMTPSink(
+        args.host, args.port, args.maildir, args.delay, args.fail_first
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -330,6 +330,74 @@ document.addEventListener('DOMContentLoaded', () => {
         };
     }
 
+    // Blocks and connections in the shape export, templates and /api/canvas/sync use
+    function collectCanvasDocument() {
+        const blockConfigs = {};
+        document.querySelectorAll('.block').forEach(block => {
+            const blockId = block.getAttribute('id');
+
+            const blockType = block.getAttribute('data-block-type');
+
+            // For custom blocks, include the full module path and class name
+            let finalBlockType = blockType;
+            if (blockType === 'custom') {
+                const className = block.getAttribute('data-class-name');
+
+                // Find module info from sessionStorage to get the full path
+                let moduleInfo = null;
+                try {
+                    const customBlocks = JSON.parse(sessionStorage.getItem('customBlocks') || '[]');
+                    const blockData = customBlocks.find(b => b.id === blockId || b.className === className);
+
+                    moduleInfo = {
+                        module: blockData.moduleInfo.module,
+                        library: blockData.moduleInfo.library
+                    };
+
+                } catch (e) {
+                    console.warn('Error finding module info in sessionStorage:', e);
+                }
+                // Create a custom type identifier
+                if (moduleInfo) {
+                    finalBlockType = `custom_${moduleInfo.module}.${className}`;
+                }
+            }
+
+            // Generate configuration for this block
+            blockConfigs[blockId] = {
+                type: finalBlockType,
+                config: getBlockConfig(block)
+            };
+        });
+
+        // Format connections for the server
+        const formattedConnections = (window.connections || []).map(conn => {
+            // Create a basic connection object
+            const formattedConn = {
+                source: conn.source,
+                target: conn.target,
+                inputId: conn.inputId
+            };
+
+            // Add method-specific information if available
+            if (conn.sourceMethod) {
+                formattedConn.sourceMethod = conn.sourceMethod;
+            }
+
+            if (conn.targetMethod) {
+                formattedConn.targetMethod = conn.targetMethod;
+            }
+
+            if (conn.sourceNode) {
+                formattedConn.sourceNode = conn.sourceNode;
+            }
+
+            return formattedConn;
+        });
+
+        return { blocks: blockConfigs, connections: formattedConnections };
+    }
+
     // Update the exportPipeline function
     async function exportPipeline() {
         console.log('Starting export process...');
@@ -345,72 +413,16 @@ document.addEventListener('DOMContentLoaded', () => {
             updateProgress(25, 'Collecting block configurations');
 
             try {
-                // Get the block configurations and connections
-                const blockConfigs = {};
-                document.querySelectorAll('.block').forEach(block => {
-                    const blockId = block.getAttribute('id');
-
-                    const blockType = block.getAttribute('data-block-type');
-
-                    // For custom blocks, include the full module path and class name
-                    let finalBlockType = blockType;
-                    if (blockType === 'custom') {
-                        const className = block.getAttribute('data-class-name');
-
-                        // Find module info from sessionStorage to get the full path
-                        let moduleInfo = null;
-                        try {
-                            const customBlocks = JSON.parse(sessionStorage.getItem('customBlocks') || '[]');
-                            const blockData = customBlocks.find(b => b.id === blockId || b.className === className);
-
-                            moduleInfo = {
-                                module: blockData.moduleInfo.module,
-                                library: blockData.moduleInfo.library
-                            };
-
-                        } catch (e) {
-                        console.warn('Error finding module info in sessionStorage:', e);
-                        }
-                            // Create a custom type identifier
-                        const modulePath = moduleInfo.module;
-                        finalBlockType = `custom_${modulePath}.${className}`;
-
-                    }
-
-                    // Generate configuration for this block
-                    blockConfigs[blockId] = {
-                        type: finalBlockType,
-                        config: getBlockConfig(block)
-                    };
-                });
-
-                // Format connections for the server
-                const formattedConnections = window.connections.map(conn => {
-                    // Create a basic connection object
-                    const formattedConn = {
-                        source: conn.source,
-                        target: conn.target,
-                        inputId: conn.inputId
-                    };
-
-                    // Add method-specific information if available
-                    if (conn.sourceMethod) {
-                        formattedConn.sourceMethod = conn.sourceMethod;
-                    }
-
-                    if (conn.targetMethod) {
-                        formattedConn.targetMethod = conn.targetMethod;
-                    }
-
-                    if (conn.sourceNode) {
-                        formattedConn.sourceNode = conn.sourceNode;
-                    }
-
-                    return formattedConn;
-                });
-
-                // Log the formatted connections for debugging
-                console.log('Formatted connections for export:', formattedConnections);
+                // Once the server's copy is current, export that instead of
+                // sending the whole pipeline again
+                const payload = { output_file: 'generated_pipeline.py' };
+                if (await flushCanvasSync()) {
+                    payload.from_canvas = true;
+                } else {
+                    const { blocks: blockConfigs, connections: formattedConnections } = collectCanvasDocument();
+                    payload.blocks = blockConfigs;
+                    payload.connections = formattedConnections;
+                }
 
                 updateProgress(50, 'Sending pipeline data to server');
             // Call the export API
@@ -419,11 +431,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     headers: {
                         'Content-Type': 'application/json'
                     },
-                    body: JSON.stringify({
-                        blocks: blockConfigs,
-                        connections: formattedConnections,
-                        output_file: 'generated_pipeline.py'
-                    })
+                    body: JSON.stringify(payload)
                 });
 
                 if (!response.ok) {
@@ -516,6 +524,130 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Keep the server's copy of the canvas up to date by sending only what
+    // changed since the last sync (see canvas_sync.py). Syncs run one at a
+    // time, in order.
+    const canvasSync = { version: null, synced: null, timer: null, queue: Promise.resolve() };
+
+    // JSON with sorted keys, since the server's copy comes back key-sorted
+    function canonicalJson(value) {
+        if (Array.isArray(value)) {
+            return `[${value.map(canonicalJson).join(',')}]`;
+        }
+        if (value && typeof value === 'object') {
+            // Like JSON.stringify, leave out undefined members
+            return `{${Object.keys(value).filter(key => value[key] !== undefined).sort()
+                .map(key => `${JSON.stringify(key)}:${canonicalJson(value[key])}`).join(',')}}`;
+        }
+        return JSON.stringify(value === undefined ? null : value);
+    }
+
+    function canvasSyncOps(previous, current) {
+        const ops = [];
+        Object.keys(previous.blocks).forEach(id => {
+            if (!(id in current.blocks)) {
+                ops.push({ op: 'remove_block', id });
+            }
+        });
+        Object.entries(current.blocks).forEach(([id, block]) => {
+            if (canonicalJson(previous.blocks[id]) !== canonicalJson(block)) {
+                ops.push({ op: 'add_block', id, block });
+            }
+        });
+        const before = new Set(previous.connections.map(canonicalJson));
+        const after = new Set(current.connections.map(canonicalJson));
+        previous.connections.forEach(connection => {
+            if (!after.has(canonicalJson(connection))) {
+                ops.push({ op: 'remove_connection', connection });
+            }
+        });
+        current.connections.forEach(connection => {
+            if (!before.has(canonicalJson(connection))) {
+                ops.push({ op: 'add_connection', connection });
+            }
+        });
+        return ops;
+    }
+
+    function postCanvasOps(baseVersion, ops) {
+        return fetch('/api/canvas/sync', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ base_version: baseVersion, ops })
+        });
+    }
+
+    async function loadServerCanvas() {
+        const response = await fetch('/api/canvas');
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const serverCanvas = await response.json();
+        canvasSync.version = serverCanvas.version;
+        return { blocks: serverCanvas.blocks || {}, connections: serverCanvas.connections || [] };
+    }
+
+    async function runCanvasSync() {
+        try {
+            const current = collectCanvasDocument();
+            // The first sync of a page diffs against the server's copy
+            const base = canvasSync.synced || await loadServerCanvas();
+            const ops = canvasSyncOps(base, current);
+            if (ops.length) {
+                let response = await postCanvasOps(canvasSync.version, ops);
+                if (response.status === 409) {
+                    // Changed elsewhere (e.g. another tab): replay these edits
+                    // on its latest version, skipping blocks already removed
+                    const latest = await loadServerCanvas();
+                    const rebased = ops.filter(op => op.op !== 'remove_block' || op.id in latest.blocks);
+                    response = await postCanvasOps(canvasSync.version, rebased);
+                }
+                // A 400 means the edits themselves are invalid; resending won't help
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                canvasSync.version = (await response.json()).version;
+            }
+            canvasSync.synced = current;
+        } catch (error) {
+            console.warn('Canvas sync failed:', error);
+            // Start again from the server's copy next time
+            canvasSync.synced = null;
+        }
+    }
+
+    function syncCanvas() {
+        canvasSync.queue = canvasSync.queue.then(runCanvasSync);
+        return canvasSync.queue;
+    }
+
+    // Sync now; true if the server's copy matches the editor afterwards
+    async function flushCanvasSync() {
+        clearTimeout(canvasSync.timer);
+        await syncCanvas();
+        return canvasSync.synced !== null
+            && canonicalJson(canvasSync.synced) === canonicalJson(collectCanvasDocument());
+    }
+    window.flushCanvasSync = flushCanvasSync;
+    window.collectCanvasDocument = collectCanvasDocument;
+
+    function scheduleCanvasSync() {
+        clearTimeout(canvasSync.timer);
+        canvasSync.timer = setTimeout(syncCanvas, 500);
+    }
+    window.scheduleCanvasSync = scheduleCanvasSync;
+
+    // Blocks and connections being added or removed, and edited settings
+    new MutationObserver(mutations => {
+        if (mutations.some(m => m.type === 'childList')) {
+            scheduleCanvasSync();
+        }
+    }).observe(canvasContainer, { childList: true, subtree: true });
+    canvasContainer.addEventListener('input', scheduleCanvasSync);
+    canvasContainer.addEventListener('change', scheduleCanvasSync);
+
     // Helper function to escape HTML
     function escapeHtml(text) {
         const div = document.createElement('div');
@@ -523,6 +655,12 @@ document.addEventListener('DOMContentLoaded', () => {
         return div.innerHTML;
     }
 
+    // Group block runs by the loaded template; the server derives the
+    // pipeline id from it and the canvas owner
+    function getTemplateId() {
+        return window.currentTemplateId || null;
+    }
+
     // Update block processing function
     async function processBlock(block) {
         const blockId = block.id;
@@ -560,10 +698,16 @@ document.addEventListener('DOMContentLoaded', () => {
                     block_id: blockId,
                     type: isCustomBlock ? type.substring(7) : type, // Remove 'custom_' prefix if it's a custom block
                     config: config,
-                    debug_mode: debugMode
+                    debug_mode: debugMode,
+                    template_id: getTemplateId()
                 })
             });
 
+            if (response.status === 409) {
+                // e.g. an upstream block has no output yet
+                const conflict = await response.json();
+                throw new Error(conflict.error || 'Conflict');
+            }
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -1480,15 +1624,102 @@ document.addEventListener('DOMContentLoaded', () => {
         block.dataset.output = JSON.stringify(result);
 
         
+        // Large outputs only come back as a preview; remember where the next page starts
+        if (result.preview && result.preview.next_cursor) {
+            block.dataset.nextCursor = result.preview.next_cursor;
+        } else {
+            delete block.dataset.nextCursor;
+        }
+
         if (type.startsWith('custom_')) {
             // Handle custom blocks
             const statusText = block.querySelector('.status');
             if (statusText) {
                 statusText.textContent = result.output || 'Processed successfully';
+                statusText.title = '';
+                if (result.preview && result.preview.truncated) {
+                    statusText.title = `Showing ${result.preview.items.length} of ${result.preview.count}`;
+                }
+            }
+            updateLoadMoreButton(block);
+        }
+    }
+
+    // Show a "Load more" control under a block while its output has more pages
+    function updateLoadMoreButton(block) {
+        let button = block.querySelector('.output-load-more');
+        if (!block.dataset.nextCursor) {
+            if (button) button.remove();
+            return;
+        }
+        if (!button) {
+            button = document.createElement('button');
+            button.className = 'output-load-more';
+            button.type = 'button';
+            button.textContent = 'Load more';
+            button.addEventListener('mousedown', e => e.stopPropagation());
+            button.addEventListener('click', async e => {
+                e.stopPropagation();
+                button.disabled = true;
+                try {
+                    await loadMoreOutput(block);
+                } catch (error) {
+                    showToast(error.message, 'error');
+                    delete block.dataset.nextCursor;
+                }
+                button.disabled = false;
+                updateLoadMoreButton(block);
+            });
+            const statusText = block.querySelector('.status');
+            if (statusText) {
+                statusText.insertAdjacentElement('afterend', button);
+            } else {
+                block.appendChild(button);
+            }
+        }
+    }
+
+    // Append the next page to the preview kept in the block's dataset
+    async function loadMoreOutput(block) {
+        const page = await fetchNextOutputPage(block);
+        if (!page) return;
+        const result = JSON.parse(block.dataset.output || '{}');
+        if (result.preview) {
+            result.preview.items = result.preview.items.concat(page.items || []);
+            result.preview.truncated = Boolean(page.next_cursor);
+            result.preview.next_cursor = page.next_cursor;
+            block.dataset.output = JSON.stringify(result);
+            const statusText = block.querySelector('.status');
+            if (statusText) {
+                statusText.title = `Showing ${result.preview.items.length} of ${result.preview.count}`;
             }
         }
     }
 
+    // Fetch the next page of a block's output from the server
+    async function fetchNextOutputPage(block) {
+        const cursor = block.dataset.nextCursor;
+        if (!cursor) return null;
+
+        const response = await fetch(`/api/blocks/${encodeURIComponent(block.id)}/output?cursor=${encodeURIComponent(cursor)}`);
+        if (response.status === 409) {
+            // The block ran again since this preview; its pages don't mix
+            throw new Error('Block output changed; run the block again to page through it');
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const page = await response.json();
+        if (page.next_cursor) {
+            block.dataset.nextCursor = page.next_cursor;
+        } else {
+            delete block.dataset.nextCursor;
+        }
+        return page;
+    }
+    window.fetchNextOutputPage = fetchNextOutputPage;
+
     // Modify the makeBlockDraggable function to ensure proper coordination with global handlers
     function makeBlockDraggable(block) {
         const dragHandle = block.querySelector('.block-drag-handle');
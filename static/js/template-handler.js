@@ -498,6 +498,7 @@ class TemplateHandler {
             
             // Save template to localStorage
             this.saveTemplateToStorage(template);
+            await this.saveTemplateToServer(templateName);
             
             // Close the modal
             const modal = document.getElementById('save-template-modal');
@@ -557,6 +558,36 @@ class TemplateHandler {
         }, 100);
     }
     
+    /**
+     * Stores the canvas as a template on the server. Once the canvas is
+     * synced the server already has it, so only the name is sent.
+     * @param {string} name - The template name
+     */
+    async saveTemplateToServer(name) {
+        try {
+            const payload = { template_name: name };
+            if (window.flushCanvasSync && await window.flushCanvasSync()) {
+                payload.from_canvas = true;
+            } else if (window.collectCanvasDocument) {
+                Object.assign(payload, window.collectCanvasDocument());
+            } else {
+                return;
+            }
+            const response = await fetch('/api/templates/save', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload)
+            });
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+            }
+        } catch (error) {
+            // The downloaded file is still there
+            console.warn('Could not store the template on the server:', error);
+        }
+    }
+    
     /**
      * Saves the template to localStorage
      * @param {Object} template - The template data
@@ -908,6 +939,9 @@ class TemplateHandler {
                 
                 this.updateProgress(90, 'Loading configuration');
                 
+                // Block runs are profiled and cached per template
+                window.currentTemplateId = templateData.id || templateData.name || null;
+
                 // Show success message
                 this.updateProgress(100, 'Template loaded successfully');
                 if (typeof window.showToast === 'function') {
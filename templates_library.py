@@ -0,0 +1,320 @@
+"""Pipeline templates stored server-side, compressed and deduplicated.
+
+A template's blocks and connections are serialized to canonical JSON,
+compressed with zstd (or gzip when ``zstandard`` isn't installed) and
+stored once per SHA-256 in ``TemplateBlob``. Each saved template is a
+small ``Template`` row pointing at its blob, with a summary (block count,
+classes used, size) computed at save time so listings never touch the
+compressed bodies.
+
+Templates are private to whoever saved them (a user, or the browser
+session when not logged in) unless saved with ``public: true``.
+"""
+
+import gzip
+import hashlib
+import json
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from canvas_store import canvas_owner
+from models import Template, TemplateBlob, db
+from pagination import decode_cursor, encode_cursor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+templates = Blueprint("templates", __name__)
+
+ZSTD_LEVEL = 10
+MAX_PAGE_SIZE = 200
+
+
+def _owner_id():
+    return current_user.id if current_user.is_authenticated else None
+
+
+def _is_admin():
+    return current_user.is_authenticated and getattr(current_user, "is_admin", False)
+
+
+def _owns(template):
+    return template.owner is not None and template.owner == canvas_owner()
+
+
+def _visible(template):
+    return template.public or _owns(template) or _is_admin()
+
+
+def canonical_json(blocks, connections):
+    """Byte-stable JSON of a template body, used for hashing and storage."""
+    return json.dumps(
+        {"blocks": blocks, "connections": connections},
+        sort_keys=True,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def compress(raw):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "gzip", gzip.compress(raw, compresslevel=9)
+
+
+def decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read this template")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"Unknown template codec: {codec}")
+
+
+def template_classes(blocks):
+    """Sorted class paths used by a template's blocks."""
+    classes = set()
+    for block in blocks.values():
+        if not isinstance(block, dict):
+            continue
+        class_name = block.get("className")
+        module_info = (block.get("config") or {}).get("moduleInfo") or {}
+        if class_name and module_info.get("module"):
+            classes.add(f"{module_info['module']}.{class_name}")
+        elif class_name:
+            classes.add(class_name)
+        elif block.get("type"):
+            # Exported blocks use "custom_<module>.<Class>" as their type
+            classes.add(block["type"].removeprefix("custom_"))
+    return sorted(classes)
+
+
+def _summary(template, blob=None):
+    summary = {
+        "id": template.id,
+        "name": template.name,
+        "block_count": template.block_count,
+        "connection_count": template.connection_count,
+        "classes": json.loads(template.classes or "[]"),
+        "size": template.size,
+        "sha256": template.sha256,
+        "owned": _owns(template),
+        "public": bool(template.public),
+        "created_at": template.created_at.isoformat() if template.created_at else None,
+    }
+    if blob is not None:
+        summary["codec"] = blob.codec
+        summary["compressed_size"] = blob.compressed_size
+    return summary
+
+
+def _body(template):
+    """Decompressed template, or None if its blob was deleted meanwhile."""
+    blob = TemplateBlob.query.get(template.sha256)
+    if blob is None:
+        # A concurrent delete removed the blob this template deduplicated onto
+        return None
+    body = json.loads(decompress(blob.codec, blob.data))
+    return {
+        **body,
+        "id": template.id,
+        "name": template.name,
+        "created_at": template.created_at.isoformat() if template.created_at else None,
+    }
+
+
+@templates.route("/save", methods=["POST"])
+def save_template():
+    """Store the current pipeline state as a template."""
+    try:
+        data = request.json or {}
+        template_name = data.get("template_name") or "My Template"
+        if not isinstance(template_name, str):
+            return jsonify({"error": "template_name must be a string"}), 400
+        template_name = template_name[:200]
+        public = bool(data.get("public", False))
+        blocks_data = data.get("blocks", {})
+        connections_data = data.get("connections", [])
+        if data.get("from_canvas"):
+            # Use the copy kept up to date through /api/canvas/sync
+            store = current_app.extensions["canvas_store"]
+            document = store.get(canvas_owner()).document
+            blocks_data, connections_data = document["blocks"], document["connections"]
+        if not isinstance(blocks_data, dict) or not isinstance(connections_data, list):
+            return jsonify({"error": "Invalid template format"}), 400
+
+        raw = canonical_json(blocks_data, connections_data)
+        digest = hashlib.sha256(raw).hexdigest()
+        blob = TemplateBlob.query.get(digest)
+        deduplicated = blob is not None
+        if blob is None:
+            codec, compressed = compress(raw)
+            blob = TemplateBlob(
+                sha256=digest,
+                codec=codec,
+                data=compressed,
+                size=len(raw),
+                compressed_size=len(compressed),
+            )
+            db.session.add(blob)
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # Someone saved the same content at the same moment
+                db.session.rollback()
+                blob = TemplateBlob.query.get(digest)
+                deduplicated = True
+
+        # Saving the same content under the same name again is a no-op
+        owner = canvas_owner()
+        template = Template.query.filter_by(
+            owner=owner, name=template_name, sha256=digest
+        ).first()
+        if template is not None:
+            template.public = public
+        else:
+            template = Template(
+                user_id=_owner_id(),
+                owner=owner,
+                public=public,
+                name=template_name,
+                sha256=digest,
+                block_count=len(blocks_data),
+                connection_count=len(connections_data),
+                classes=json.dumps(template_classes(blocks_data)),
+                size=len(raw),
+            )
+            db.session.add(template)
+        db.session.commit()
+
+        return jsonify(
+            {
+                "status": "success",
+                "message": "Template saved",
+                "deduplicated": deduplicated,
+                "summary": _summary(template, blob),
+                "template": {
+                    "id": template.id,
+                    "name": template.name,
+                    "created_at": template.created_at.isoformat(),
+                    "blocks": blocks_data,
+                    "connections": connections_data,
+                },
+            }
+        )
+    except Exception as e:
+        db.session.rollback()
+        print(f"Template save error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@templates.route("", methods=["GET"])
+def list_templates():
+    """Page through template summaries, newest first.
+
+    Lists the caller's own templates and public ones (admins see all).
+    Uses keyset pagination on the id, so every page costs the same.
+    ``?mine=1`` limits the list to the caller's own templates.
+    """
+    limit = max(1, min(request.args.get("limit", 50, type=int), MAX_PAGE_SIZE))
+    query = Template.query
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            before_id, _ = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query = query.filter(Template.id < before_id)
+    if request.args.get("mine"):
+        query = query.filter(Template.owner == canvas_owner())
+    elif not _is_admin():
+        query = query.filter(
+            or_(Template.public.is_(True), Template.owner == canvas_owner())
+        )
+    rows = query.order_by(Template.id.desc()).limit(limit + 1).all()
+
+    page = rows[:limit]
+    return jsonify(
+        {
+            "templates": [_summary(template) for template in page],
+            "next_cursor": (
+                encode_cursor(page[-1].id) if len(rows) > limit and page else None
+            ),
+        }
+    )
+
+
+@templates.route("/<int:template_id>", methods=["GET"])
+def get_template(template_id):
+    template = Template.query.get(template_id)
+    if template is None or not _visible(template):
+        return jsonify({"error": "Template not found"}), 404
+    body = _body(template)
+    if body is None:
+        return jsonify({"error": "Template not found"}), 404
+    return jsonify({"status": "success", "template": body})
+
+
+@templates.route("/<int:template_id>", methods=["DELETE"])
+def delete_template(template_id):
+    """Delete one of the caller's templates; the blob goes with its last user."""
+    template = Template.query.get(template_id)
+    if template is None or not _visible(template):
+        return jsonify({"error": "Template not found"}), 404
+    if not _owns(template) and not _is_admin():
+        return jsonify({"error": "Not your template"}), 403
+
+    sha256 = template.sha256
+    db.session.delete(template)
+    db.session.flush()
+    if not Template.query.filter_by(sha256=sha256).first():
+        TemplateBlob.query.filter_by(sha256=sha256).delete()
+    db.session.commit()
+    return jsonify({"status": "success", "message": "Template deleted"})
+
+
+@templates.route("/load", methods=["POST"])
+def load_template():
+    """Validate an uploaded template, or fetch a stored one by ``template_id``."""
+    try:
+        data = request.json or {}
+        template_id = data.get("template_id")
+        if template_id is not None:
+            if isinstance(template_id, str) and template_id.isdecimal():
+                template_id = int(template_id)
+            if (
+                not isinstance(template_id, int)
+                or isinstance(template_id, bool)
+                or not 0 < template_id < 2**63
+            ):
+                return jsonify({"error": "template_id must be an integer"}), 400
+            template = Template.query.get(template_id)
+            body = _body(template) if template and _visible(template) else None
+            if body is None:
+                return jsonify({"error": "Template not found"}), 404
+            return jsonify(
+                {
+                    "status": "success",
+                    "message": "Template loaded successfully",
+                    "template": body,
+                }
+            )
+
+        template_data = data.get("template")
+        if not template_data:
+            return jsonify({"error": "No template data provided"}), 400
+
+        # Basic validation of the template structure
+        if "blocks" not in template_data or "connections" not in template_data:
+            return jsonify({"error": "Invalid template format"}), 400
+
+        # Return success - client will handle the actual restoration
+        return jsonify({"status": "success", "message": "Template loaded successfully"})
+    except Exception as e:
+        print(f"Template load error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
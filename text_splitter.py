@@ -0,0 +1,211 @@
+"""Recursive character splitting on offsets instead of substrings.
+
+Produces the same chunks as LangChain's ``RecursiveCharacterTextSplitter``
+with literal separators and ``len`` as the length function. The text is
+never cut into intermediate pieces: separators are found with precompiled
+patterns directly in the original string, pieces are ``(start, end)``
+offsets held in NumPy arrays, and the merge step uses prefix sums of the
+piece lengths so dropping the overlap is one binary search per chunk.
+Strings are only created for the final chunks.
+"""
+
+import bisect
+import copy
+import re
+
+import numpy as np
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+
+class RecursiveTextSplitter:
+    """Split text on a list of separators, trying each in turn."""
+
+    def __init__(
+        self,
+        chunk_size=4000,
+        chunk_overlap=200,
+        separators=None,
+        keep_separator=True,
+        strip_whitespace=True,
+        add_start_index=False,
+    ):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if chunk_overlap < 0:
+            raise ValueError(f"chunk_overlap must be >= 0, got {chunk_overlap}")
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size "
+                f"({chunk_size}), should be smaller."
+            )
+        if keep_separator not in (True, False, "start", "end"):
+            raise ValueError(f"Invalid keep_separator: {keep_separator!r}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators or DEFAULT_SEPARATORS)
+        self.keep_separator = keep_separator
+        self.strip_whitespace = strip_whitespace
+        self.add_start_index = add_start_index
+        self._patterns = [re.compile(re.escape(s)) for s in self.separators]
+
+    def _matches(self, text, codes, start, end, level):
+        """Start and end offsets of the separator's matches in a span."""
+        separator = self.separators[level]
+        width = len(separator)
+        if len(set(separator)) == 1:
+            # One character, maybe repeated ("\n\n"): compare the code points
+            # once, then cut each run of that character into matches the way
+            # a left-to-right regex scan would
+            hits = np.flatnonzero(codes[start:end] == ord(separator[0])) + start
+            if width == 1:
+                return hits, hits + 1
+            breaks = np.flatnonzero(np.diff(hits) != 1) + 1
+            run_starts = hits[np.concatenate(([0], breaks))] if len(hits) else hits
+            run_lengths = np.diff(np.concatenate(([0], breaks, [len(hits)])))
+            per_run = run_lengths // width
+            found = np.repeat(run_starts, per_run) + width * (
+                np.arange(per_run.sum())
+                - np.repeat(np.cumsum(per_run) - per_run, per_run)
+            )
+            return found, found + width
+        matches = [m.span() for m in self._patterns[level].finditer(text, start, end)]
+        found = np.array(matches, dtype=np.int64).reshape(-1, 2)
+        return found[:, 0], found[:, 1]
+
+    def _pieces(self, text, codes, start, end, level):
+        """Offsets of the pieces of ``text[start:end]`` split at one separator."""
+        if not self.separators[level]:
+            bounds = np.arange(start, end + 1, dtype=np.int64)
+            return bounds[:-1], bounds[1:]
+
+        match_starts, match_ends = self._matches(text, codes, start, end, level)
+        if self.keep_separator == "end":
+            starts = np.concatenate(([start], match_ends))
+            ends = np.concatenate((match_ends, [end]))
+        elif self.keep_separator:
+            starts = np.concatenate(([start], match_starts))
+            ends = np.concatenate((match_starts, [end]))
+        else:
+            starts = np.concatenate(([start], match_ends))
+            ends = np.concatenate((match_starts, [end]))
+        keep = ends > starts
+        return starts[keep], ends[keep]
+
+    def _join(self, text, starts, ends, first, stop, separator):
+        """The chunk made of pieces ``first`` to ``stop - 1``, or None."""
+        if separator:
+            chunk = separator.join(
+                text[s:e] for s, e in zip(starts[first:stop], ends[first:stop])
+            )
+        else:
+            # Pieces that keep their separators are contiguous in the text
+            chunk = text[starts[first] : ends[stop - 1]]
+        if self.strip_whitespace:
+            chunk = chunk.strip()
+        return chunk or None
+
+    def _merge(self, text, starts, ends, separator, chunks):
+        """Greedily pack pieces into chunks, carrying over up to the overlap.
+
+        Works chunk by chunk rather than piece by piece: with prefix sums
+        of the piece lengths, both where a chunk has to end and how many
+        pieces to carry over into the next one are binary searches.
+        """
+        count = len(starts)
+        sep_len = len(separator)
+        # prefix[j] - prefix[i] - sep_len is the joined length of pieces i..j-1
+        prefix = np.concatenate(([0], np.cumsum(ends - starts + sep_len))).tolist()
+        starts, ends = starts.tolist(), ends.tolist()
+        limit = self.chunk_size + sep_len
+        overlap_floor = sep_len + self.chunk_overlap
+        room_floor = sep_len + self.chunk_size
+        bisect_left, bisect_right = bisect.bisect_left, bisect.bisect_right
+        first = 0
+        while True:
+            # The first piece that doesn't fit after pieces first..j-1
+            j = bisect_right(prefix, prefix[first] + limit) - 1
+            if j >= count:
+                break
+            chunk = self._join(text, starts, ends, first, j, separator)
+            if chunk is not None:
+                chunks.append(chunk)
+            # Keep at most chunk_overlap, and leave room for piece j
+            floor = max(prefix[j] - overlap_floor, prefix[j + 1] - room_floor)
+            first = bisect_left(prefix, floor, first, j)
+        chunk = self._join(text, starts, ends, first, count, separator)
+        if chunk is not None:
+            chunks.append(chunk)
+
+    def _split(self, text, codes, start, end, level, chunks):
+        # Use the first separator that occurs in this span
+        for i in range(level, len(self.separators)):
+            separator = self.separators[i]
+            if not separator or text.find(separator, start, end) != -1:
+                level = i
+                break
+        else:
+            level = len(self.separators) - 1
+        deeper = level + 1 < len(self.separators) and self.separators[level] != ""
+
+        starts, ends = self._pieces(text, codes, start, end, level)
+        separator = "" if self.keep_separator else self.separators[level]
+        large = np.flatnonzero((ends - starts) >= self.chunk_size).tolist()
+
+        # Merge runs of small pieces; split oversized ones further
+        run_start = 0
+        for k in large + [len(starts)]:
+            if k > run_start:
+                self._merge(
+                    text, starts[run_start:k], ends[run_start:k], separator, chunks
+                )
+            if k == len(starts):
+                break
+            if deeper:
+                self._split(
+                    text, codes, int(starts[k]), int(ends[k]), level + 1, chunks
+                )
+            else:
+                chunks.append(text[starts[k] : ends[k]])
+            run_start = k + 1
+
+    def split_text(self, text):
+        """Split a string into chunks of at most ``chunk_size`` characters."""
+        if self.keep_separator and len(text) < self.chunk_size:
+            # Everything fits in one chunk, no need to look for separators
+            chunk = text.strip() if self.strip_whitespace else text
+            return [chunk] if chunk else []
+        chunks = []
+        if text:
+            codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+            self._split(text, codes, 0, len(text), 0, chunks)
+        return chunks
+
+    def create_documents(self, texts, metadatas=None):
+        from langchain_core.documents import Document
+
+        metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, metadatas):
+            index = 0
+            previous_chunk_len = 0
+            for chunk in self.split_text(text):
+                chunk_metadata = copy.deepcopy(metadata)
+                if self.add_start_index:
+                    offset = index + previous_chunk_len - self.chunk_overlap
+                    index = text.find(chunk, max(0, offset))
+                    chunk_metadata["start_index"] = index
+                    previous_chunk_len = len(chunk)
+                documents.append(Document(page_content=chunk, metadata=chunk_metadata))
+        return documents
+
+    def split_documents(self, documents):
+        """Split documents, copying each one's metadata onto its chunks."""
+        documents = list(documents)
+        return self.create_documents(
+            [doc.page_content for doc in documents],
+            [doc.metadata for doc in documents],
+        )
+
+    def transform_documents(self, documents, **kwargs):
+        return self.split_documents(documents)
@@ -0,0 +1,375 @@
+"""Resumable, chunked uploads of documents into files/.
+
+Chunks are streamed straight to a ``.part`` file with a fixed-size read
+buffer, so a worker's memory use doesn't depend on the upload size. The
+SHA-256 is updated as each chunk arrives while the chunks keep landing
+on the same worker; otherwise the file is hashed once when it is
+complete. A finished file whose content is already in files/ is not
+stored a second time.
+
+A request claims the upload's current offset in the database before it
+writes, so two requests sending the same chunk can't both write the
+``.part`` file. The quota is per user, or per client IP for anonymous
+users (a new session would otherwise get a fresh quota), and pending
+uploads that saw no chunk for ``UPLOAD_STALE_SECONDS`` are deleted when
+the next upload starts.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy import func, or_
+from werkzeug.utils import secure_filename
+
+from canvas_store import canvas_owner
+from models import Upload, db
+
+uploads = Blueprint("uploads", __name__)
+
+# Size of the buffer used to copy the request body to disk
+COPY_BUFFER = 64 * 1024
+# How long a chunk write may hold its claim before another request can
+# take over, e.g. after the worker writing it died
+CLAIM_SECONDS = 120
+
+
+class _HasherCache:
+    """In-progress SHA-256 objects for recently active uploads.
+
+    If a chunk lands on a worker that doesn't have the hasher (another
+    gunicorn worker, or a restart), the upload is hashed in full once it
+    is complete; rehashing the prefix on every miss would be quadratic.
+    """
+
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def take(self, upload_id, offset):
+        """Remove and return the hasher if it is at ``offset``."""
+        with self._lock:
+            item = self._items.pop(upload_id, None)
+        if item and item[1] == offset:
+            return item[0]
+        return None
+
+    def put(self, upload_id, hasher, offset):
+        with self._lock:
+            self._items[upload_id] = (hasher, offset)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, upload_id):
+        with self._lock:
+            self._items.pop(upload_id, None)
+
+
+hashers = _HasherCache()
+
+
+def _owner_id():
+    return current_user.id if current_user.is_authenticated else None
+
+
+def _part_path(upload_id):
+    return os.path.join(current_app.config["UPLOAD_TMP_DIR"], upload_id + ".part")
+
+
+def _hash_file(path, length):
+    """Rebuild a hasher from the first ``length`` bytes of a file."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining:
+            block = f.read(min(COPY_BUFFER, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _quota_key():
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    return f"ip:{request.remote_addr}"
+
+
+def _used_bytes(quota_key):
+    """Bytes counted against a quota, pending uploads included."""
+    return (
+        db.session.query(func.coalesce(func.sum(Upload.size), 0))
+        .filter(Upload.quota_key == quota_key, Upload.deduplicated.is_(False))
+        .scalar()
+    )
+
+
+def purge_stale():
+    """Delete pending uploads that saw no chunk for a while; returns how many."""
+    cutoff = datetime.utcnow() - timedelta(
+        seconds=current_app.config["UPLOAD_STALE_SECONDS"]
+    )
+    stale = Upload.query.filter(
+        Upload.status == "pending", Upload.updated_at < cutoff
+    ).all()
+    for upload in stale:
+        hashers.discard(upload.id)
+        if os.path.exists(_part_path(upload.id)):
+            os.remove(_part_path(upload.id))
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
+
+
+def _status(upload):
+    return {
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.received,
+        "status": upload.status,
+        "sha256": upload.sha256,
+        "file": f"files/{upload.stored_name}" if upload.stored_name else None,
+        "deduplicated": upload.deduplicated,
+        "chunk_size": current_app.config["UPLOAD_CHUNK_BYTES"],
+    }
+
+
+def _get_upload(upload_id):
+    upload = Upload.query.get(upload_id)
+    if upload is None or upload.owner != canvas_owner():
+        return None
+    return upload
+
+
+def _claim_name(files_dir, filename):
+    """Create an empty file under a free name in files/ and return the name.
+
+    Creating it with O_EXCL claims the name atomically, so two uploads
+    finishing at once can't pick the same one.
+    """
+    base, ext = os.path.splitext(filename)
+    candidate, n = filename, 1
+    while True:
+        try:
+            fd = os.open(
+                os.path.join(files_dir, candidate),
+                os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                0o644,
+            )
+        except FileExistsError:
+            candidate = f"{base}_{n}{ext}"
+            n += 1
+            continue
+        os.close(fd)
+        return candidate
+
+
+def _existing_file(files_dir, sha256, size):
+    """Name of a file in files/ with this content, or None."""
+    existing = (
+        Upload.query.filter(
+            Upload.sha256 == sha256,
+            Upload.status == "complete",
+        )
+        .order_by(Upload.completed_at)
+        .first()
+    )
+    if existing and os.path.exists(os.path.join(files_dir, existing.stored_name)):
+        return existing.stored_name
+    if not os.path.isdir(files_dir):
+        return None
+    # Files put there some other way; only ones of the same size are hashed
+    for entry in os.scandir(files_dir):
+        if (
+            entry.is_file()
+            and entry.stat().st_size == size
+            and _hash_file(entry.path, size).hexdigest() == sha256
+        ):
+            return entry.name
+    return None
+
+
+def _finish(upload, hasher):
+    """Move a completed upload into files/, or reuse an identical file."""
+    files_dir = current_app.config["FILES_DIR"]
+    if hasher is None:
+        hasher = _hash_file(_part_path(upload.id), upload.size)
+    upload.sha256 = hasher.hexdigest()
+
+    existing = _existing_file(files_dir, upload.sha256, upload.size)
+    if existing:
+        os.remove(_part_path(upload.id))
+        upload.stored_name = existing
+        upload.deduplicated = True
+    else:
+        os.makedirs(files_dir, exist_ok=True)
+        upload.stored_name = _claim_name(files_dir, upload.filename)
+        # Replaces the empty file that holds the name
+        os.replace(_part_path(upload.id), os.path.join(files_dir, upload.stored_name))
+
+    upload.status = "complete"
+    upload.completed_at = datetime.utcnow()
+
+
+@uploads.route("", methods=["POST"])
+def start_upload():
+    """Open an upload session for a file of a known size."""
+    data = request.json or {}
+    filename = secure_filename(data.get("filename") or "")
+    size = data.get("size")
+    if not filename or not isinstance(size, int) or size <= 0:
+        return jsonify({"error": "A filename and a positive size are required"}), 400
+
+    purge_stale()
+    quota = current_app.config["UPLOAD_QUOTA_BYTES"]
+    used = _used_bytes(_quota_key())
+    if used + size > quota:
+        return (
+            jsonify(
+                {
+                    "error": "Upload quota exceeded",
+                    "quota_bytes": quota,
+                    "used_bytes": used,
+                }
+            ),
+            413,
+        )
+
+    upload = Upload(
+        id=str(uuid.uuid4()),
+        user_id=_owner_id(),
+        owner=canvas_owner(),
+        quota_key=_quota_key(),
+        filename=filename,
+        size=size,
+        received=0,
+    )
+    os.makedirs(current_app.config["UPLOAD_TMP_DIR"], exist_ok=True)
+    open(_part_path(upload.id), "wb").close()
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(_status(upload)), 201
+
+
+@uploads.route("/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """Report how far an upload got, so a client can resume it."""
+    upload = _get_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(_status(upload))
+
+
+@uploads.route("/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    """Append the request body at ``?offset=`` to an upload."""
+    upload = _get_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    if upload.status == "complete":
+        return jsonify(_status(upload))
+
+    offset = request.args.get("offset", type=int)
+    if offset != upload.received:
+        # Tell the client where to resume from
+        return jsonify({"error": "Offset mismatch", **_status(upload)}), 409
+
+    length = request.content_length
+    max_chunk = current_app.config["UPLOAD_CHUNK_BYTES"]
+    if length is None or length <= 0 or length > max_chunk:
+        return jsonify({"error": f"Chunks must be 1 to {max_chunk} bytes"}), 400
+    if offset + length > upload.size:
+        return jsonify({"error": "Chunk goes past the declared size"}), 400
+
+    # Claim the offset before touching the file; a request that loses
+    # here never writes
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    claimed = Upload.query.filter(
+        Upload.id == upload.id,
+        Upload.status == "pending",
+        Upload.received == offset,
+        or_(
+            Upload.claim.is_(None),
+            Upload.claimed_at < now - timedelta(seconds=CLAIM_SECONDS),
+        ),
+    ).update(
+        {"claim": token, "claimed_at": now, "updated_at": now},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    if not claimed:
+        db.session.refresh(upload)
+        return jsonify({"error": "Concurrent write to upload", **_status(upload)}), 409
+
+    written = 0
+    try:
+        hasher = hashers.take(upload.id, offset)
+        if hasher is None and offset == 0:
+            hasher = hashlib.sha256()
+        part_path = _part_path(upload.id)
+        with open(part_path, "r+b") as f:
+            f.seek(offset)
+            f.truncate()
+            while written < length:
+                block = request.stream.read(min(COPY_BUFFER, length - written))
+                if not block:
+                    break
+                f.write(block)
+                if hasher is not None:
+                    hasher.update(block)
+                written += len(block)
+    finally:
+        if written != length:
+            # Let the client (or another request) retry right away
+            hashers.discard(upload.id)
+            Upload.query.filter_by(id=upload.id, claim=token).update(
+                {"claim": None, "claimed_at": None}, synchronize_session=False
+            )
+            db.session.commit()
+    if written != length:
+        db.session.refresh(upload)
+        return jsonify({"error": "Incomplete chunk", **_status(upload)}), 400
+
+    # Fails only if the claim ran out and another request took over
+    updated = Upload.query.filter_by(id=upload.id, claim=token).update(
+        {"received": offset + written, "claim": None, "claimed_at": None},
+        synchronize_session=False,
+    )
+    if not updated:
+        db.session.rollback()
+        hashers.discard(upload.id)
+        return jsonify({"error": "Concurrent write to upload"}), 409
+    db.session.refresh(upload)
+
+    if upload.received == upload.size:
+        _finish(upload, hasher)
+        hashers.discard(upload.id)
+    elif hasher is not None:
+        hashers.put(upload.id, hasher, upload.received)
+    db.session.commit()
+    return jsonify(_status(upload))
+
+
+@uploads.route("/<upload_id>", methods=["DELETE"])
+def abort_upload(upload_id):
+    """Cancel a pending upload and free its quota."""
+    upload = _get_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    if upload.status == "complete":
+        return jsonify({"error": "Upload already completed"}), 400
+    hashers.discard(upload.id)
+    if os.path.exists(_part_path(upload.id)):
+        os.remove(_part_path(upload.id))
+    db.session.delete(upload)
+    db.session.commit()
+    return jsonify({"status": "success", "message": "Upload cancelled"})
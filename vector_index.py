@@ -0,0 +1,761 @@
+"""Persistent FAISS indexes under instance/ with size-adaptive index types.
+
+Small corpora get an exact ``Flat`` index, mid-sized ones ``HNSW`` and
+large ones a trained ``IVF`` index. Indexes are written to disk once and
+loaded memory-mapped, so a worker can search a large index without
+reading it into memory first.
+
+Each index also keeps a SQLite store with the payload of every vector,
+the source file it came from and that file's content hash. Updating one
+source only adds or deletes that source's vectors. Deletes are recorded
+as tombstones and filtered out at search time; ``compact`` drops them
+from the index file.
+
+Vectors can be stored compressed (``float16``, ``int8`` scalar
+quantization or ``pq`` product quantization) to cut the index size. With
+``exact_vectors`` the float32 vectors are also kept in a side file, so
+searches can over-fetch candidates from the compressed index and re-rank
+them exactly, and rebuilds start from the exact vectors. Without it only
+the compressed index is on disk. PQ alone loses a lot of recall (around
+0.2 recall@10 on 384-dim embeddings), so it is meant to be used with
+re-ranking.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writes are only serialized within one process
+    fcntl = None
+
+FLAT_MAX_VECTORS = 20_000
+HNSW_MAX_VECTORS = 500_000
+HNSW_NEIGHBORS = 32
+LATENCY_SAMPLES = 1000
+
+# How vectors are stored in the index
+STORAGE_TYPES = ("float32", "float16", "int8", "pq")
+
+# Product quantization needs this many training vectors per centroid
+PQ_TRAIN_PER_CENTROID = 39
+
+# Compact once this fraction of the vectors in an index are deleted
+COMPACT_RATIO = 0.2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS payload (
+    id INTEGER PRIMARY KEY, source TEXT, data TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_payload_source ON payload (source);
+CREATE TABLE IF NOT EXISTS source (
+    source TEXT PRIMARY KEY, content_hash TEXT, chunks INTEGER, updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS tombstone (id INTEGER PRIMARY KEY);
+"""
+
+
+def choose_index_type(count):
+    if count < FLAT_MAX_VECTORS:
+        return "flat"
+    if count < HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+
+def _ivf_lists(count):
+    return max(1, min(65536, int(4 * math.sqrt(count))))
+
+
+def resolve_index_type(index_type, count):
+    """The index type actually built for ``count`` vectors.
+
+    Without a requested type it follows the corpus size. An empty index,
+    or one with fewer vectors than IVF lists to train, is built as the
+    size calls for until a compaction rebuilds it.
+    """
+    if not index_type or not count:
+        return choose_index_type(count)
+    if index_type == "ivf" and count < _ivf_lists(count):
+        return choose_index_type(count)
+    return index_type
+
+
+def _requested_type(meta):
+    """Index type the caller asked for, None if it follows the size."""
+    if "requested_type" in meta:
+        return meta["requested_type"]
+    # Indexes from before the setting only kept IVF fixed
+    return "ivf" if meta["type"] == "ivf" else None
+
+
+def _pq_bits(count):
+    """Bits per PQ code the training set supports, or 0 if too small."""
+    for bits in (8, 4):
+        if count >= PQ_TRAIN_PER_CENTROID * (1 << bits):
+            return bits
+    return 0
+
+
+def resolve_storage(storage, count):
+    """The storage actually used for ``count`` vectors.
+
+    PQ codebooks can't be trained on a handful of vectors, so small
+    indexes fall back to int8 until a compaction rebuilds them. An empty
+    index has nothing to train on and is always float32.
+    """
+    storage = storage or "float32"
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown storage: {storage}")
+    if not count:
+        return "float32"
+    if storage == "pq" and not _pq_bits(count):
+        return "int8"
+    return storage
+
+
+def _codec(storage, dim, count):
+    if storage == "float16":
+        return "SQfp16"
+    if storage == "int8":
+        return "SQ8"
+    if storage == "pq":
+        # Largest sub-quantizer count that divides dim, ~8 dims each
+        m = max(d for d in range(1, max(1, dim // 8) + 1) if dim % d == 0)
+        return f"PQ{m}x{_pq_bits(count)}"
+    return "Flat"
+
+
+def _create(index_type, dim, count, metric, storage="float32"):
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+    codec = _codec(storage, dim, count)
+    if index_type == "flat":
+        if storage == "pq":
+            # IndexPQ can't filter ids; one IVF list scans the same codes
+            codec = f"IVF1,{codec}"
+        return faiss.IndexIDMap2(faiss.index_factory(dim, codec, faiss_metric))
+    if index_type == "hnsw":
+        graph = f"HNSW{HNSW_NEIGHBORS}" + ("" if codec == "Flat" else f",{codec}")
+        return faiss.IndexIDMap2(faiss.index_factory(dim, graph, faiss_metric))
+    if index_type == "ivf":
+        return faiss.index_factory(dim, f"IVF{_ivf_lists(count)},{codec}", faiss_metric)
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def _rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _search_params(meta, index, deleted):
+    """Search parameters that skip tombstoned ids, or None if there are none."""
+    if not deleted:
+        return None
+    selector = faiss.IDSelectorNot(
+        faiss.IDSelectorBatch(np.fromiter(deleted, dtype=np.int64))
+    )
+    if meta["type"] == "ivf":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if meta["type"] == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector)
+    if meta.get("storage") == "pq":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=1)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _outgrown(meta):
+    """Whether a rebuild would pick a different index type or storage."""
+    if meta["type"] != resolve_index_type(_requested_type(meta), meta["live"]):
+        return True
+    requested = meta.get("requested_storage", "float32")
+    return meta.get("storage", "float32") != resolve_storage(requested, meta["live"])
+
+
+def _rerank(raw, queries, candidates, k, metric):
+    """Exact top ``k`` of each query's candidate ids."""
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, found) in enumerate(zip(queries, candidates)):
+        found = found[(found >= 0) & (found < len(raw))]
+        if not len(found):
+            continue
+        vectors = raw[found]
+        if metric == "ip":
+            # Higher is better; negate to sort, like faiss reports it
+            scores = -(vectors @ query)
+        else:
+            scores = ((vectors - query) ** 2).sum(axis=1)
+        top = np.argsort(scores, kind="stable")[:k]
+        distances[row, : len(top)] = -scores[top] if metric == "ip" else scores[top]
+        ids[row, : len(top)] = found[top]
+    if metric == "ip":
+        distances[ids < 0] = -np.inf
+    return distances, ids
+
+
+class IndexManager:
+    """Build, persist, load, update and search named FAISS indexes."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._loaded = {}
+
+    def _dir(self, name):
+        if not name or not all(c.isalnum() or c in "-_" for c in name):
+            raise ValueError(f"Invalid index name: {name!r}")
+        return os.path.join(self.root, name)
+
+    def _index_path(self, name):
+        return os.path.join(self._dir(name), "index.faiss")
+
+    def _latency_path(self, name):
+        return os.path.join(self._dir(name), "latency.f32")
+
+    def _meta_path(self, name):
+        return os.path.join(self._dir(name), "meta.json")
+
+    def _raw_path(self, name):
+        return os.path.join(self._dir(name), "raw.f32")
+
+    def _write_raw(self, name, vectors, ids):
+        """Keep exact copies of compressed vectors, one row per id."""
+        path = self._raw_path(name)
+        dim = vectors.shape[1]
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            # Ids are handed out in order, so runs of them are contiguous
+            breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+            for run in np.split(np.arange(len(ids)), breaks):
+                if len(run):
+                    f.seek(int(ids[run[0]]) * dim * 4)
+                    f.write(vectors[run].tobytes())
+
+    def _read_raw(self, name, dim):
+        path = self._raw_path(name)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return None
+        return np.memmap(path, dtype=np.float32, mode="r").reshape(-1, dim)
+
+    @contextmanager
+    def _store(self, name):
+        """Open the index's SQLite store; commits on success."""
+        os.makedirs(self._dir(name), exist_ok=True)
+        db = sqlite3.connect(os.path.join(self._dir(name), "store.sqlite"), timeout=30)
+        try:
+            db.executescript(_SCHEMA)
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _write_lock(self, name):
+        """Serialize index writes across threads and worker processes."""
+        os.makedirs(self._dir(name), exist_ok=True)
+        with self._lock, open(os.path.join(self._dir(name), ".lock"), "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def put_payloads(self, name, ids, payloads, source=None):
+        """Store a JSON payload (e.g. the chunk text) for each vector id."""
+        with self._store(name) as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO payload (id, source, data) VALUES (?, ?, ?)",
+                [(int(i), source, json.dumps(p)) for i, p in zip(ids, payloads)],
+            )
+
+    def get_payloads(self, name, ids):
+        """Payloads for ``ids`` in the same order; None where missing."""
+        wanted = [int(i) for i in ids if i >= 0]
+        found = {}
+        with self._store(name) as db:
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start : start + 500]
+                rows = db.execute(
+                    "SELECT id, data FROM payload WHERE id IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                found.update((row_id, json.loads(data)) for row_id, data in rows)
+        return [found.get(int(i)) for i in ids]
+
+    def exists(self, name):
+        return os.path.exists(self._meta_path(name))
+
+    def meta(self, name):
+        with open(self._meta_path(name), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, name, meta):
+        tmp = self._meta_path(name) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path(name))
+
+    def _persist(self, name, index, meta):
+        """Write the index file and publish it under a new version."""
+        tmp = self._index_path(name) + ".tmp"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, self._index_path(name))
+        with self._store(name) as db:
+            deleted = db.execute("SELECT COUNT(*) FROM tombstone").fetchone()[0]
+        raw_path = self._raw_path(name)
+        raw_bytes = os.path.getsize(raw_path) if os.path.exists(raw_path) else 0
+        meta.update(
+            count=int(index.ntotal),
+            deleted=deleted,
+            live=int(index.ntotal) - deleted,
+            version=uuid.uuid4().hex,
+            file_bytes=os.path.getsize(self._index_path(name)),
+            raw_bytes=raw_bytes,
+            disk_bytes=(
+                os.path.getsize(self._index_path(name))
+                + raw_bytes
+                + os.path.getsize(os.path.join(self._dir(name), "store.sqlite"))
+            ),
+            bytes_per_vector=(
+                os.path.getsize(self._index_path(name)) / index.ntotal
+                if index.ntotal
+                else None
+            ),
+            updated_at=time.time(),
+        )
+        self._write_meta(name, meta)
+        return meta
+
+    def _build(
+        self,
+        name,
+        vectors,
+        ids,
+        metric,
+        index_type,
+        next_id,
+        storage=None,
+        exact_vectors=False,
+    ):
+        count, dim = vectors.shape
+        requested_type = index_type
+        index_type = resolve_index_type(requested_type, count)
+        requested = storage or "float32"
+        storage = resolve_storage(requested, count)
+        started = time.perf_counter()
+        index = _create(index_type, dim, count, metric, storage)
+        if not index.is_trained:
+            # Train on a sample; more doesn't improve the centroids much
+            sample = min(
+                count, max(_ivf_lists(count) * 64, PQ_TRAIN_PER_CENTROID * 256)
+            )
+            picks = np.random.default_rng(0).choice(count, sample, replace=False)
+            index.train(vectors[np.sort(picks)])
+        if count:
+            index.add_with_ids(vectors, ids)
+        build_seconds = time.perf_counter() - started
+
+        with self._store(name) as db:
+            db.execute("DELETE FROM tombstone")
+        if os.path.exists(self._latency_path(name)):
+            os.remove(self._latency_path(name))
+        if storage != "float32" and count and exact_vectors:
+            self._write_raw(name, vectors, ids)
+        elif os.path.exists(self._raw_path(name)):
+            os.remove(self._raw_path(name))
+        meta = {
+            "name": name,
+            "type": index_type,
+            "requested_type": requested_type,
+            "metric": metric,
+            "storage": storage,
+            "requested_storage": requested,
+            "exact_vectors": bool(exact_vectors),
+            "dim": dim,
+            "next_id": max(next_id, int(ids.max()) + 1 if count else 0),
+            "build_seconds": build_seconds,
+            "built_at": time.time(),
+        }
+        return self._persist(name, index, meta)
+
+    def build(
+        self,
+        name,
+        vectors,
+        ids=None,
+        metric="l2",
+        index_type=None,
+        storage=None,
+        exact_vectors=False,
+    ):
+        """Build an index from scratch and persist it, replacing any old one.
+
+        ``exact_vectors`` keeps float32 copies of compressed vectors for
+        re-ranking. An explicit ``index_type`` is kept through compactions;
+        without one the type follows the number of vectors.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if ids is None:
+            ids = np.arange(len(vectors), dtype=np.int64)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        with self._write_lock(name):
+            return self._build(
+                name, vectors, ids, metric, index_type, 0, storage, exact_vectors
+            )
+
+    def _add(
+        self, name, vectors, metric, index_type, storage=None, exact_vectors=False
+    ):
+        """Append vectors under fresh ids; the write lock must be held."""
+        if not self.exists(name):
+            # The first batch decides the dimension and training sample
+            ids = np.arange(len(vectors), dtype=np.int64)
+            self._build(
+                name, vectors, ids, metric, index_type, 0, storage, exact_vectors
+            )
+            return ids
+        meta = self.meta(name)
+        ids = np.arange(meta["next_id"], meta["next_id"] + len(vectors), dtype=np.int64)
+        index = faiss.read_index(self._index_path(name))
+        index.add_with_ids(vectors, ids)
+        # Indexes from before the setting always kept them
+        if meta.get("storage", "float32") != "float32" and meta.get(
+            "exact_vectors", True
+        ):
+            self._write_raw(name, vectors, ids)
+        meta["next_id"] = int(ids[-1]) + 1 if len(ids) else meta["next_id"]
+        self._persist(name, index, meta)
+        return ids
+
+    def upsert_source(
+        self,
+        name,
+        source,
+        content_hash,
+        embed,
+        payloads,
+        metric="l2",
+        index_type=None,
+        storage=None,
+        exact_vectors=False,
+    ):
+        """Index the chunks of one source file unless its content is unchanged.
+
+        ``embed`` is only called (with no arguments) when the source is new
+        or changed, and must return one vector per payload. ``storage`` and
+        ``exact_vectors`` only apply when this creates the index. Returns ``"unchanged"``,
+        ``"added"`` or ``"updated"``.
+        """
+        if self._source_hash(name, source) == content_hash:
+            return "unchanged"
+
+        # Embed outside the lock; it is the slow part
+        vectors = np.ascontiguousarray(embed(), dtype=np.float32)
+        with self._write_lock(name):
+            previous = self._source_hash(name, source)
+            if previous is not None:
+                self._remove_source(name, source)
+            if len(vectors):
+                ids = self._add(
+                    name, vectors, metric, index_type, storage, exact_vectors
+                )
+                self.put_payloads(name, ids, payloads, source=source)
+            with self._store(name) as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO source "
+                    "(source, content_hash, chunks, updated_at) VALUES (?, ?, ?, ?)",
+                    (source, content_hash, len(vectors), time.time()),
+                )
+        return "added" if previous is None else "updated"
+
+    def _source_hash(self, name, source):
+        with self._store(name) as db:
+            row = db.execute(
+                "SELECT content_hash FROM source WHERE source = ?", (source,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _remove_source(self, name, source):
+        with self._store(name) as db:
+            ids = [
+                row[0]
+                for row in db.execute(
+                    "SELECT id FROM payload WHERE source = ?", (source,)
+                )
+            ]
+            db.executemany(
+                "INSERT OR IGNORE INTO tombstone (id) VALUES (?)", [(i,) for i in ids]
+            )
+            db.execute("DELETE FROM payload WHERE source = ?", (source,))
+            db.execute("DELETE FROM source WHERE source = ?", (source,))
+        if ids and self.exists(name):
+            # Republish the meta so loaded copies pick up the tombstones
+            meta = self.meta(name)
+            meta["deleted"] = meta.get("deleted", 0) + len(ids)
+            meta["live"] = meta["count"] - meta["deleted"]
+            meta["version"] = uuid.uuid4().hex
+            self._write_meta(name, meta)
+        return len(ids)
+
+    def remove_source(self, name, source):
+        """Delete every vector that came from ``source``; returns how many."""
+        with self._write_lock(name):
+            return self._remove_source(name, source)
+
+    def sources(self, name):
+        """``{source: content_hash}`` of everything in the index."""
+        with self._store(name) as db:
+            return dict(db.execute("SELECT source, content_hash FROM source"))
+
+    def compact(self, name):
+        """Drop tombstoned vectors from the index file.
+
+        Flat and HNSW indexes are rebuilt from their live vectors, which
+        also moves them to a better index type if the corpus has grown or
+        shrunk past a threshold, and to PQ once there are enough vectors to
+        train it. Only indexes built without an explicit ``index_type`` are
+        moved to another type. IVF indexes delete in place and are only
+        rebuilt when their type or storage has to change.
+        """
+        with self._write_lock(name):
+            if not self.exists(name):
+                return None
+            meta = self.meta(name)
+            with self._store(name) as db:
+                deleted = np.array(
+                    [row[0] for row in db.execute("SELECT id FROM tombstone")],
+                    dtype=np.int64,
+                )
+            retype = _outgrown(meta)
+            if not len(deleted) and not retype:
+                return meta
+
+            index = faiss.read_index(self._index_path(name))
+            if meta["type"] == "ivf" and not retype:
+                index.remove_ids(faiss.IDSelectorBatch(deleted))
+                with self._store(name) as db:
+                    db.execute("DELETE FROM tombstone")
+                return self._persist(name, index, meta)
+
+            ids, vectors = self._live_vectors(name, meta, index, deleted)
+            return self._build(
+                name,
+                np.ascontiguousarray(vectors),
+                np.ascontiguousarray(ids),
+                meta["metric"],
+                _requested_type(meta),
+                meta["next_id"],
+                meta.get("requested_storage"),
+                meta.get("exact_vectors", True),
+            )
+
+    def _live_vectors(self, name, meta, index, deleted):
+        """``(ids, vectors)`` of everything in ``index`` not in ``deleted``."""
+        if meta["type"] == "ivf":
+            ivf = faiss.extract_index_ivf(index)
+            stored = np.concatenate(
+                [np.empty(0, dtype=np.int64)]
+                + [
+                    faiss.rev_swig_ptr(
+                        ivf.invlists.get_ids(i), ivf.invlists.list_size(i)
+                    ).copy()
+                    for i in range(ivf.nlist)
+                    if ivf.invlists.list_size(i)
+                ]
+            )
+        else:
+            stored = faiss.vector_to_array(index.id_map)
+        ids = stored[~np.isin(stored, deleted)]
+        raw = self._read_raw(name, meta["dim"])
+        if raw is not None:
+            # Rebuild from the exact vectors, not lossy reconstructions
+            vectors = np.array(raw[ids])
+        elif meta["type"] == "ivf":
+            ivf.make_direct_map()
+            vectors = index.reconstruct_batch(ids)
+        else:
+            vectors = index.index.reconstruct_n(0, index.ntotal)
+            vectors = vectors[np.isin(stored, ids)]
+        del raw
+        return ids, vectors.reshape(len(ids), meta["dim"])
+
+    def compact_all(self, min_ratio=COMPACT_RATIO):
+        """Compact indexes with enough deletes or that outgrew their type."""
+        compacted = []
+        for name in self._names():
+            meta = self.meta(name)
+            due = meta.get("deleted") and meta["deleted"] >= min_ratio * meta["count"]
+            if due or _outgrown(meta):
+                self.compact(name)
+                compacted.append(name)
+        return compacted
+
+    def load(self, name):
+        """Return ``(index, params)`` for the current version of an index.
+
+        The index is memory-mapped; ``params`` filters out deleted ids.
+        """
+        meta = self.meta(name)
+        with self._lock:
+            loaded = self._loaded.get(name)
+            if loaded and loaded["version"] == meta["version"]:
+                return loaded["index"], loaded["params"]
+
+            rss_before = _rss_kb()
+            started = time.perf_counter()
+            try:
+                index = faiss.read_index(
+                    self._index_path(name),
+                    faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+                )
+            except RuntimeError:
+                # Index types without mmap support are read normally
+                index = faiss.read_index(self._index_path(name))
+            if meta["type"] == "ivf":
+                index.nprobe = max(1, _ivf_lists(meta["count"]) // 16)
+            with self._store(name) as db:
+                deleted = [row[0] for row in db.execute("SELECT id FROM tombstone")]
+            rss_after = _rss_kb()
+            self._loaded[name] = {
+                "index": index,
+                "params": _search_params(meta, index, deleted),
+                "metric": meta["metric"],
+                "raw": (
+                    self._read_raw(name, meta["dim"])
+                    if meta.get("storage", "float32") != "float32"
+                    else None
+                ),
+                "version": meta["version"],
+                "load_seconds": time.perf_counter() - started,
+                "load_rss_delta_kb": (
+                    rss_after - rss_before
+                    if rss_before is not None and rss_after is not None
+                    else None
+                ),
+            }
+            return index, self._loaded[name]["params"]
+
+    def search(self, name, queries, k=4, rerank=0):
+        """Return ``(distances, ids)`` for each query vector; -1 ids are empty.
+
+        With compressed storage and ``rerank`` > 1, ``k * rerank``
+        candidates are fetched and re-ranked by their exact vectors.
+        """
+        index, params = self.load(name)
+        with self._lock:
+            raw = self._loaded[name]["raw"]
+            metric = self._loaded[name]["metric"]
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        started = time.perf_counter()
+        if rerank > 1 and raw is not None:
+            _, candidates = index.search(queries, k * rerank, params=params)
+            distances, ids = _rerank(raw, queries, candidates, k, metric)
+        else:
+            distances, ids = index.search(queries, k, params=params)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record_latency(name, elapsed_ms / len(queries))
+        return distances, ids
+
+    def _record_latency(self, name, ms):
+        path = self._latency_path(name)
+        # Appended to a file so searches in sandbox workers show up too
+        with open(path, "ab") as f:
+            f.write(np.float32(ms).tobytes())
+            size = f.tell()
+        if size > 2 * LATENCY_SAMPLES * 4:
+            # Stats only read the newest samples; drop the rest
+            samples = self._latency_samples(name)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(samples.tobytes())
+            os.replace(tmp, path)
+
+    def _latency_samples(self, name):
+        path = self._latency_path(name)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.float32)
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) // 4 - LATENCY_SAMPLES) * 4)
+            return np.frombuffer(f.read(), dtype=np.float32)
+
+    def stats(self, name):
+        """Build time, footprint and query latency of one index."""
+        meta = self.meta(name)
+        with self._lock:
+            loaded = self._loaded.get(name)
+        samples = self._latency_samples(name)
+        stats = {**meta, "loaded": bool(loaded)}
+        if loaded:
+            stats["load_seconds"] = loaded["load_seconds"]
+            stats["load_rss_delta_kb"] = loaded["load_rss_delta_kb"]
+        stats["queries"] = len(samples)
+        if len(samples):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]).tolist()
+            stats["query_ms"] = {"p50": p50, "p95": p95, "p99": p99}
+        return stats
+
+    def _names(self):
+        return sorted(
+            name
+            for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, "meta.json"))
+        )
+
+    def list(self):
+        return [self.stats(name) for name in self._names()]
+
+
+def owner_root(root, owner=None):
+    """Directory of one owner's indexes under ``root``; ``root`` if no owner."""
+    if owner is None:
+        return root
+    if not owner or not all(c.isalnum() for c in owner):
+        raise ValueError(f"Invalid index owner: {owner!r}")
+    return os.path.join(root, "owners", owner)
+
+
+def _owner_roots(root):
+    owners = os.path.join(root, "owners")
+    if not os.path.isdir(owners):
+        return [root]
+    return [root] + [
+        os.path.join(owners, owner) for owner in sorted(os.listdir(owners))
+    ]
+
+
+def start_compactor(root, interval):
+    """Compact every owner's indexes under ``root`` every ``interval`` seconds."""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            for path in _owner_roots(root):
+                try:
+                    compacted = IndexManager(path).compact_all()
+                    if compacted:
+                        print(f"Compacted indexes in {path}: {', '.join(compacted)}")
+                except Exception as e:
+                    print(f"Index compaction failed in {path}: {e}")
+
+    thread = threading.Thread(target=loop, name="index-compactor", daemon=True)
+    thread.start()
+    return thread